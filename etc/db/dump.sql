@@ -14228,6 +14228,13 @@ ALTER TABLE ONLY public.django_session
 CREATE INDEX film_work_creation_date_idx ON content.film_work USING btree (creation_date, rating);
 
 
+--
+-- Name: film_work_modified_id_idx; Type: INDEX; Schema: content; Owner: app
+--
+
+CREATE INDEX film_work_modified_id_idx ON content.film_work USING btree (modified, id);
+
+
 --
 -- Name: film_work_person_idx; Type: INDEX; Schema: content; Owner: app
 --
@@ -14235,6 +14242,13 @@ CREATE INDEX film_work_creation_date_idx ON content.film_work USING btree (creat
 CREATE UNIQUE INDEX film_work_person_idx ON content.person_film_work USING btree (film_work_id, person_id, role);
 
 
+--
+-- Name: genre_film_work_genre_idx; Type: INDEX; Schema: content; Owner: app
+--
+
+CREATE INDEX genre_film_work_genre_idx ON content.genre_film_work USING btree (genre_id, film_work_id);
+
+
 --
 -- Name: genre_film_work_idx; Type: INDEX; Schema: content; Owner: app
 --
@@ -14242,6 +14256,13 @@ CREATE UNIQUE INDEX film_work_person_idx ON content.person_film_work USING btree
 CREATE UNIQUE INDEX genre_film_work_idx ON content.genre_film_work USING btree (film_work_id, genre_id);
 
 
+--
+-- Name: genre_modified_id_idx; Type: INDEX; Schema: content; Owner: app
+--
+
+CREATE INDEX genre_modified_id_idx ON content.genre USING btree (modified, id);
+
+
 --
 -- Name: genre_name_idx; Type: INDEX; Schema: content; Owner: app
 --
@@ -14256,6 +14277,13 @@ CREATE UNIQUE INDEX genre_name_idx ON content.genre USING btree (name);
 CREATE INDEX person_film_work_idx ON content.person_film_work USING btree (person_id, film_work_id);
 
 
+--
+-- Name: person_modified_id_idx; Type: INDEX; Schema: content; Owner: app
+--
+
+CREATE INDEX person_modified_id_idx ON content.person USING btree (modified, id);
+
+
 --
 -- Name: auth_group_name_a6ea08ec_like; Type: INDEX; Schema: public; Owner: app
 --
@@ -0,0 +1,64 @@
+--
+-- Change notifications for the ETL (RUN_MODE=changefeed, CHANGE_SOURCE=notify).
+--
+-- Every change of film_work, person and genre sends the table name and
+-- the changed id to the content_changes channel. Changes of the link
+-- tables are sent as changes of the linked film_work, both for the old
+-- and the new row of an update.
+--
+
+CREATE OR REPLACE FUNCTION content.notify_change() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    changed jsonb;
+BEGIN
+    FOREACH changed IN ARRAY ARRAY[to_jsonb(OLD), to_jsonb(NEW)] LOOP
+        CONTINUE WHEN changed IS NULL;
+        IF TG_TABLE_NAME IN ('person_film_work', 'genre_film_work') THEN
+            PERFORM pg_notify(
+                'content_changes',
+                json_build_object(
+                    'table', 'film_work',
+                    'id', changed->>'film_work_id'
+                )::text
+            );
+        ELSE
+            PERFORM pg_notify(
+                'content_changes',
+                json_build_object(
+                    'table', TG_TABLE_NAME,
+                    'id', changed->>'id'
+                )::text
+            );
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$;
+
+
+DROP TRIGGER IF EXISTS film_work_notify_change ON content.film_work;
+CREATE TRIGGER film_work_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON content.film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_change();
+
+DROP TRIGGER IF EXISTS person_notify_change ON content.person;
+CREATE TRIGGER person_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON content.person
+    FOR EACH ROW EXECUTE FUNCTION content.notify_change();
+
+DROP TRIGGER IF EXISTS genre_notify_change ON content.genre;
+CREATE TRIGGER genre_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON content.genre
+    FOR EACH ROW EXECUTE FUNCTION content.notify_change();
+
+DROP TRIGGER IF EXISTS person_film_work_notify_change ON content.person_film_work;
+CREATE TRIGGER person_film_work_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_change();
+
+DROP TRIGGER IF EXISTS genre_film_work_notify_change ON content.genre_film_work;
+CREATE TRIGGER genre_film_work_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.notify_change();
@@ -0,0 +1,10 @@
+--
+-- Logical replication for the ETL (RUN_MODE=changefeed, CHANGE_SOURCE=wal2json).
+--
+-- Requires wal_level=logical and the wal2json output plugin on the server.
+-- Link tables log the whole old row, so a deleted link still carries
+-- film_work_id.
+--
+
+ALTER TABLE content.person_film_work REPLICA IDENTITY FULL;
+ALTER TABLE content.genre_film_work REPLICA IDENTITY FULL;
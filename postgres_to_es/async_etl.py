@@ -0,0 +1,124 @@
+import asyncio
+
+import asyncpg
+from elasticsearch import AsyncElasticsearch
+
+from digest.base import DigestFilter
+from extract.async_extractor import AsyncPostgreSQLExtractor
+from logger import logger
+from metrics.instruments import timed
+from state.base import State
+from transform.transformer import DataTransfromer
+from upload.async_uploader import AsyncESUploader
+
+
+class AsyncETL:
+    """
+    Асинхронный ETL на пуле соединений asyncpg и AsyncElasticsearch.
+
+    Каждая таблица обрабатывается своей задачей, поэтому медленная
+    загрузка изменений одной таблицы не задерживает другие. Фильмы,
+    затронутые батчем изменений таблицы, делятся на части по
+    filmworks_batch_size, и части извлекаются, трансформируются
+    и загружаются одновременно - не более concurrency частей на все
+    таблицы сразу.
+
+    Стейт таблицы обновляется, как и в синхронном ETL, только после
+    загрузки в ES всех фильмов батча.
+    """
+
+    def __init__(
+        self,
+        pg_pool: asyncpg.Pool,
+        es_connection: AsyncElasticsearch,
+        table_names: list[str],
+        batch_size: int,
+        index: str,
+        state: State,
+        engine: str = "join",
+        refresh: str = "false",
+        digest_filter: DigestFilter | None = None,
+        concurrency: int = 8,
+        filmworks_batch_size: int = 100,
+        backlog_limit: int = 0,
+    ) -> None:
+        self.pg_extractor = AsyncPostgreSQLExtractor(
+            pg_pool, batch_size, table_names, state, engine, backlog_limit,
+        )
+        self.data_transformer = DataTransfromer(
+            encode=digest_filter is None,
+        )
+        self.es_uploader = AsyncESUploader(
+            es_connection, refresh, digest_filter,
+        )
+        self.table_names = table_names
+        self.index = index
+        self.engine = engine
+        self.filmworks_batch_size = filmworks_batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+        logger.info("Async ETL initialize completed.")
+
+    async def __call__(self, sleep_time: int):
+        await asyncio.gather(
+            *(
+                self._run_table(table_name, sleep_time)
+                for table_name in self.table_names
+            ),
+        )
+
+    async def _run_table(self, table_name: str, sleep_time: int) -> None:
+        """
+        Загружает изменения таблицы, пока они есть, и засыпает, когда
+        изменений нет.
+
+        :param table_name: название таблицы
+        :param sleep_time: время ожидания новых изменений
+        """
+        while True:
+            try:
+                filmworks_ids, checkpoint = (
+                    await self.pg_extractor.extract_filmworks_ids(table_name)
+                )
+            except EOFError:
+                await asyncio.sleep(sleep_time)
+                continue
+
+            await self._load_filmworks(filmworks_ids)
+            self.pg_extractor.advance(table_name, checkpoint)
+            await self.pg_extractor.update_state(table_name, checkpoint)
+            logger.info("State for table %s updated", table_name)
+
+    async def _load_filmworks(self, filmworks_ids: list[str]) -> None:
+        """
+        Одновременно загружает в ES фильмы по частям.
+
+        :param filmworks_ids: id фильмов
+        """
+        await asyncio.gather(
+            *(
+                self._load_part(
+                    filmworks_ids[start:start + self.filmworks_batch_size],
+                )
+                for start in range(
+                    0, len(filmworks_ids), self.filmworks_batch_size,
+                )
+            ),
+        )
+
+    async def _load_part(self, filmworks_ids: list[str]) -> None:
+        """
+        Извлекает, трансформирует и загружает в ES часть фильмов.
+
+        :param filmworks_ids: id фильмов
+        """
+        async with self.semaphore:
+            data = await self.pg_extractor.extract_filmworks(filmworks_ids)
+            with timed("transform"):
+                if self.engine == "aggregate":
+                    transformed_data = list(
+                        self.data_transformer.transform_documents(data),
+                    )
+                else:
+                    transformed_data = self.data_transformer.transform(data)
+            await self.es_uploader.insert_data(transformed_data, self.index)
@@ -0,0 +1,170 @@
+"""
+Сравнение пропускной способности синхронного и асинхронного ETL.
+
+Оба движка загружают одни и те же синтетические фильмы (см.
+bench.transformer) в локальную замену Elasticsearch (bench.fake_es)
+с задержкой ответа --es-latency. Извлечение из PostgreSQL заменено
+выборкой строк из памяти с задержкой --pg-latency, так что
+сравниваются стадии и их параллелизм, а не база данных:
+- "sync" - части фильмов извлекаются, трансформируются и загружаются
+  по очереди, как в ETL;
+- "async" - AsyncETL загружает части одновременно, не более
+  --concurrency частей сразу.
+
+Запуск из каталога postgres_to_es:
+    python -m bench.async_engine --films 5000 --es-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+from async_etl import AsyncETL
+from bench.fake_es import fake_elasticsearch
+from bench.transformer import generate_batches
+from models import FilmWork
+from state.base import State
+from state.storage import JsonFileStorage
+from transform.transformer import DataTransfromer
+from upload.uploader import ESUploader
+
+INDEX = "movies"
+
+
+class FakePool:
+    """Пул соединений, возвращающий строки фильмов из памяти."""
+
+    def __init__(self, rows: dict[str, list[dict]], latency: float):
+        self.rows = rows
+        self.latency = latency
+
+    async def fetch(self, query: str, filmworks_ids: list[str]) -> list:
+        await asyncio.sleep(self.latency)
+        return [row for fw_id in filmworks_ids for row in self.rows[fw_id]]
+
+
+def run_sync(
+    url: str,
+    rows: dict[str, list[dict]],
+    parts: list[list[str]],
+    latency: float,
+) -> None:
+    """
+    Загружает части фильмов по очереди синхронными компонентами ETL.
+
+    :param url: адрес Elasticsearch
+    :param rows: строки фильмов по id
+    :param parts: части id фильмов
+    :param latency: задержка извлечения части
+    """
+    transformer = DataTransfromer(encode=True)
+    with Elasticsearch(url) as es_connection:
+        uploader = ESUploader(es_connection)
+        for part in parts:
+            time.sleep(latency)
+            data = [
+                FilmWork(**row) for fw_id in part for row in rows[fw_id]
+            ]
+            uploader.insert_data(transformer.transform(data), INDEX)
+
+
+async def run_async(
+    url: str,
+    rows: dict[str, list[dict]],
+    parts: list[list[str]],
+    latency: float,
+    concurrency: int,
+) -> None:
+    """
+    Загружает части фильмов одновременно через AsyncETL.
+
+    :param url: адрес Elasticsearch
+    :param rows: строки фильмов по id
+    :param parts: части id фильмов
+    :param latency: задержка извлечения части
+    :param concurrency: количество одновременно загружаемых частей
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        state = State(JsonFileStorage(Path(directory) / "state.json"))
+        async with AsyncElasticsearch(url) as es_connection:
+            etl = AsyncETL(
+                FakePool(rows, latency),
+                es_connection,
+                ["film_work"],
+                len(rows),
+                INDEX,
+                state,
+                concurrency=concurrency,
+                filmworks_batch_size=len(parts[0]),
+            )
+            await etl._load_filmworks(
+                [fw_id for part in parts for fw_id in part],
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--films", type=int, default=5000)
+    parser.add_argument("--persons", type=int, default=10)
+    parser.add_argument("--genres", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--es-latency", type=float, default=0.05)
+    parser.add_argument("--pg-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rows: dict[str, list[dict]] = {}
+    for batch in generate_batches(
+        args.films, args.persons, args.genres, args.films,
+    ):
+        for row in batch:
+            rows.setdefault(row.fw_id, []).append(asdict(row))
+    filmworks_ids = list(rows)
+    parts = [
+        filmworks_ids[start:start + args.batch_size]
+        for start in range(0, len(filmworks_ids), args.batch_size)
+    ]
+
+    results = {}
+    with fake_elasticsearch(args.es_latency) as server:
+        for name, run in (
+            ("sync", lambda: run_sync(
+                server.url, rows, parts, args.pg_latency,
+            )),
+            ("async", lambda: asyncio.run(run_async(
+                server.url, rows, parts, args.pg_latency, args.concurrency,
+            ))),
+        ):
+            server.reset()
+            started = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - started
+            results[name] = {
+                **server.stats,
+                "seconds": seconds,
+                "films_per_second": args.films / seconds,
+            }
+
+    json.dump(
+        {
+            "films": args.films,
+            "batch_size": args.batch_size,
+            "concurrency": args.concurrency,
+            "es_latency": args.es_latency,
+            "pg_latency": args.pg_latency,
+            "engines": results,
+        },
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
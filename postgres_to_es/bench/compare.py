@@ -0,0 +1,59 @@
+"""
+Сравнение двух отчётов бенчмарков в JSON.
+
+Для каждого числового значения, которое есть в обоих отчётах, выводит
+значение до, после и относительное изменение в процентах. Вложенные
+значения обозначаются путём через точку, например
+stages.transform.seconds.
+
+Запуск из каталога postgres_to_es:
+    python -m bench.compare before.json after.json
+"""
+import argparse
+import json
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+
+def flatten(value: Any, prefix: str = "") -> Iterator[tuple[str, float]]:
+    """
+    Обходит числовые значения вложенного отчёта.
+
+    :param value: отчёт или его часть
+    :param prefix: путь к части отчёта
+    :yield: путь и числовое значение
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, int | float) and not isinstance(value, bool):
+        yield prefix.rstrip("."), value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+
+    before = dict(flatten(json.loads(args.before.read_text())))
+    after = dict(flatten(json.loads(args.after.read_text())))
+    changes = {}
+    for path, old in before.items():
+        if path not in after:
+            continue
+        new = after[path]
+        changes[path] = {
+            "before": old,
+            "after": new,
+            "change_percent": (new - old) / old * 100 if old else None,
+        }
+
+    json.dump(changes, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
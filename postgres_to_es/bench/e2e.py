@@ -0,0 +1,218 @@
+"""
+Сквозной бенчмарк ETL на данных из PostgreSQL.
+
+ETL загружает все таблицы с начала (стейт во временном файле) из базы,
+заполненной bench.generate, в локальную замену Elasticsearch
+(bench.fake_es) с задержкой ответа --es-latency, пока в таблицах
+не закончатся изменения. Время стадий (извлечение id, обогащение,
+слияние, трансформация, загрузка) берётся из метрик ETL
+(metrics.instruments), поэтому отчёт показывает, на какую стадию
+приходится время и как меняется её пропускная способность.
+
+Отчёт в JSON содержит параметры прогона, общую пропускную способность,
+время и долю каждой стадии, статистику bulk-запросов, пиковое
+потребление памяти процессом и коммит кода. С --output отчёт также
+записывается в файл; два отчёта сравнивает bench.compare.
+
+Запуск из каталога postgres_to_es (данные из bench.generate):
+    python -m bench.e2e --batch-size 1000 --output before.json
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+from elasticsearch import Elasticsearch
+
+from bench.fake_es import fake_elasticsearch
+from etl import ETL
+from metrics.instruments import DOCUMENTS, ROWS, STAGE_DURATION
+from settings import settings
+from state.base import State
+from state.storage import JsonFileStorage
+from utils.managers import open_postgres_db
+
+INDEX = "movies"
+
+
+def snapshot() -> dict[str, dict]:
+    """
+    Снимает текущие значения метрик стадий, строк и документов.
+
+    :return: суммарное время и количество вызовов стадий, строки таблиц
+    и количество документов
+    """
+    with STAGE_DURATION.lock:
+        stages = {
+            key[0]: (STAGE_DURATION.sums[key], sum(counts))
+            for key, counts in STAGE_DURATION.counts.items()
+        }
+    with ROWS.lock:
+        rows = {key[0]: value for key, value in ROWS.values.items()}
+    with DOCUMENTS.lock:
+        documents = sum(DOCUMENTS.values.values())
+    return {"stages": stages, "rows": rows, "documents": documents}
+
+
+def stage_report(
+    before: dict[str, dict], after: dict[str, dict], seconds: float,
+) -> dict[str, dict]:
+    """
+    Считает время, количество вызовов и долю стадий за прогон.
+
+    :param before: значения метрик до прогона
+    :param after: значения метрик после прогона
+    :param seconds: общее время прогона
+    :return: отчёт по стадиям
+    """
+    report = {}
+    for stage, (total, calls) in sorted(after["stages"].items()):
+        total_before, calls_before = before["stages"].get(stage, (0, 0))
+        stage_seconds = total - total_before
+        report[stage] = {
+            "seconds": stage_seconds,
+            "calls": calls - calls_before,
+            "share": stage_seconds / seconds if seconds else 0,
+        }
+    return report
+
+
+def peak_rss_mb() -> float:
+    """
+    Возвращает пиковое потребление памяти процессом.
+
+    :return: пиковый размер резидентной памяти в мегабайтах
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в Linux измеряется в килобайтах, в macOS - в байтах.
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak / 1024
+
+
+def git_commit() -> str:
+    """
+    Возвращает коммит, на котором выполняется бенчмарк.
+
+    :return: хеш коммита или пустая строка вне git-репозитория
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(args: argparse.Namespace, url: str, directory: str) -> float:
+    """
+    Загружает все изменения таблиц одним ETL с пустым стейтом.
+
+    :param args: параметры прогона
+    :param url: адрес Elasticsearch
+    :param directory: каталог для файла стейта
+    :return: время прогона в секундах
+    """
+    state = State(JsonFileStorage(Path(directory) / "state.json"))
+    with (
+        open_postgres_db(settings.postgres_dsn) as pg_connection,
+        Elasticsearch(url) as es_connection,
+    ):
+        etl = ETL(
+            pg_connection,
+            es_connection,
+            settings.table_names,
+            args.batch_size,
+            INDEX,
+            stream=args.stream,
+            bulk_chunk_size=args.bulk_chunk_size,
+            engine=args.engine,
+            state=state,
+            upload_mode=args.upload_mode,
+            merge_batch_size=args.merge_batch_size,
+        )
+        started = time.perf_counter()
+        for table_name in settings.table_names:
+            while True:
+                try:
+                    etl._load(table_name)
+                except EOFError:
+                    break
+                etl.pg_extractor.update_state(table_name)
+        return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--merge-batch-size", type=int, default=500)
+    parser.add_argument("--bulk-chunk-size", type=int, default=500)
+    parser.add_argument(
+        "--engine", choices=("join", "aggregate"), default="join",
+    )
+    parser.add_argument(
+        "--upload-mode",
+        choices=("bulk", "streaming", "parallel"),
+        default="bulk",
+    )
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--es-latency", type=float, default=0.0)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    with (
+        fake_elasticsearch(args.es_latency) as server,
+        tempfile.TemporaryDirectory() as directory,
+    ):
+        before = snapshot()
+        seconds = run(args, server.url, directory)
+        after = snapshot()
+        es_stats = {
+            **server.stats,
+            "latency_seconds": server.latency_summary(),
+        }
+
+    rows = {
+        table_name: count - before["rows"].get(table_name, 0)
+        for table_name, count in after["rows"].items()
+    }
+    documents = after["documents"] - before["documents"]
+    report = {
+        "label": args.label,
+        "meta": {
+            "timestamp": datetime.now(UTC).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+        },
+        "params": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+        },
+        "seconds": seconds,
+        "rows": rows,
+        "documents": documents,
+        "rows_per_second": sum(rows.values()) / seconds,
+        "documents_per_second": documents / seconds,
+        "stages": stage_report(before, after, seconds),
+        "elasticsearch": es_stats,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output is not None:
+        args.output.write_text(output + "\n")
+    sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Сравнение движков извлечения фильмов: "join" и "aggregate".
+
+Для одного и того же набора фильмов измеряет время выполнения запроса
+с получением всех строк и объём данных, переданных клиенту (как размер
+текстового вывода COPY того же запроса).
+
+Запуск из каталога postgres_to_es:
+    python -m bench.extract_engines --films 1000 --repeat 5
+"""
+import argparse
+import io
+import json
+import sys
+import time
+
+from psycopg2.extensions import cursor as _cursor
+
+from extract.base import PARAM_PATTERN
+from extract.sql_queries import (
+    FILMWORK_BY_IDS_SQL,
+    FILMWORK_DOCUMENTS_BY_IDS_SQL,
+)
+from settings import settings
+from utils.managers import open_postgres_db
+
+ENGINES = {
+    "join": FILMWORK_BY_IDS_SQL,
+    "aggregate": FILMWORK_DOCUMENTS_BY_IDS_SQL,
+}
+
+
+def measure(
+    curs: _cursor, query: str, filmworks_ids: list[str], repeat: int,
+) -> dict:
+    """
+    Измеряет время и объём передаваемых данных для одного запроса.
+
+    :param curs: курсор PostgreSQL
+    :param query: SQL-запрос движка с параметром $1
+    :param filmworks_ids: id фильмов
+    :param repeat: количество повторов
+    :return: результаты замера
+    """
+    query = PARAM_PATTERN.sub("%s", query).rstrip().rstrip(";")
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        curs.execute(query, (filmworks_ids,))
+        rows = curs.fetchall()
+        timings.append(time.perf_counter() - started)
+
+    buffer = io.BytesIO()
+    curs.copy_expert(
+        f"COPY ({curs.mogrify(query, (filmworks_ids,)).decode()}) TO STDOUT",
+        buffer,
+    )
+    return {
+        "rows": len(rows),
+        "bytes": buffer.tell(),
+        "best_seconds": min(timings),
+        "mean_seconds": sum(timings) / len(timings),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--films", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with (
+        open_postgres_db(settings.postgres_dsn) as connection,
+        connection.cursor() as curs,
+    ):
+        curs.execute(
+            "SELECT id FROM content.film_work ORDER BY id LIMIT %s",
+            (args.films,),
+        )
+        filmworks_ids = [row["id"] for row in curs.fetchall()]
+
+        results = {
+            engine: measure(curs, query, filmworks_ids, args.repeat)
+            for engine, query in ENGINES.items()
+        }
+
+    json.dump(
+        {"films": len(filmworks_ids), "engines": results},
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Локальная замена Elasticsearch для бенчмарков.
+
+HTTP-сервер принимает bulk-запросы, отвечает на каждое действие
+успехом через заданную задержку и считает запросы, действия и байты,
+а также запоминает время обработки каждого запроса. Каждый запрос
+обрабатывается в своём потоке, как одновременные запросы к настоящему
+кластеру.
+
+Сервер можно запустить отдельно и направить на него ETL
+(ELASTIC_HOST=127.0.0.1, ELASTIC_PORT=9200); статистика выводится
+в JSON при остановке (Ctrl+C):
+    python -m bench.fake_es --port 9200 --latency 0.02
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeElasticsearchHandler(BaseHTTPRequestHandler):
+    server: "FakeElasticsearch"
+
+    def do_POST(self) -> None:
+        started = time.perf_counter()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        lines = body.splitlines()
+        items = []
+        for line in lines[::2]:
+            ((op_type, meta),) = json.loads(line).items()
+            items.append(
+                {op_type: {"_id": meta.get("_id"), "status": 201}},
+            )
+        time.sleep(self.server.latency)
+
+        response = json.dumps(
+            {"took": 1, "errors": False, "items": items},
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+        self.server.record(
+            len(items), len(body), time.perf_counter() - started,
+        )
+
+    def do_PUT(self) -> None:
+        self.do_POST()
+
+    def log_message(self, *args: object) -> None:
+        """Не пишет каждый запрос в stderr."""
+
+
+class FakeElasticsearch(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self, latency: float, host: str = "127.0.0.1", port: int = 0,
+    ) -> None:
+        super().__init__((host, port), FakeElasticsearchHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "actions": 0, "bytes": 0}
+        self.latencies: list[float] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def record(self, actions: int, size: int, latency: float) -> None:
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["actions"] += actions
+            self.stats["bytes"] += size
+            self.latencies.append(latency)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+            self.latencies = []
+
+    def latency_summary(self) -> dict[str, float]:
+        """
+        Сводка времени обработки bulk-запросов.
+
+        :return: среднее, медиана, 99-й процентиль и максимум в секундах
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return {}
+        return {
+            "mean": sum(latencies) / len(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p99": latencies[min(
+                len(latencies) * 99 // 100, len(latencies) - 1,
+            )],
+            "max": latencies[-1],
+        }
+
+
+@contextmanager
+def fake_elasticsearch(latency: float = 0.0) -> Iterator[FakeElasticsearch]:
+    """
+    Запускает локальную замену Elasticsearch в фоновом потоке.
+
+    :param latency: задержка ответа на bulk-запрос в секундах
+    :yield: запущенный сервер
+    """
+    server = FakeElasticsearch(latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeElasticsearch(args.latency, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    json.dump(
+        {**server.stats, "latency_seconds": server.latency_summary()},
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Генератор синтетических данных для схемы content (etc/db/dump.sql).
+
+Очищает таблицы схемы и заполняет их заданным количеством фильмов,
+персон и жанров. Персоны распределяются по фильмам по закону Ципфа
+с показателем --skew: персона ранга k участвует в фильмах с весом
+1 / k ** skew, поэтому несколько популярных персон связаны с большим
+количеством фильмов, как актёры-звёзды. При --skew 0 распределение
+равномерное. Данные зависят только от параметров и --seed, поэтому
+прогоны бенчмарков на разных версиях кода сравнимы.
+
+Время изменения записей равномерно распределено в пределах --span-days
+дней до UNTIL. Сводка (количество строк и распределение
+фильмов по персонам) выводится в JSON.
+
+Запуск из каталога postgres_to_es (нужна схема из etc/db/dump.sql):
+    python -m bench.generate --films 100000 --persons 20000 --skew 1.1
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import time
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from datetime import UTC, datetime, timedelta
+from itertools import accumulate, islice
+from uuid import UUID
+
+from psycopg2.extensions import cursor as _cursor
+
+from settings import settings
+from utils.managers import open_postgres_db
+
+TABLES = (
+    "person_film_work",
+    "genre_film_work",
+    "film_work",
+    "person",
+    "genre",
+)
+ROLES = ("actor", "writer", "director")
+TYPES = ("movie", "tv_show")
+UNTIL = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+class Generator:
+    """Воспроизводимый источник синтетических записей схемы content."""
+
+    def __init__(self, seed: int, span: timedelta) -> None:
+        # Нужна воспроизводимость по seed, а не криптостойкость.
+        self.random = random.Random(seed)  # noqa: S311
+        self.span = span.total_seconds()
+
+    def uuid(self) -> str:
+        return str(UUID(int=self.random.getrandbits(128), version=4))
+
+    def timestamp(self) -> str:
+        seconds = self.random.random() * self.span
+        return (UNTIL - timedelta(seconds=seconds)).isoformat()
+
+    def persons(self, count: int) -> list[tuple]:
+        return [
+            (self.uuid(), f"Person {number}", self.timestamp())
+            for number in range(count)
+        ]
+
+    def genres(self, count: int) -> list[tuple]:
+        return [
+            (self.uuid(), f"Genre {number}", self.timestamp())
+            for number in range(count)
+        ]
+
+    def filmworks(self, count: int) -> Iterator[tuple]:
+        for number in range(count):
+            yield (
+                self.uuid(),
+                f"Film {number}",
+                f"Description of film {number}",
+                round(self.random.uniform(1, 10), 1),
+                self.random.choice(TYPES),
+                self.timestamp(),
+            )
+
+    def person_links(
+        self,
+        filmworks_ids: Iterable[str],
+        persons_ids: list[str],
+        per_film: int,
+        skew: float,
+    ) -> Iterator[tuple]:
+        """
+        Связывает фильмы с персонами, выбранными по закону Ципфа.
+
+        :param filmworks_ids: id фильмов
+        :param persons_ids: id персон в порядке убывания популярности
+        :param per_film: количество персон у фильма
+        :param skew: показатель закона Ципфа
+        :yield: записи person_film_work
+        """
+        cum_weights = list(
+            accumulate(
+                1 / (rank ** skew)
+                for rank in range(1, len(persons_ids) + 1)
+            ),
+        )
+        for filmwork_id in filmworks_ids:
+            links = {
+                (person_id, self.random.choice(ROLES))
+                for person_id in self.random.choices(
+                    persons_ids, cum_weights=cum_weights, k=per_film,
+                )
+            }
+            for person_id, role in links:
+                yield self.uuid(), filmwork_id, person_id, role
+
+    def genre_links(
+        self,
+        filmworks_ids: Iterable[str],
+        genres_ids: list[str],
+        per_film: int,
+    ) -> Iterator[tuple]:
+        """
+        Связывает фильмы со случайными жанрами.
+
+        :param filmworks_ids: id фильмов
+        :param genres_ids: id жанров
+        :param per_film: количество жанров у фильма
+        :yield: записи genre_film_work
+        """
+        per_film = min(per_film, len(genres_ids))
+        for filmwork_id in filmworks_ids:
+            for genre_id in self.random.sample(genres_ids, per_film):
+                yield self.uuid(), filmwork_id, genre_id
+
+
+def copy_rows(
+    curs: _cursor,
+    table: str,
+    columns: tuple[str, ...],
+    rows: Iterable[tuple],
+    chunk_size: int,
+) -> int:
+    """
+    Загружает записи в таблицу командой COPY частями по chunk_size.
+
+    :param curs: курсор PostgreSQL
+    :param table: название таблицы схемы content
+    :param columns: колонки таблицы
+    :param rows: записи без табуляций и переводов строк в значениях
+    :param chunk_size: количество записей в одной команде COPY
+    :return: количество загруженных записей
+    """
+    rows = iter(rows)
+    total = 0
+    while chunk := list(islice(rows, chunk_size)):
+        buffer = io.StringIO(
+            "".join(
+                "\t".join(map(str, row)) + "\n" for row in chunk
+            ),
+        )
+        curs.copy_expert(
+            f"COPY content.{table} ({', '.join(columns)}) FROM STDIN",
+            buffer,
+        )
+        total += len(chunk)
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--films", type=int, default=10000)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--persons-per-film", type=int, default=8)
+    parser.add_argument("--genres-per-film", type=int, default=2)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--span-days", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    generator = Generator(args.seed, timedelta(days=args.span_days))
+    persons = generator.persons(args.persons)
+    genres = generator.genres(args.genres)
+    filmworks = list(generator.filmworks(args.films))
+    filmworks_ids = [filmwork[0] for filmwork in filmworks]
+
+    fanout: Counter[str] = Counter()
+
+    def count_persons(rows: Iterable[tuple]) -> Iterator[tuple]:
+        for row in rows:
+            fanout[row[2]] += 1
+            yield row
+
+    started = time.perf_counter()
+    counts = {}
+    with (
+        open_postgres_db(settings.postgres_dsn) as connection,
+        connection.cursor() as curs,
+    ):
+        curs.execute(
+            "TRUNCATE "
+            + ", ".join(f"content.{table}" for table in TABLES),
+        )
+        counts["person"] = copy_rows(
+            curs,
+            "person",
+            ("id", "full_name", "modified"),
+            persons,
+            args.chunk_size,
+        )
+        counts["genre"] = copy_rows(
+            curs,
+            "genre",
+            ("id", "name", "modified"),
+            genres,
+            args.chunk_size,
+        )
+        counts["film_work"] = copy_rows(
+            curs,
+            "film_work",
+            ("id", "title", "description", "rating", "type", "modified"),
+            filmworks,
+            args.chunk_size,
+        )
+        counts["person_film_work"] = copy_rows(
+            curs,
+            "person_film_work",
+            ("id", "film_work_id", "person_id", "role"),
+            count_persons(
+                generator.person_links(
+                    filmworks_ids,
+                    [person[0] for person in persons],
+                    args.persons_per_film,
+                    args.skew,
+                ),
+            ),
+            args.chunk_size,
+        )
+        counts["genre_film_work"] = copy_rows(
+            curs,
+            "genre_film_work",
+            ("id", "film_work_id", "genre_id"),
+            generator.genre_links(
+                filmworks_ids,
+                [genre[0] for genre in genres],
+                args.genres_per_film,
+            ),
+            args.chunk_size,
+        )
+        curs.execute("ANALYZE")
+
+    links = sorted(fanout.values(), reverse=True)
+    json.dump(
+        {
+            "params": vars(args),
+            "rows": counts,
+            "seconds": time.perf_counter() - started,
+            "person_fanout": {
+                "max": links[0] if links else 0,
+                "top_1_percent_share": (
+                    sum(links[:max(len(links) // 100, 1)]) / sum(links)
+                    if links
+                    else 0
+                ),
+                "mean": sum(links) / len(links) if links else 0,
+            },
+        },
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
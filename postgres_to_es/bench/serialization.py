@@ -0,0 +1,111 @@
+"""
+Сравнение способов сериализации тела bulk-запроса.
+
+Для одних и тех же синтетических фильмов (см. bench.transformer)
+измеряет время сериализации в NDJSON в пересчёте на 10 000 фильмов:
+- "client" - словари, которые сериализует клиент Elasticsearch
+  (стандартный json), как до появления сериализованных строк;
+- "uploader" - словари, которые сериализует ESUploader через
+  transform.serializer.dumps;
+- "transformer" - трансформация вместе с кодированием строк
+  в DataTransfromer(encode=True); для сравнения приводится и время
+  трансформации без кодирования.
+
+Запуск из каталога postgres_to_es:
+    python -m bench.serialization --films 10000 --persons 30
+"""
+import argparse
+import json
+import sys
+import time
+from collections.abc import Callable
+
+from elasticsearch.serializer import NdjsonSerializer
+
+from bench.transformer import generate_batches
+from transform import serializer
+from transform.serializer import dumps
+from transform.transformer import DataTransfromer
+
+FILMS_PER_REPORT = 10_000
+
+
+def measure(
+    function: Callable[[], int | None], films: int, repeat: int,
+) -> dict:
+    """
+    Измеряет время выполнения функции сериализации.
+
+    :param function: функция, возвращающая размер тела в байтах
+    (или None, если тело не сериализуется)
+    :param films: количество фильмов
+    :param repeat: количество повторов
+    :return: результаты замера
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = function()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "bytes": size,
+        "best_seconds": best,
+        "seconds_per_10k_films": best * FILMS_PER_REPORT / films,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--films", type=int, default=10_000)
+    parser.add_argument("--persons", type=int, default=30)
+    parser.add_argument("--genres", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    batches = generate_batches(
+        args.films, args.persons, args.genres, args.batch_size,
+    )
+    transformer = DataTransfromer()
+    encoder = DataTransfromer(encode=True)
+    documents = [transformer.transform(batch) for batch in batches]
+    client_serializer = NdjsonSerializer()
+
+    def transform_only() -> None:
+        for batch in batches:
+            transformer.transform(batch)
+
+    cases = {
+        "client": lambda: sum(
+            len(client_serializer.dumps(data)) for data in documents
+        ),
+        "uploader": lambda: sum(
+            len(client_serializer.dumps([dumps(line) for line in data]))
+            for data in documents
+        ),
+        "transform_only": transform_only,
+        "transformer": lambda: sum(
+            len(client_serializer.dumps(encoder.transform(batch)))
+            for batch in batches
+        ),
+    }
+    results = {
+        name: measure(function, args.films, args.repeat)
+        for name, function in cases.items()
+    }
+
+    json.dump(
+        {
+            "films": args.films,
+            "encoder": "orjson" if serializer.orjson else "json",
+            "results": results,
+        },
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Микробенчмарк трансформера на синтетических фильмах с большим
+количеством персон.
+
+Сравнивает текущий DataTransfromer с прежней реализацией (LegacyTransformer
+ниже воспроизводит её алгоритм): прежняя реализация сканировала персоны
+фильма четыре раза и не очищала коллектор между батчами. Оба
+трансформера, как и в ETL, создаются один раз и обрабатывают все батчи.
+Для каждого измеряются пропускная способность (строк и фильмов
+в секунду), количество выданных документов (у прежней реализации оно
+больше количества фильмов) и пиковая память (tracemalloc, отдельным
+прогоном).
+
+Запуск из каталога postgres_to_es:
+    python -m bench.transformer --films 2000 --persons 30 --genres 3
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from collections.abc import Callable
+from uuid import uuid4
+
+from models import FilmWork
+from transform.transformer import DataTransfromer
+
+ROLES = ("actor", "actor", "actor", "writer", "director")
+
+
+class LegacyTransformer:
+    """Прежняя реализация трансформера с общим коллектором."""
+
+    def __init__(self) -> None:
+        self.collector = defaultdict(
+            lambda: {
+                "uuid": None,
+                "title": None,
+                "description": None,
+                "imdb_rate": None,
+                "p_info": set(),
+                "genre_name": set(),
+            },
+        )
+
+    def transform(self, filmworks: list[FilmWork]) -> list[dict]:
+        for filmwork in filmworks:
+            collected = self.collector[filmwork.fw_id]
+            collected["uuid"] = filmwork.fw_id
+            collected["title"] = filmwork.title
+            collected["description"] = filmwork.description
+            collected["imdb_rate"] = filmwork.rating
+            collected["p_info"].add(
+                (filmwork.role, filmwork.full_name, filmwork.id),
+            )
+            collected["genre_name"].add(filmwork.name)
+
+        transformed_data = []
+        for collected in self.collector.values():
+            p_info = tuple(collected["p_info"])
+            persons_info = {}
+            for role in ("actor", "writer"):
+                names = [info[1] for info in p_info if info[0] == role]
+                objects = [
+                    {"id": info[2], "name": info[1]}
+                    for info in p_info
+                    if info[0] == role
+                ]
+                persons_info[role] = [names, objects]
+            director = next(
+                (info[1] for info in p_info if info[0] == "director"), "",
+            )
+            transformed_data.extend(
+                [
+                    {"index": {"_id": collected["uuid"]}},
+                    {
+                        "id": collected["uuid"],
+                        "imdb_rating": collected["imdb_rate"],
+                        "genre": list(collected["genre_name"]),
+                        "title": collected["title"],
+                        "description": collected["description"],
+                        "director": director,
+                        "actors_names": persons_info["actor"][0],
+                        "writers_names": persons_info["writer"][0],
+                        "actors": persons_info["actor"][1],
+                        "writers": persons_info["writer"][1],
+                    },
+                ],
+            )
+        return transformed_data
+
+
+def generate_batches(
+    films: int, persons: int, genres: int, batch_size: int,
+) -> list[list[FilmWork]]:
+    """
+    Генерирует батчи строк в том виде, в котором их возвращает
+    соединение фильмов с персонами и жанрами.
+
+    :param films: количество фильмов
+    :param persons: количество персон в фильме
+    :param genres: количество жанров в фильме
+    :param batch_size: количество фильмов в батче
+    :return: батчи строк фильмов
+    """
+    genre_names = [f"genre {number}" for number in range(genres)]
+    batches = []
+    for start in range(0, films, batch_size):
+        rows = []
+        for film in range(start, min(start + batch_size, films)):
+            fw_id = str(uuid4())
+            for person in range(persons):
+                person_id = str(uuid4())
+                rows.extend(
+                    FilmWork(
+                        fw_id,
+                        f"Film {film}",
+                        "Description " * 20,
+                        f"Person {person}",
+                        person_id,
+                        genre_name,
+                        ROLES[person % len(ROLES)],
+                        7.5,
+                    )
+                    for genre_name in genre_names
+                )
+        batches.append(rows)
+    return batches
+
+
+def measure(
+    factory: Callable[[], object],
+    batches: list[list[FilmWork]],
+    repeat: int,
+) -> dict:
+    """
+    Измеряет время и пиковую память трансформации всех батчей.
+
+    :param factory: конструктор трансформера
+    :param batches: батчи строк фильмов
+    :param repeat: количество повторов замера времени
+    :return: результаты замера
+    """
+    rows = sum(len(batch) for batch in batches)
+    films = len({row.fw_id for batch in batches for row in batch})
+    timings = []
+    for _ in range(repeat):
+        transformer = factory()
+        started = time.perf_counter()
+        documents = sum(
+            len(transformer.transform(batch)) // 2 for batch in batches
+        )
+        timings.append(time.perf_counter() - started)
+
+    transformer = factory()
+    tracemalloc.start()
+    for batch in batches:
+        transformer.transform(batch)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        "documents": documents,
+        "best_seconds": best,
+        "rows_per_second": rows / best,
+        "films_per_second": films / best,
+        "peak_memory_bytes": peak,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--films", type=int, default=2000)
+    parser.add_argument("--persons", type=int, default=30)
+    parser.add_argument("--genres", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    batches = generate_batches(
+        args.films, args.persons, args.genres, args.batch_size,
+    )
+    results = {
+        name: measure(factory, batches, args.repeat)
+        for name, factory in (
+            ("legacy", LegacyTransformer),
+            ("current", DataTransfromer),
+        )
+    }
+
+    json.dump(
+        {
+            "films": args.films,
+            "rows": sum(len(batch) for batch in batches),
+            "transformers": results,
+        },
+        sys.stdout,
+        indent=2,
+    )
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+from typing import Any
+
+from elasticsearch import Elasticsearch
+from psycopg2.extensions import connection as _connection
+
+from etl import ETL
+from logger import logger
+from source.base import BaseChangeSource, Changes
+
+
+class ChangeFeedETL(ETL):
+    """
+    ETL, который загружает фильмы по событиям источника изменений
+    вместо периодического опроса таблиц.
+
+    При запуске таблицы сканируются по стейту, как в обычном режиме,
+    чтобы забрать изменения, сделанные пока ETL не работал. Источник
+    к этому моменту уже подписан на изменения, поэтому изменения во
+    время сканирования не теряются. Дальше фильмы загружаются сразу
+    после получения событий, а при отсутствии изменений запросы
+    к PostgreSQL не выполняются.
+
+    После загрузки событий стейт таблиц сдвигается на позиции (modified,
+    id), снятые до ожидания этих событий: все записи до этих позиций уже
+    были закоммичены и получены из источника.
+    """
+
+    def __init__(
+        self,
+        pg_connection: _connection,
+        es_connection: Elasticsearch,
+        table_names: list[str],
+        batch_size: int,
+        index: str,
+        source: BaseChangeSource,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            pg_connection,
+            es_connection,
+            table_names,
+            batch_size,
+            index,
+            **kwargs,
+        )
+        self.source = source
+
+    def __call__(self, sleep_time: int):
+        self._catch_up()
+        checkpoints = None
+        while True:
+            if checkpoints is None:
+                checkpoints = {
+                    table_name: self.pg_extractor.high_water_mark(table_name)
+                    for table_name in self.table_names
+                }
+            changes = self.source.poll(sleep_time)
+            if not changes:
+                continue
+
+            self._load_changes(changes)
+            for table_name, checkpoint in checkpoints.items():
+                self.pg_extractor.update_state(table_name, checkpoint)
+            self.source.ack()
+            checkpoints = None
+
+    def _catch_up(self) -> None:
+        """Загружает изменения всех таблиц, накопившиеся с последнего
+        сохранённого стейта."""
+        for table_name in self.table_names:
+            while True:
+                try:
+                    self._load(table_name)
+                except EOFError:
+                    break
+                self.pg_extractor.update_state(table_name)
+        logger.info("Catch-up scan completed, waiting for changes.")
+
+    def _load_changes(self, changes: Changes) -> None:
+        """
+        Загружает в ES фильмы, затронутые полученными изменениями.
+
+        :param changes: id изменённых записей по таблицам
+        """
+        filmworks_ids = dict.fromkeys(changes.get("film_work", ()))
+        for table_name, ids in changes.items():
+            if table_name == "film_work" or table_name not in self.table_names:
+                continue
+            filmworks_ids.update(
+                dict.fromkeys(
+                    self.pg_extractor.extract_related_filmworks_ids(
+                        table_name, list(ids),
+                    ),
+                ),
+            )
+
+        filmworks_ids = list(filmworks_ids)
+        self._load_filmworks_batches(filmworks_ids)
+        changed = {table: len(ids) for table, ids in changes.items()}
+        logger.info(
+            "%s films affected by changes %s uploaded to ES",
+            len(filmworks_ids),
+            changed,
+        )
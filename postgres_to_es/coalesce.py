@@ -0,0 +1,114 @@
+import time
+from dataclasses import dataclass, field
+from itertools import cycle
+from typing import Any
+
+from etl import ETL
+from extract.extractor import Checkpoint
+from logger import logger
+from metrics.instruments import COALESCE_FILMWORKS
+
+
+@dataclass
+class Window:
+    """Окно накопления id фильмов, затронутых изменениями всех таблиц."""
+
+    filmworks_ids: dict[str, None] = field(default_factory=dict)
+    checkpoints: dict[str, Checkpoint] = field(default_factory=dict)
+    affected: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+
+class CoalescingETL(ETL):
+    """
+    ETL, который сначала собирает id затронутых фильмов из всех таблиц
+    за окно по времени или размеру, а затем один раз извлекает
+    и загружает в ES каждый уникальный фильм.
+
+    Если изменения персоны и жанра затрагивают один фильм, он будет
+    переиндексирован один раз, а не при обработке каждой из таблиц.
+    Стейт таблиц обновляется только после загрузки всего окна.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        window_time: float = 1.0,
+        window_size: int = 1000,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.window_time = window_time
+        self.window_size = window_size
+        self.stats = {
+            "filmworks_affected": 0,
+            "filmworks_indexed": 0,
+            "reindexes_avoided": 0,
+        }
+
+    def __call__(self, sleep_time: int):
+        while True:
+            window = self._collect_window()
+            if not window.checkpoints:
+                logger.info("No modified data found.")
+                time.sleep(sleep_time)
+                continue
+
+            self._load_filmworks_batches(list(window.filmworks_ids))
+            for table_name, checkpoint in window.checkpoints.items():
+                self.pg_extractor.update_state(table_name, checkpoint)
+
+            self.stats["filmworks_affected"] += window.affected
+            self.stats["filmworks_indexed"] += len(window.filmworks_ids)
+            self.stats["reindexes_avoided"] += (
+                window.affected - len(window.filmworks_ids)
+            )
+            COALESCE_FILMWORKS.inc(
+                len(window.filmworks_ids), result="indexed",
+            )
+            COALESCE_FILMWORKS.inc(
+                window.affected - len(window.filmworks_ids),
+                result="avoided",
+            )
+            logger.info(
+                "Window of %s unique films from %s affected uploaded to ES, "
+                "state for tables %s updated. Totals: %s",
+                len(window.filmworks_ids),
+                window.affected,
+                list(window.checkpoints),
+                self.stats,
+            )
+
+    def _collect_window(self) -> Window:
+        """
+        Собирает id затронутых фильмов из всех таблиц, пока окно
+        не заполнится, не истечёт время окна или во всех таблицах
+        не закончатся изменения.
+
+        :return: окно с уникальными id фильмов и позициями таблиц
+        """
+        window = Window()
+        empty_tables = 0
+        for table_name in cycle(self.table_names):
+            try:
+                filmworks_ids = self.pg_extractor.extract_filmworks_ids(
+                    table_name,
+                )
+            except EOFError:
+                empty_tables += 1
+                if empty_tables >= len(self.table_names):
+                    break
+                continue
+
+            empty_tables = 0
+            window.affected += len(filmworks_ids)
+            window.filmworks_ids.update(dict.fromkeys(filmworks_ids))
+            window.checkpoints[table_name] = self.pg_extractor.advance(
+                table_name,
+            )
+            if (
+                len(window.filmworks_ids) >= self.window_size
+                or time.monotonic() - window.started >= self.window_time
+            ):
+                break
+        return window
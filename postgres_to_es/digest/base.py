@@ -0,0 +1,145 @@
+import json
+from collections.abc import Iterable, Iterator
+from hashlib import blake2b
+from itertools import islice
+from threading import Lock
+from typing import Any
+
+from digest.storage import BaseDigestStorage
+from metrics.instruments import DIGEST_DOCUMENTS, DIGEST_SKIP_RATIO
+
+STALE_DIGEST = "-"
+
+
+def canonical(value: Any) -> Any:
+    """
+    Приводит документ к каноническому виду: порядок ключей и элементов
+    списков не влияет на результат.
+
+    :param value: документ или его часть
+    :return: значение с отсортированными ключами и элементами списков
+    """
+    if isinstance(value, dict):
+        return {key: canonical(item) for key, item in sorted(value.items())}
+    if isinstance(value, list | tuple | set):
+        return sorted(
+            (canonical(item) for item in value),
+            key=lambda item: json.dumps(item, default=str),
+        )
+    return value
+
+
+def document_digest(document: dict) -> str:
+    """
+    Вычисляет компактный дайджест документа.
+
+    :param document: документ индекса
+    :return: 64-битный дайджест в hex
+    """
+    payload = json.dumps(
+        canonical(document), default=str, separators=(",", ":"),
+    )
+    return blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+class DigestFilter:
+    """
+    Класс для отсева документов, которые не изменились с последней
+    загрузки в ES.
+
+    Дайджест документа сохраняется только после подтверждения его
+    загрузки (см. commit), поэтому неудачная загрузка не приводит
+    к пропуску документа в следующий раз.
+    """
+
+    def __init__(self, storage: BaseDigestStorage, chunk_size: int = 500):
+        self.storage = storage
+        self.chunk_size = chunk_size
+        self.lock = Lock()
+        self.stats = {"checked": 0, "skipped": 0}
+
+    @property
+    def skip_ratio(self) -> float:
+        """Доля отсеянных документов среди проверенных."""
+        return self.stats["skipped"] / (self.stats["checked"] or 1)
+
+    def filter(
+        self,
+        data: Iterable[dict],
+        pending: dict[str, str],
+        skip_unchanged: bool = True,
+    ) -> Iterator[dict]:
+        """
+        Отсеивает пары действие/документ, документ которых не изменился.
+
+        :param data: пары действие/документ для загрузки в индекс
+        :param pending: словарь, в который складываются дайджесты
+        пропущенных дальше документов до подтверждения их загрузки
+        :param skip_unchanged: отсеивать ли неизменённые документы;
+        если нет - дайджесты только запоминаются
+        :yield: пары действие/документ с изменёнными документами
+        """
+        data = iter(data)
+        while chunk := list(islice(data, self.chunk_size * 2)):
+            pairs = list(zip(chunk[::2], chunk[1::2], strict=True))
+            ids = [str(document["id"]) for _, document in pairs]
+            stored_digests = self.storage.get_digests(ids)
+
+            skipped = 0
+            for (action, document), document_id, stored_digest in zip(
+                pairs, ids, stored_digests, strict=True,
+            ):
+                digest = document_digest(document)
+                if skip_unchanged and digest == stored_digest:
+                    skipped += 1
+                    continue
+                pending[document_id] = digest
+                yield action
+                yield document
+
+            with self.lock:
+                self.stats["checked"] += len(pairs)
+                self.stats["skipped"] += skipped
+                DIGEST_SKIP_RATIO.set(self.skip_ratio)
+            DIGEST_DOCUMENTS.inc(len(pairs) - skipped, result="changed")
+            DIGEST_DOCUMENTS.inc(skipped, result="skipped")
+
+    def commit(self, pending: dict[str, str]) -> None:
+        """
+        Сохраняет дайджесты документов, загрузка которых подтверждена.
+
+        :param pending: дайджесты загруженных документов
+        """
+        self.storage.save_digests(pending)
+        pending.clear()
+
+    def invalidate(self, ids: list[str]) -> None:
+        """
+        Сбрасывает дайджесты документов, изменённых в индексе в обход
+        фильтра, чтобы следующая загрузка их не пропустила. Вместо
+        дайджеста сохраняется STALE_DIGEST, который не совпадает
+        ни с одним дайджестом документа.
+
+        :param ids: id документов
+        """
+        self.storage.save_digests(dict.fromkeys(ids, STALE_DIGEST))
+
+    def seed(self, documents: Iterable[dict]) -> int:
+        """
+        Заполняет хранилище дайджестами документов, уже находящихся
+        в индексе.
+
+        :param documents: документы индекса
+        :return: количество сохранённых дайджестов
+        """
+        total = 0
+        documents = iter(documents)
+        while chunk := list(islice(documents, self.chunk_size)):
+            self.storage.save_digests(
+                {
+                    str(document["id"]): document_digest(document)
+                    for document in chunk
+                },
+            )
+            total += len(chunk)
+        return total
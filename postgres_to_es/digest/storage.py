@@ -0,0 +1,92 @@
+import abc
+import os
+from pathlib import Path
+from threading import Lock
+
+from redis import Redis
+
+
+class BaseDigestStorage(abc.ABC):
+    """Абстрактное хранилище дайджестов документов.
+
+    Хранит для каждого id фильма компактный дайджест последней
+    загруженной в ES версии документа.
+    """
+
+    @abc.abstractmethod
+    def get_digests(self, ids: list[str]) -> list[str | None]:
+        """Получить дайджесты документов в порядке переданных id."""
+
+    @abc.abstractmethod
+    def save_digests(self, digests: dict[str, str]) -> None:
+        """Сохранить дайджесты документов."""
+
+
+class FileDigestStorage(BaseDigestStorage):
+    """Реализация хранилища, использующего локальный файл.
+
+    Дайджесты держатся в памяти процесса, а на диск дописываются строками
+    "id дайджест" в конец файла. При загрузке последняя запись id
+    перекрывает предыдущие. Когда устаревших записей в файле становится
+    больше, чем актуальных, файл переписывается целиком через атомарное
+    переименование.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = Lock()
+        self.digests: dict[str, str] = {}
+        self.records = 0
+        if path.exists():
+            with path.open() as file:
+                for line in file:
+                    document_id, digest = line.split()
+                    self.digests[document_id] = digest
+                    self.records += 1
+
+    def get_digests(self, ids: list[str]) -> list[str | None]:
+        """Получить дайджесты документов в порядке переданных id."""
+        return [self.digests.get(document_id) for document_id in ids]
+
+    def save_digests(self, digests: dict[str, str]) -> None:
+        """Сохранить дайджесты документов."""
+        with self.lock:
+            self.digests.update(digests)
+            with self.path.open("a") as file:
+                file.writelines(
+                    f"{key} {digest}\n" for key, digest in digests.items()
+                )
+            self.records += len(digests)
+            if self.records > 2 * len(self.digests):
+                self._compact()
+
+    def _compact(self) -> None:
+        """Переписывает файл, оставляя только актуальные дайджесты."""
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with tmp_path.open("w") as file:
+            file.writelines(
+                f"{key} {digest}\n" for key, digest in self.digests.items()
+            )
+            file.flush()
+            os.fsync(file.fileno())
+        tmp_path.replace(self.path)
+        self.records = len(self.digests)
+
+
+class RedisDigestStorage(BaseDigestStorage):
+    """Реализация хранилища, использующего хеш Redis."""
+
+    def __init__(self, redis_adapter: Redis, key: str = "etl_digests"):
+        self.redis_adapter = redis_adapter
+        self.key = key
+
+    def get_digests(self, ids: list[str]) -> list[str | None]:
+        """Получить дайджесты документов в порядке переданных id."""
+        if not ids:
+            return []
+        return self.redis_adapter.hmget(self.key, ids)
+
+    def save_digests(self, digests: dict[str, str]) -> None:
+        """Сохранить дайджесты документов."""
+        if digests:
+            self.redis_adapter.hset(self.key, mapping=digests)
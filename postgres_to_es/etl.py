@@ -1,16 +1,47 @@
 import time
+from collections.abc import Iterable, Iterator
 from itertools import cycle
 
+import psycopg2
 from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError as ESConnectionError
 from psycopg2.extensions import connection as _connection
 
-from extract.extractor import PostgreSQLExtractor
+from digest.base import DigestFilter
+from extract.dimensions import DimensionCache
+from extract.extractor import DOCUMENT_ENGINES, PostgreSQLExtractor
+from extract.shard import Shard
 from logger import logger
+from metrics.instruments import BATCH_SIZE, timed
+from models import FilmWork, FilmWorkDocument
+from state.base import State
 from transform.transformer import DataTransfromer
 from upload.uploader import ESUploader
+from utils.batching import AdaptiveBatchSize, BatchLimits
+from utils.decorators import backoff
 
 
 class ETL:
+    """
+    ETL, загружающий изменения таблиц по очереди.
+
+    Фильмы, затронутые батчем изменений, извлекаются и загружаются
+    частями не больше merge_batch_size фильмов, поэтому изменение
+    популярной персоны не превращается в один огромный запрос. Стейт
+    таблицы обновляется только после загрузки всех частей батча.
+
+    Если заданы batch_limits, размер батча изменений и размер части
+    bulk-запроса подбираются для каждой таблицы отдельно по длительности
+    и размеру загрузки предыдущих батчей (см. AdaptiveBatchSize).
+
+    Если включены partial_updates, изменения персон и жанров не
+    перезагружают затронутые фильмы целиком: в документах частично
+    обновляются только имена персон или жанры (см.
+    PostgreSQLExtractor.extract_related_updates). Изменения film_work
+    по-прежнему загружают фильмы целиком. Частичное обновление
+    не сравнивает версии документов, поэтому используется только
+    при последовательной загрузке таблиц одним потоком.
+    """
 
     def __init__(
         self,
@@ -19,45 +50,252 @@ class ETL:
         table_names: list[str],
         batch_size: int,
         index: str,
+        stream: bool = False,
+        itersize: int = 1000,
+        bulk_chunk_size: int = 500,
+        engine: str = "join",
+        state: State | None = None,
+        upload_mode: str = "bulk",
+        max_chunk_bytes: int = 100 * 1024 * 1024,
+        upload_threads: int = 4,
+        refresh: str = "false",
+        max_retries: int = 3,
+        digest_filter: DigestFilter | None = None,
+        backlog_limit: int = 0,
+        batch_limits: BatchLimits | None = None,
+        merge_batch_size: int = 500,
+        shard: Shard | None = None,
+        partial_updates: bool = False,
+        dimension_cache: DimensionCache | None = None,
     ) -> None:
         self.pg_extractor = PostgreSQLExtractor(
             pg_connection,
             batch_size,
             table_names,
+            stream,
+            itersize,
+            engine,
+            state,
+            backlog_limit,
+            shard,
+            dimension_cache,
+        )
+        self.data_transformer = DataTransfromer(
+            encode=upload_mode == "bulk" and digest_filter is None,
+        )
+        self.es_uploader = ESUploader(
+            es_connection,
+            upload_mode,
+            bulk_chunk_size,
+            max_chunk_bytes,
+            upload_threads,
+            refresh,
+            max_retries,
+            digest_filter,
         )
-        self.data_transformer = DataTransfromer()
-        self.es_uploader = ESUploader(es_connection)
         self.table_names = table_names
         self.index = index
+        self.stream = stream
+        self.engine = engine
+        self.merge_batch_size = merge_batch_size
+        self.partial_updates = partial_updates
+        self.batch_controllers: dict[str, AdaptiveBatchSize] = {}
+        if batch_limits is not None:
+            self.batch_controllers = {
+                table_name: AdaptiveBatchSize(
+                    batch_size, bulk_chunk_size, batch_limits,
+                )
+                for table_name in table_names
+            }
 
         logger.info("ETL initialize completed.")
 
     def __call__(self, sleep_time: int):
         for table_name in cycle(self.table_names):
-            logger.info(
-                f"Looking for modified records in {table_name}",
-            )
+            logger.info("Looking for modified records in %s", table_name)
             try:
-                data = self.pg_extractor.extract_data(table_name)
-                logger.info(
-                    "Modified recods succesfully extracted "
-                    f"from table {table_name}.",
-                ) # TODO https://okomestudio.net/biboroku/2020/04/on-lazy-logging-evaluation/
+                self._load(table_name)
             except EOFError:
                 logger.info("No modified data found.")
                 continue
 
-            transformed_data = self.data_transformer.transform(data)
-            logger.info(
-                f"Data for {table_name} ready for load to ES.",
-            )
+            self.pg_extractor.update_state(table_name)
+            logger.info("State for table %s updated", table_name)
+
+            time.sleep(sleep_time)
+
+    def _load(self, table_name: str) -> None:
+        """
+        Извлекает, трансформирует и загружает в ES фильмы, затронутые
+        батчем изменений таблицы.
+
+        Ошибка при загрузке части фильмов повторяет только эту часть:
+        стейт таблицы ещё не обновлён, а повторная загрузка документов
+        в ES идемпотентна.
+
+        :param table_name: название таблицы
+        """
+        started = time.perf_counter()
+        sent_bytes = self._apply_batch_size(table_name)
+        if (
+            self.partial_updates
+            and table_name in self.pg_extractor.related_updaters
+        ):
+            self._update_related(table_name)
+            self._adapt_batch_size(table_name, started, sent_bytes)
+            return
+
+        filmworks_ids = self.pg_extractor.extract_filmworks_ids(table_name)
+        logger.info(
+            "%s films affected by modified records of table %s.",
+            len(filmworks_ids),
+            table_name,
+        )
+
+        self._load_filmworks_batches(filmworks_ids)
+        logger.info(
+            "Records upload to ES.",
+        )
+        self._adapt_batch_size(table_name, started, sent_bytes)
+
+    def _update_related(self, table_name: str) -> None:
+        """
+        Частично обновляет в ES фильмы, затронутые батчем изменений
+        персон или жанров.
+
+        :param table_name: название таблицы ("person" или "genre")
+        """
+        rows = self.pg_extractor.extract_related_updates(table_name)
+        with timed("transform"):
+            if table_name == "person":
+                data = list(
+                    self.data_transformer.transform_person_updates(rows),
+                )
+            else:
+                data = list(
+                    self.data_transformer.transform_genre_updates(rows),
+                )
+        self.es_uploader.update_data(data, self.index)
+        logger.info(
+            "%s films partially updated by modified records of table %s.",
+            len(data) // 2,
+            table_name,
+        )
+
+    def _load_filmworks_batches(self, filmworks_ids: list[str]) -> None:
+        """
+        Загружает в ES фильмы частями не больше merge_batch_size.
 
-            self.es_uploader.insert_data(transformed_data, self.index)
-            logger.info(
-                "Records upload to ES.",
+        :param filmworks_ids: id фильмов
+        """
+        for start in range(0, len(filmworks_ids), self.merge_batch_size):
+            self._load_filmworks(
+                filmworks_ids[start:start + self.merge_batch_size],
             )
 
-            self.pg_extractor.update_state(table_name)
-            logger.info(f"State for table {table_name} updated")
+    def _transform(
+        self,
+        transformer: DataTransfromer,
+        data: list[FilmWork | FilmWorkDocument],
+    ) -> list[dict | bytes]:
+        """
+        Трансформирует батч фильмов способом, подходящим движку извлечения.
 
-            time.sleep(sleep_time)
+        :param transformer: трансформер данных
+        :param data: данные о фильмах
+        :return: подготовленные для загрузки в ES данные о фильмах
+        """
+        with timed("transform"):
+            if self.engine in DOCUMENT_ENGINES:
+                return list(transformer.transform_documents(data))
+            return transformer.transform(data)
+
+    def _transform_stream(
+        self, data: Iterable[FilmWork | FilmWorkDocument],
+    ) -> Iterator[dict | bytes]:
+        """
+        Потоково трансформирует фильмы способом, подходящим движку
+        извлечения.
+
+        :param data: поток данных о фильмах
+        :return: поток подготовленных для загрузки в ES данных о фильмах
+        """
+        if self.engine in DOCUMENT_ENGINES:
+            return self.data_transformer.transform_documents(data)
+        return self.data_transformer.transform_stream(data)
+
+    def _load_filmworks(self, filmworks_ids: list[str]) -> None:
+        """
+        Извлекает, трансформирует и загружает в ES фильмы по их id.
+
+        Ошибки PostgreSQL и ES повторяются там, где они возникают:
+        в extract_filmworks и в bulk-запросах загрузчика.
+
+        :param filmworks_ids: id фильмов
+        """
+        if self.stream:
+            self._load_filmworks_stream(filmworks_ids)
+            return
+        data = self.pg_extractor.extract_filmworks(filmworks_ids)
+        self.es_uploader.insert_data(
+            self._transform(self.data_transformer, data), self.index,
+        )
+
+    @backoff((psycopg2.Error, ESConnectionError))
+    def _load_filmworks_stream(self, filmworks_ids: list[str]) -> None:
+        """
+        Потоково извлекает, трансформирует и загружает в ES фильмы
+        по их id.
+
+        Ошибка PostgreSQL во время чтения курсора или ошибка соединения
+        с ES в режимах helpers возникает уже после того, как часть потока
+        прочитана, поэтому повторяется загрузка всей части фильмов.
+
+        :param filmworks_ids: id фильмов
+        """
+        data = self.pg_extractor.extract_filmworks(filmworks_ids)
+        self.es_uploader.insert_stream(
+            self._transform_stream(data), self.index,
+        )
+
+    def _apply_batch_size(self, table_name: str) -> int:
+        """
+        Устанавливает размер батча и части bulk-запроса таблицы перед
+        загрузкой её батча, если размер подбирается адаптивно.
+
+        :param table_name: название таблицы
+        :return: количество байт, отправленных в ES до загрузки батча
+        """
+        controller = self.batch_controllers.get(table_name)
+        if controller is not None:
+            self.pg_extractor.batch_sizes[table_name] = controller.batch_size
+            self.es_uploader.chunk_size = controller.chunk_size
+            BATCH_SIZE.set(controller.batch_size, table=table_name)
+        return self.es_uploader.sent_bytes
+
+    def _adapt_batch_size(
+        self, table_name: str, started: float, sent_bytes: int,
+    ) -> None:
+        """
+        Пересчитывает размер батча таблицы по загруженному батчу.
+
+        :param table_name: название таблицы
+        :param started: момент начала загрузки батча (time.perf_counter)
+        :param sent_bytes: количество байт, отправленных в ES до загрузки
+        батча
+        """
+        controller = self.batch_controllers.get(table_name)
+        if controller is None:
+            return
+        controller.update(
+            self.pg_extractor.last_rows,
+            self.pg_extractor.last_filmworks,
+            time.perf_counter() - started,
+            self.es_uploader.sent_bytes - sent_bytes,
+        )
+        logger.debug(
+            "Batch size for %s set to %s, bulk chunk size to %s",
+            table_name,
+            controller.batch_size,
+            controller.chunk_size,
+        )
@@ -0,0 +1,206 @@
+import asyncio
+import json
+from datetime import UTC, datetime
+
+import asyncpg
+
+from extract.base import IDENTIFIER_PATTERN
+from extract.extractor import MIN_UUID, Checkpoint
+from extract.sql_queries import (
+    BACKLOG_SQL,
+    FILMWORK_BY_IDS_SQL,
+    FILMWORK_DOCUMENTS_BY_IDS_SQL,
+    FILMWORK_IDS_BY_RELATED_MODIFIED_SQL,
+    MODIFIED_OBJECTS_SQL,
+)
+from logger import logger
+from metrics.instruments import BACKLOG, ROWS, observe_checkpoint, timed
+from models import FilmWork, FilmWorkDocument
+from state.base import State
+from utils.decorators import async_backoff
+
+
+async def init_connection(connection: asyncpg.Connection) -> None:
+    """
+    Настраивает соединение пула: json и jsonb декодируются
+    в объекты Python, как в psycopg2.
+
+    :param connection: новое соединение пула
+    """
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name,
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema="pg_catalog",
+        )
+
+
+class AsyncPostgreSQLExtractor:
+    """
+    Асинхронный вариант PostgreSQLExtractor на пуле соединений asyncpg.
+
+    Использует те же запросы и те же ключи стейта. Параметры $1, $2, ...
+    asyncpg передаёт в базу сам и кеширует подготовленные запросы
+    в каждом соединении пула. Так как таблицы обрабатываются
+    одновременно, позиция извлечённого батча возвращается вместе с ним,
+    а не хранится в буферном стейте. Стейт читается и пишется
+    в отдельном потоке, чтобы не блокировать цикл событий.
+    """
+
+    def __init__(
+        self,
+        pool: asyncpg.Pool,
+        batch_size: int,
+        table_names: list[str],
+        state: State,
+        engine: str = "join",
+        backlog_limit: int = 0,
+    ):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.backlog_limit = backlog_limit
+        self.state = state
+        self.positions: dict[str, Checkpoint] = {}
+        if engine == "aggregate":
+            self.merger = FILMWORK_DOCUMENTS_BY_IDS_SQL
+            self.row_model = FilmWorkDocument
+        else:
+            self.merger = FILMWORK_BY_IDS_SQL
+            self.row_model = FilmWork
+        self._check_states(table_names)
+
+    @async_backoff((asyncpg.PostgresError, OSError))
+    async def extract_filmworks_ids(
+        self, table_name: str,
+    ) -> tuple[list[str], Checkpoint]:
+        """
+        Извлекает id фильмов, которых затронуло изменение следующего
+        батча записей таблицы.
+
+        :param table_name: название таблицы
+        :return: id фильмов и позиция (modified, id), до которой
+        прочитана таблица
+        """
+        modified, last_id = self.positions.get(table_name) or (
+            await asyncio.to_thread(
+                self.state.get_states,
+                [f"{table_name}_modified", f"{table_name}_id"],
+            )
+        ).values()
+        modified = datetime.fromisoformat(modified)
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=UTC)
+
+        with timed("produce"):
+            modified_data = await self.pool.fetch(
+                self._render(MODIFIED_OBJECTS_SQL, table_name=table_name),
+                modified,
+                last_id,
+                self.batch_size,
+            )
+        if not modified_data:
+            BACKLOG.set(0, table=table_name)
+            raise EOFError
+
+        checkpoint = (
+            modified_data[-1]["modified"].isoformat(),
+            str(modified_data[-1]["id"]),
+        )
+        modified_ids = [str(row["id"]) for row in modified_data]
+        ROWS.inc(len(modified_ids), table=table_name)
+        if self.backlog_limit:
+            BACKLOG.set(
+                await self.pool.fetchval(
+                    self._render(BACKLOG_SQL, table_name=table_name),
+                    modified_data[-1]["modified"],
+                    modified_data[-1]["id"],
+                    self.backlog_limit,
+                ),
+                table=table_name,
+            )
+        logger.info(
+            "Found %s modified records in %s table",
+            len(modified_ids),
+            table_name,
+        )
+        if table_name == "film_work":
+            return modified_ids, checkpoint
+
+        with timed("enrich"):
+            filmworks_ids = await self.pool.fetch(
+                self._render(
+                    FILMWORK_IDS_BY_RELATED_MODIFIED_SQL,
+                    table_name=table_name,
+                ),
+                modified_ids,
+            )
+        return [str(row["id"]) for row in filmworks_ids], checkpoint
+
+    @async_backoff((asyncpg.PostgresError, OSError))
+    async def extract_filmworks(
+        self, filmworks_ids: list[str],
+    ) -> list[FilmWork | FilmWorkDocument]:
+        """
+        Извлекает данные фильмов по их id.
+
+        :param filmworks_ids: id фильмов
+        :return: фильмы с необходимой для трансформации информацией
+        """
+        with timed("merge"):
+            rows = await self.pool.fetch(self.merger, filmworks_ids)
+        return [self.row_model(**row) for row in rows]
+
+    def advance(self, table_name: str, checkpoint: Checkpoint) -> None:
+        """
+        Сдвигает позицию чтения таблицы, не дожидаясь обновления стейта.
+
+        :param table_name: название таблицы
+        :param checkpoint: позиция, до которой прочитана таблица
+        """
+        self.positions[table_name] = checkpoint
+
+    async def update_state(
+        self, table_name: str, checkpoint: Checkpoint,
+    ) -> None:
+        """
+        Обновляет стейт таблицы переданной позицией.
+
+        :param table_name: название таблицы
+        :param checkpoint: позиция (modified, id), до которой таблица
+        загружена в ES
+        """
+        modified, last_id = checkpoint
+        await asyncio.to_thread(
+            self.state.set_states,
+            {
+                f"{table_name}_modified": modified,
+                f"{table_name}_id": last_id,
+            },
+        )
+        observe_checkpoint(table_name, modified)
+
+    def _check_states(self, table_names: list[str]) -> None:
+        """
+        Проверяет стейты таблиц в хранилище, если стейт не обнаружен -
+        инициализирует его с минимальным значением.
+        """
+        defaults = {}
+        for table_name in table_names:
+            defaults[f"{table_name}_modified"] = datetime.min
+            defaults[f"{table_name}_id"] = MIN_UUID
+        self.state.set_defaults(defaults)
+
+    @staticmethod
+    def _render(query: str, **identifiers: str) -> str:
+        """
+        Подставляет идентификаторы в текст запроса.
+
+        :param query: SQL-запрос с идентификаторами в фигурных скобках
+        :kwargs **identifiers: идентификаторы, подставляемые в запрос.
+        :return: текст запроса.
+        """
+        for identifier in identifiers.values():
+            if not IDENTIFIER_PATTERN.match(identifier):
+                raise ValueError(f"Invalid SQL identifier: {identifier!r}")
+        return query.format(**identifiers)
@@ -1,30 +1,117 @@
+import re
+from collections.abc import Iterator
+from typing import Any
+from uuid import uuid4
+
 from psycopg2.extensions import connection as _connection
+from psycopg2.extensions import cursor as _cursor
+
+PARAM_PATTERN = re.compile(r"\$(\d+)")
+IDENTIFIER_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
 
 
 class BaseExtractor:
     """
     Базовый класс для извлечения данных из базы PostgreSQL.
+
+    SQL-запрос задаётся с позиционными параметрами PostgreSQL ($1, $2, ...)
+    и идентификаторами в фигурных скобках ({table_name}). Значения
+    параметров передаются в базу отдельно от текста запроса, поэтому
+    запрос готовится на сервере (PREPARE) один раз на каждое соединение
+    и набор идентификаторов и переиспользует план между циклами.
     """
 
     def __init__(
         self,
         connection: _connection,
         query: str,
+        name: str,
+        param_types: tuple[str, ...],
     ):
         self.connection = connection
         self.query = query
+        self.name = name
+        self.param_types = param_types
+        self._prepared: set[tuple[int, str]] = set()
 
-    def extract(self, **query_params):  # noqa: ANN003
+    def extract(self, *params: Any, **identifiers: str) -> list:
         """
         Извлекает данные из базы данных с использованием
-        предоставленного SQL-запроса.
+        подготовленного SQL-запроса.
 
-        :kwargs **query_params: параметры, используемые для форматирования
-        SQL-запроса.
+        :args *params: значения позиционных параметров запроса.
+        :kwargs **identifiers: идентификаторы (имена таблиц), подставляемые
+        в текст запроса.
         :return: результаты запроса.
         """
-        query = self.query.format(**query_params)
-
         with self.connection.cursor() as curs:
-            curs.execute(query=query)
+            statement = self._prepare(curs, **identifiers)
+            curs.execute(statement, params)
             return curs.fetchall()
+
+    def stream(
+        self, itersize: int, *params: Any, **identifiers: str,
+    ) -> Iterator:
+        """
+        Построчно извлекает данные из базы через именованный (серверный)
+        курсор, не загружая весь результат запроса в память.
+
+        Серверный курсор не может быть объявлен над EXECUTE, поэтому
+        здесь параметры связываются драйвером без подготовки запроса.
+
+        :param itersize: количество строк, забираемых с сервера за один раз.
+        :args *params: значения позиционных параметров запроса.
+        :kwargs **identifiers: идентификаторы (имена таблиц), подставляемые
+        в текст запроса.
+        :yield: строки результата запроса.
+        """
+        query = PARAM_PATTERN.sub(r"%(\1)s", self._render(**identifiers))
+        query_params = {
+            str(number): param
+            for number, param in enumerate(params, start=1)
+        }
+
+        with self.connection.cursor(name=f"stream_{uuid4().hex}") as curs:
+            curs.itersize = itersize
+            curs.execute(query, query_params)
+            yield from curs
+
+    def _prepare(self, curs: _cursor, **identifiers: str) -> str:
+        """
+        Готовит запрос на сервере, если он ещё не подготовлен
+        в текущем соединении.
+
+        :param curs: курсор, через который выполняется PREPARE.
+        :kwargs **identifiers: идентификаторы, подставляемые в запрос.
+        :return: SQL для выполнения подготовленного запроса.
+        """
+        statement_name = "_".join([self.name, *identifiers.values()])
+        key = (self.connection.get_backend_pid(), statement_name)
+        params_sql = placeholders = ""
+        if self.param_types:
+            params_sql = f" ({', '.join(self.param_types)})"
+            placeholders = ", ".join(
+                f"%s::{param_type}" for param_type in self.param_types
+            )
+            placeholders = f" ({placeholders})"
+
+        if key not in self._prepared:
+            curs.execute(
+                f"PREPARE {statement_name}{params_sql} "
+                f"AS {self._render(**identifiers)}",
+            )
+            self._prepared.add(key)
+
+        return f"EXECUTE {statement_name}{placeholders}"
+
+    def _render(self, **identifiers: str) -> str:
+        """
+        Подставляет идентификаторы в текст запроса.
+
+        :kwargs **identifiers: идентификаторы, подставляемые в запрос.
+        :return: текст запроса.
+        """
+        for identifier in identifiers.values():
+            if not IDENTIFIER_PATTERN.match(identifier):
+                raise ValueError(f"Invalid SQL identifier: {identifier!r}")
+        return self.query.format(**identifiers)
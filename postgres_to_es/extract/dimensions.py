@@ -0,0 +1,143 @@
+import sys
+from collections import OrderedDict
+from collections.abc import Iterable
+from threading import Lock
+
+from metrics.instruments import (
+    DIMENSION_CACHE_BYTES,
+    DIMENSION_CACHE_ENTRIES,
+    DIMENSION_CACHE_HIT_RATIO,
+    DIMENSION_CACHE_LOOKUPS,
+)
+
+DIMENSIONS = {"person": "full_name", "genre": "name"}
+
+# Примерный размер узла OrderedDict и кортежа ключа без учёта строк.
+ENTRY_OVERHEAD = 160
+
+
+def entry_size(record_id: str, name: str) -> int:
+    """
+    Оценивает память, занимаемую записью кеша.
+
+    :param record_id: id записи
+    :param name: имя записи
+    :return: размер записи в байтах
+    """
+    return ENTRY_OVERHEAD + sys.getsizeof(record_id) + sys.getsizeof(name)
+
+
+class DimensionCache:
+    """
+    LRU-кеш имён персон (id -> full_name) и жанров (id -> name),
+    ограниченный оценкой занимаемой памяти.
+
+    Кеш общий для всех воркеров процесса: запись вытесняется, когда
+    её персону или жанр извлекает продюсер соответствующей таблицы
+    или приходит её изменение из источника изменений (см. invalidate).
+    Изменения, извлечённые другими процессами, кеш не видит, поэтому
+    он используется только в режимах, где все таблицы загружает один
+    процесс. Имена, прочитанные из базы до вытеснения,
+    но добавляемые после него, в кеш не попадают: каждое вытеснение
+    увеличивает generation, и put_many с поколением, снятым до чтения
+    из базы, игнорируется.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        self.entries: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self.size = 0
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0}
+
+    @property
+    def hit_ratio(self) -> float:
+        """Доля имён, найденных в кеше, среди запрошенных."""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / (lookups or 1)
+
+    def get_many(
+        self, dimension: str, ids: Iterable[str],
+    ) -> tuple[dict[str, str], list[str]]:
+        """
+        Ищет имена записей в кеше.
+
+        :param dimension: таблица измерения ("person" или "genre")
+        :param ids: id записей
+        :return: найденные имена по id и id, которых нет в кеше
+        """
+        found: dict[str, str] = {}
+        missing: list[str] = []
+        with self.lock:
+            for record_id in ids:
+                key = (dimension, record_id)
+                name = self.entries.get(key)
+                if name is None:
+                    missing.append(record_id)
+                    continue
+                self.entries.move_to_end(key)
+                found[record_id] = name
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(missing)
+            DIMENSION_CACHE_HIT_RATIO.set(self.hit_ratio)
+        DIMENSION_CACHE_LOOKUPS.inc(
+            len(found), dimension=dimension, result="hit",
+        )
+        DIMENSION_CACHE_LOOKUPS.inc(
+            len(missing), dimension=dimension, result="miss",
+        )
+        return found, missing
+
+    def put_many(
+        self, dimension: str, names: dict[str, str], generation: int,
+    ) -> None:
+        """
+        Добавляет имена записей в кеш, вытесняя давно не запрошенные
+        записи сверх max_bytes.
+
+        :param dimension: таблица измерения
+        :param names: имена по id
+        :param generation: поколение кеша до чтения имён из базы
+        """
+        with self.lock:
+            if generation != self.generation:
+                return
+            for record_id, name in names.items():
+                if name is None:
+                    continue
+                self._pop((dimension, record_id))
+                self.entries[(dimension, record_id)] = name
+                self.size += entry_size(record_id, name)
+            while self.size > self.max_bytes and self.entries:
+                (_, record_id), name = self.entries.popitem(last=False)
+                self.size -= entry_size(record_id, name)
+            self._observe()
+
+    def invalidate(self, dimension: str, ids: Iterable[str]) -> None:
+        """
+        Вытесняет изменённые записи из кеша.
+
+        :param dimension: таблица измерения
+        :param ids: id изменённых записей
+        """
+        with self.lock:
+            self.generation += 1
+            for record_id in ids:
+                self._pop((dimension, str(record_id)))
+            self._observe()
+
+    def _pop(self, key: tuple[str, str]) -> None:
+        """
+        Удаляет запись из кеша, если она есть.
+
+        :param key: таблица измерения и id записи
+        """
+        name = self.entries.pop(key, None)
+        if name is not None:
+            self.size -= entry_size(key[1], name)
+
+    def _observe(self) -> None:
+        """Обновляет метрики размера кеша."""
+        DIMENSION_CACHE_BYTES.set(self.size)
+        DIMENSION_CACHE_ENTRIES.set(len(self.entries))
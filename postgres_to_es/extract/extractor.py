@@ -1,26 +1,78 @@
+from collections.abc import Iterator
 from datetime import datetime
+from itertools import islice
 
 import psycopg2
 from psycopg2.extensions import connection as _connection
-from redis import Redis
 
 from extract.base import BaseExtractor
+from extract.dimensions import DIMENSIONS, DimensionCache
+from extract.shard import Shard
 from extract.sql_queries import (
+    BACKLOG_SQL,
+    DIMENSION_NAMES_BY_IDS_SQL,
     FILMWORK_BY_IDS_SQL,
+    FILMWORK_DOCUMENTS_BY_IDS_SQL,
+    FILMWORK_GENRES_BY_GENRE_IDS_SQL,
+    FILMWORK_IDS_BY_RELATED_MODIFIED_IN_SHARD_SQL,
     FILMWORK_IDS_BY_RELATED_MODIFIED_SQL,
+    FILMWORK_LINKS_BY_IDS_SQL,
+    HIGH_WATER_MARK_SQL,
+    MODIFIED_FILMWORKS_IN_SHARD_SQL,
     MODIFIED_OBJECTS_SQL,
+    PERSON_ROLES_BY_PERSON_IDS_SQL,
 )
 from logger import logger
-from models import FilmWork
-from settings import settings
+from metrics.instruments import (
+    BACKLOG,
+    ROWS,
+    observe_checkpoint,
+    timed,
+    timed_iter,
+)
+from models import FilmWork, FilmWorkDocument, FilmWorkGenres, PersonRole
 from state.base import State
-from state.storage import RedisStorage
+from state.storage import create_storage
 from utils.decorators import backoff
 
+MIN_UUID = "00000000-0000-0000-0000-000000000000"
+
+Checkpoint = tuple[str, str]
+
+DOCUMENT_ENGINES = ("aggregate", "cached")
+
 
 class PostgreSQLExtractor:
     """
     Класс для извлечения и обогащения данных из PostgreSQL.
+
+    Движок "join" получает по строке на каждое сочетание персоны и жанра
+    фильма, движок "aggregate" - одну строку на фильм с персонами
+    и жанрами, агрегированными на стороне PostgreSQL. Движок "cached"
+    тоже возвращает по строке на фильм, но запрос читает только колонки
+    film_work и id персон и жанров из таблиц связей, а имена берутся
+    из кеша измерений (см. DimensionCache) и дочитываются из базы только
+    для отсутствующих в нём персон и жанров. Изменения персон и жанров,
+    прочитанные продюсером, вытесняют их из кеша.
+
+    Размер батча таблицы можно переопределить в batch_sizes (см.
+    utils.batching), а количество записей и фильмов последнего
+    извлечённого батча сохраняется в last_rows и last_filmworks.
+
+    Если задан backlog_limit, после каждого батча считается, сколько
+    изменённых записей таблицы ещё не прочитано (не больше
+    backlog_limit), для метрики etl_backlog_rows.
+
+    Если задан шард, извлекаются только фильмы шарда: изменения
+    film_work и id фильмов, затронутых изменениями других таблиц,
+    отбираются по диапазону шарда в запросах, а фильмы не из шарда
+    отбрасываются перед запросом их данных. Изменения остальных таблиц
+    читаются целиком, так как запись, например, персоны может
+    затрагивать фильмы любых шардов.
+
+    Для изменений персон и жанров можно вместо фильмов целиком извлечь
+    только изменённые поля затронутых фильмов (см.
+    extract_related_updates).
     """
 
     def __init__(
@@ -28,134 +80,512 @@ class PostgreSQLExtractor:
         connection: _connection,
         batch_size: int,
         table_names: list[str],
+        stream: bool = False,
+        itersize: int = 1000,
+        engine: str = "join",
+        state: State | None = None,
+        backlog_limit: int = 0,
+        shard: Shard | None = None,
+        dimension_cache: DimensionCache | None = None,
     ):
         self.connection = connection
+        self.engine = engine
+        self.shard = shard
         self.batch_size = batch_size
+        self.backlog_limit = backlog_limit
+        self.stream = stream
+        self.itersize = itersize
+        self.positions: dict[str, Checkpoint] = {}
+        self.batch_sizes: dict[str, int] = {}
 
-        redis = Redis(
-            host=settings.redis_host,
-            password=settings.redis_password,
-            decode_responses=True,
-        )
-        storage = RedisStorage(redis)
-        self.state = State(storage)
+        if state is None:
+            state = State(create_storage())
+        self.state = state
         self._check_states(table_names)
 
         self.producer = BaseExtractor(
             self.connection,
             MODIFIED_OBJECTS_SQL,
+            "modified_objects",
+            ("timestamptz", "uuid", "integer"),
         )
-        self.enricher = BaseExtractor(
+        if shard is None:
+            self.shard_params: tuple[int, ...] = ()
+            self.enricher = BaseExtractor(
+                self.connection,
+                FILMWORK_IDS_BY_RELATED_MODIFIED_SQL,
+                "filmwork_ids_by_related",
+                ("uuid[]",),
+            )
+        else:
+            self.shard_params = (shard.lower, shard.upper)
+            self.shard_producer = BaseExtractor(
+                self.connection,
+                MODIFIED_FILMWORKS_IN_SHARD_SQL,
+                "modified_filmworks_in_shard",
+                ("timestamptz", "uuid", "integer", "integer", "integer"),
+            )
+            self.enricher = BaseExtractor(
+                self.connection,
+                FILMWORK_IDS_BY_RELATED_MODIFIED_IN_SHARD_SQL,
+                "filmwork_ids_by_related_in_shard",
+                ("uuid[]", "integer", "integer"),
+            )
+        self.high_water_mark_extractor = BaseExtractor(
             self.connection,
-            FILMWORK_IDS_BY_RELATED_MODIFIED_SQL,
+            HIGH_WATER_MARK_SQL,
+            "high_water_mark",
+            (),
         )
-        self.merger = BaseExtractor(
+        self.backlog_extractor = BaseExtractor(
             self.connection,
-            FILMWORK_BY_IDS_SQL,
+            BACKLOG_SQL,
+            "backlog",
+            ("timestamptz", "uuid", "integer"),
         )
+        self.dimension_cache = None
+        if engine == "cached":
+            self.dimension_cache = dimension_cache or DimensionCache()
+            self.merger = BaseExtractor(
+                self.connection,
+                FILMWORK_LINKS_BY_IDS_SQL,
+                "filmwork_links_by_ids",
+                ("uuid[]",),
+            )
+            self.dimension_extractor = BaseExtractor(
+                self.connection,
+                DIMENSION_NAMES_BY_IDS_SQL,
+                "dimension_names",
+                ("uuid[]",),
+            )
+            self.row_model = FilmWorkDocument
+        elif engine == "aggregate":
+            self.merger = BaseExtractor(
+                self.connection,
+                FILMWORK_DOCUMENTS_BY_IDS_SQL,
+                "filmwork_documents_by_ids",
+                ("uuid[]",),
+            )
+            self.row_model = FilmWorkDocument
+        else:
+            self.merger = BaseExtractor(
+                self.connection,
+                FILMWORK_BY_IDS_SQL,
+                "filmwork_by_ids",
+                ("uuid[]",),
+            )
+            self.row_model = FilmWork
+        self.related_updaters = {
+            "person": (
+                BaseExtractor(
+                    self.connection,
+                    PERSON_ROLES_BY_PERSON_IDS_SQL,
+                    "person_roles_by_person_ids",
+                    ("uuid[]",),
+                ),
+                PersonRole,
+            ),
+            "genre": (
+                BaseExtractor(
+                    self.connection,
+                    FILMWORK_GENRES_BY_GENRE_IDS_SQL,
+                    "filmwork_genres_by_genre_ids",
+                    ("uuid[]",),
+                ),
+                FilmWorkGenres,
+            ),
+        }
 
     @backoff((psycopg2.Error,))
-    def extract_data(self, table_name: str) -> list[list[str]]:
+    def extract_data(
+        self, table_name: str,
+    ) -> list[FilmWork | FilmWorkDocument] | Iterator[FilmWork]:
         """
         Запускает процесс извлечения и обогащения данных для
         определённой таблицы.
 
+        В потоковом режиме возвращает генератор: строки фильмов читаются
+        из серверного курсора по мере потребления, поэтому ошибки
+        PostgreSQL могут возникнуть уже во время итерации.
+
         :param table_name: название таблицы
-        :return: список фильмов, которых затронуло изменение записи таблицы
+        :return: фильмы, которых затронуло изменение записи таблицы
+        """
+        filmworks_ids = self.extract_filmworks_ids(table_name)
+        return self._merge_data(filmworks_ids)
+
+    @backoff((psycopg2.Error,))
+    def extract_filmworks_ids(self, table_name: str) -> list[str]:
+        """
+        Извлекает очередной батч изменений таблицы и возвращает только id
+        фильмов, которых он затронул, не запрашивая сами фильмы.
+
+        :param table_name: название таблицы
+        :return: id фильмов, которых затронуло изменение записей таблицы
         """
         modified_ids = self._produce_data(table_name)
         filmworks_ids = self._enrich_data(
             table_name,
             modified_ids,
         )
+        self.last_rows = len(modified_ids)
+        self.last_filmworks = len(filmworks_ids)
+        return filmworks_ids
+
+    @backoff((psycopg2.Error,))
+    def extract_related_updates(
+        self, table_name: str,
+    ) -> list[PersonRole] | list[FilmWorkGenres]:
+        """
+        Извлекает очередной батч изменений персон или жанров и только те
+        данные затронутых фильмов, которые зависят от этих записей,
+        без запроса фильмов целиком.
+
+        :param table_name: название таблицы ("person" или "genre")
+        :return: участие изменённых персон в фильмах или полный список
+        жанров каждого фильма, затронутого изменёнными жанрами
+        """
+        modified_ids = self._produce_data(table_name)
+        extractor, row_model = self.related_updaters[table_name]
+        with timed("enrich"):
+            rows = [
+                row_model(**row_data)
+                for row_data in extractor.extract(modified_ids)
+            ]
+        if self.shard is not None:
+            rows = [row for row in rows if self.shard.owns(row.fw_id)]
+        self.last_rows = len(modified_ids)
+        self.last_filmworks = len({row.fw_id for row in rows})
+        return rows
+
+    @backoff((psycopg2.Error,))
+    def extract_filmworks(
+        self, filmworks_ids: list[str],
+    ) -> list[FilmWork | FilmWorkDocument] | Iterator[FilmWork]:
+        """
+        Извлекает фильмы по их id.
+
+        :param filmworks_ids: id фильмов
+        :return: фильмы с необходимой для трансформации информацией
+        """
         return self._merge_data(filmworks_ids)
 
+    @backoff((psycopg2.Error,))
+    def extract_related_filmworks_ids(
+        self, table_name: str, ids: list[str],
+    ) -> list[str]:
+        """
+        Извлекает id фильмов, которых затронуло изменение переданных
+        записей таблицы.
+
+        :param table_name: название таблицы
+        :param ids: id изменённых записей таблицы
+        :return: id затронутых фильмов
+        """
+        self._invalidate_dimension(table_name, ids)
+        return self._enrich_data(table_name, ids)
+
+    @backoff((psycopg2.Error,))
+    def high_water_mark(self, table_name: str) -> Checkpoint:
+        """
+        Возвращает наибольшую позицию (modified, id) таблицы.
+
+        :param table_name: название таблицы
+        :return: позиция с modified в ISO-формате
+        """
+        rows = self.high_water_mark_extractor.extract(table_name=table_name)
+        if not rows:
+            return datetime.min.isoformat(), MIN_UUID
+        return rows[0]["modified"].isoformat(), str(rows[0]["id"])
+
     def _check_states(self, table_names: list[str]) -> None:
         """
         Проверяет стейты таблиц в хранилище, если стейт не обнаружен -
         инициализирует его с минимальным значением.
         """
+        defaults = {}
         for table_name in table_names:
-            if not self.state.get_state(f"{table_name}_modified"):
-                self.state.set_state(f"{table_name}_modified", datetime.min)
+            defaults[f"{table_name}_modified"] = datetime.min
+            defaults[f"{table_name}_id"] = MIN_UUID
+        self.state.set_defaults(defaults)
 
-    def _produce_data(self, table_name: str) -> str:
+    def _invalidate_dimension(self, table_name: str, ids: list[str]) -> None:
+        """
+        Вытесняет изменённые персоны или жанры из кеша имён.
+
+        :param table_name: название таблицы
+        :param ids: id изменённых записей таблицы
+        """
+        if self.dimension_cache is not None and table_name in DIMENSIONS:
+            self.dimension_cache.invalidate(table_name, ids)
+
+    def _produce_data(self, table_name: str) -> list[str]:
         """
         Извлекает модифицированные записи таблицы из PostgreSQL
         и обновляет буферный стейт.
 
+        Записи читаются по составному курсору (modified, id), поэтому
+        записи с одинаковым modified не пропускаются и не читаются
+        повторно, даже если их больше размера батча. Чтение начинается
+        с позиции, до которой таблица уже прочитана (см. advance), а если
+        её нет - с сохранённого стейта таблицы.
+
         :param table_name: название таблицы
-        :return: строка с id изменённых записей в виде '(id1, id2)'
+        :return: список id изменённых записей
         """
-        modified_data = self.producer.extract(
-            table_name=table_name,
-            modified=self.state.get_state(
-                f"{table_name}_modified",
-            ),
-            batch_size=self.batch_size,
+        keys = [f"{table_name}_modified", f"{table_name}_id"]
+        modified, last_id = (
+            self.positions.get(table_name)
+            or self.state.get_states(keys).values()
+        )
+        params = (
+            datetime.fromisoformat(modified),
+            last_id,
+            self.batch_sizes.get(table_name, self.batch_size),
         )
+        with timed("produce"):
+            if self.shard is not None and table_name == "film_work":
+                modified_data = self.shard_producer.extract(
+                    *params, *self.shard_params,
+                )
+            else:
+                modified_data = self.producer.extract(
+                    *params, table_name=table_name,
+                )
         if not modified_data:
+            BACKLOG.set(0, table=table_name)
             raise EOFError
 
         self.last_modified = modified_data[-1]["modified"]
+        self.last_id = modified_data[-1]["id"]
 
-
-        self.state.set_state(
-            "current_modified", self.last_modified,
+        self.state.set_states(
+            {
+                "current_modified": self.last_modified,
+                "current_id": self.last_id,
+            },
         )
         modified_ids = [row["id"] for row in modified_data]
+        self._invalidate_dimension(table_name, modified_ids)
+        ROWS.inc(len(modified_ids), table=table_name)
+        self._observe_backlog(table_name)
 
         logger.info(
-            f"Found {len(modified_ids)} modified records "
-            f"in {table_name} table",
+            "Found %s modified records in %s table",
+            len(modified_ids),
+            table_name,
         )
 
-        return f"({str(modified_ids)[1:-1]})"
+        return modified_ids
 
     def _enrich_data(
-        self, table_name: str, modified_ids: str,
-    ) -> str:
+        self, table_name: str, modified_ids: list[str],
+    ) -> list[str]:
         """
         Забирает из базы список фильмов, которых затронуло изменение записей
         в таблице.
 
+        Фильмы отбираются полусоединением (EXISTS), поэтому фильм, общий
+        для нескольких изменённых записей, возвращается один раз.
+
         :param table_name: название таблицы
-        :param modified_ids: id изменённых записей таблице в виде '(id1, id2)'
+        :param modified_ids: id изменённых записей таблицы
         :return: id фильмов, которых затронуло изменение записей
         """
         if table_name == "film_work":
             return modified_ids
 
-        filmwork_ids = self.enricher.extract(
-            table_name=table_name,
-            modified_ids=modified_ids,
-        )
-        modified_ids = [row["id"] for row in filmwork_ids]
-        return f"({str(modified_ids)[1:-1]})"
+        with timed("enrich"):
+            filmwork_ids = self.enricher.extract(
+                modified_ids,
+                *self.shard_params,
+                table_name=table_name,
+            )
+        return [row["id"] for row in filmwork_ids]
 
     def _merge_data(
         self,
-        filmworks_ids: str,
-    ) -> list[FilmWork]:
+        filmworks_ids: list[str],
+    ) -> list[FilmWork | FilmWorkDocument] | Iterator[FilmWork]:
         """
         Обогащает raw id данные.
 
-        :param filmworks_ids: id изменённых записей таблице в виде '(id1, id2)'
-        :return: список фильмов с необходимой для трансформации информацией.
+        :param filmworks_ids: id фильмов, которых затронуло изменение
+        :return: список (или генератор в потоковом режиме) фильмов
+        с необходимой для трансформации информацией.
+        """
+        if self.shard is not None:
+            filmworks_ids = [
+                filmwork_id
+                for filmwork_id in filmworks_ids
+                if self.shard.owns(filmwork_id)
+            ]
+        if self.stream:
+            return self._stream_merge_data(filmworks_ids)
+
+        with timed("merge"):
+            rows = self.merger.extract(filmworks_ids)
+        if self.engine == "cached":
+            return self._resolve_names(rows)
+        return [self.row_model(**row_data) for row_data in rows]
+
+    def _stream_merge_data(
+        self, filmworks_ids: list[str],
+    ) -> Iterator[FilmWork | FilmWorkDocument]:
+        """
+        Построчно обогащает raw id данные через серверный курсор.
+
+        :param filmworks_ids: id фильмов, которых затронуло изменение
+        :yield: фильмы с необходимой для трансформации информацией,
+        строки одного фильма идут подряд.
+        """
+        rows = timed_iter(
+            "merge", self.merger.stream(self.itersize, filmworks_ids),
+        )
+        if self.engine == "cached":
+            while chunk := list(islice(rows, self.itersize)):
+                yield from self._resolve_names(chunk)
+            return
+        for row_data in rows:
+            yield self.row_model(**row_data)
+
+    def _resolve_names(self, rows: list) -> list[FilmWorkDocument]:
         """
+        Подставляет имена персон и жанров в строки фильмов с id персон
+        и жанров. Жанры упорядочиваются по названию без дублей, как
+        в FILMWORK_DOCUMENTS_BY_IDS_SQL, чтобы документ и его дайджест
+        не зависели от движка извлечения.
+
+        :param rows: строки фильмов запроса FILMWORK_LINKS_BY_IDS_SQL
+        :return: фильмы с агрегированными персонами и жанрами
+        """
+        with timed("resolve"):
+            persons = self._dimension_names(
+                "person",
+                {
+                    person["id"]
+                    for row_data in rows
+                    for person in row_data["persons"]
+                },
+            )
+            genres = self._dimension_names(
+                "genre",
+                {
+                    genre_id
+                    for row_data in rows
+                    for genre_id in row_data["genre_ids"]
+                },
+            )
+        logger.debug(
+            "Dimension cache: %s, hit ratio %.2f%%",
+            self.dimension_cache.stats,
+            self.dimension_cache.hit_ratio * 100,
+        )
         return [
-            FilmWork(**dict(row_data))
-            for row_data
-            in self.merger.extract(filmworks_ids=filmworks_ids)
+            FilmWorkDocument(
+                fw_id=row_data["fw_id"],
+                title=row_data["title"],
+                description=row_data["description"],
+                persons=[
+                    {
+                        "id": person["id"],
+                        "full_name": persons.get(person["id"]),
+                        "role": person["role"],
+                    }
+                    for person in row_data["persons"]
+                ],
+                genres=sorted(
+                    {
+                        genres[genre_id]
+                        for genre_id in row_data["genre_ids"]
+                        if genre_id in genres
+                    },
+                ),
+                rating=row_data["rating"],
+                version=row_data["version"],
+            )
+            for row_data in rows
         ]
 
-    def update_state(self, table_name: str) -> None:
+    def _dimension_names(
+        self, dimension: str, ids: set[str],
+    ) -> dict[str, str]:
         """
-        Извлекает из буферного стейта состояние и обновляет им стейт таблицы
+        Возвращает имена записей измерения из кеша, дочитывая
+        отсутствующие в нём из базы.
+
+        :param dimension: таблица измерения ("person" или "genre")
+        :param ids: id записей
+        :return: имена по id
+        """
+        names, missing = self.dimension_cache.get_many(dimension, ids)
+        if not missing:
+            return names
+        generation = self.dimension_cache.generation
+        fetched = {
+            row_data["id"]: row_data["name"]
+            for row_data in self.dimension_extractor.extract(
+                missing,
+                table_name=dimension,
+                name_column=DIMENSIONS[dimension],
+            )
+        }
+        self.dimension_cache.put_many(dimension, fetched, generation)
+        names.update(fetched)
+        return names
+
+    def advance(self, table_name: str) -> Checkpoint:
+        """
+        Сдвигает позицию чтения таблицы на последний извлечённый батч,
+        не дожидаясь обновления стейта.
+
+        Позволяет извлекать следующий батч, пока предыдущий ещё
+        загружается в ES.
 
         :param table_name: название таблицы
+        :return: позиция (modified, id), до которой прочитана таблица
+        """
+        self.positions[table_name] = (
+            self.last_modified.isoformat(),
+            str(self.last_id),
+        )
+        return self.positions[table_name]
+
+    def update_state(
+        self, table_name: str, checkpoint: Checkpoint | None = None,
+    ) -> None:
         """
-        self.state.set_state(
-            f"{table_name}_modified",
-            self.state.get_state("current_modified"),
+        Обновляет стейт таблицы переданной позицией, а если она не
+        передана - позицией из буферного стейта.
+
+        :param table_name: название таблицы
+        :param checkpoint: позиция (modified, id), до которой таблица
+        загружена в ES
+        """
+        modified, last_id = checkpoint or self.state.get_states(
+            ["current_modified", "current_id"],
+        ).values()
+        self.state.set_states(
+            {
+                f"{table_name}_modified": modified,
+                f"{table_name}_id": last_id,
+            },
+        )
+        observe_checkpoint(table_name, modified)
+
+    def _observe_backlog(self, table_name: str) -> None:
+        """
+        Обновляет метрику необработанных изменений таблицы после
+        извлечённого батча, если задан backlog_limit.
+
+        :param table_name: название таблицы
+        """
+        if not self.backlog_limit:
+            return
+        rows = self.backlog_extractor.extract(
+            self.last_modified,
+            self.last_id,
+            self.backlog_limit,
+            table_name=table_name,
         )
+        BACKLOG.set(rows[0]["backlog"], table=table_name)
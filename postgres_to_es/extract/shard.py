@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+SHARD_KEY_SPACE = 65536
+
+
+@dataclass(frozen=True, slots=True)
+class Shard:
+    """
+    Диапазон хешей id фильмов, обрабатываемый одним воркером.
+
+    Ключ шарда фильма - первые 16 бит его UUID, которые у случайных
+    UUID распределены равномерно. Пространство ключей делится на count
+    равных диапазонов, шард index владеет диапазоном [lower, upper].
+    В SQL тот же ключ вычисляется выражением
+    get_byte(uuid_send(id), 0) * 256 + get_byte(uuid_send(id), 1).
+    """
+
+    index: int
+    count: int
+
+    @property
+    def lower(self) -> int:
+        return self.index * SHARD_KEY_SPACE // self.count
+
+    @property
+    def upper(self) -> int:
+        return (self.index + 1) * SHARD_KEY_SPACE // self.count - 1
+
+    @property
+    def name(self) -> str:
+        return f"shard_{self.index}_of_{self.count}"
+
+    def owns(self, filmwork_id: str) -> bool:
+        """
+        Проверяет, принадлежит ли фильм шарду.
+
+        :param filmwork_id: id фильма
+        :return: True, если ключ фильма попадает в диапазон шарда
+        """
+        return self.lower <= int(str(filmwork_id)[:4], 16) <= self.upper
@@ -1,26 +1,35 @@
 MODIFIED_OBJECTS_SQL = """
     SELECT id, modified
     FROM content.{table_name}
-    WHERE modified > '{modified}'
-    ORDER BY modified
-    LIMIT {batch_size};
+    WHERE (modified, id) > ($1::timestamptz, $2::uuid)
+    ORDER BY modified, id
+    LIMIT $3::integer;
 """
 
 FILMWORK_IDS_BY_RELATED_MODIFIED_SQL = """
     SELECT fw.id
     FROM content.film_work fw
-    LEFT JOIN content.{table_name}_film_work tfw ON tfw.film_work_id = fw.id
-    WHERE tfw.{table_name}_id IN {modified_ids}
-    ORDER BY fw.modified;
+    WHERE EXISTS (
+        SELECT 1
+        FROM content.{table_name}_film_work tfw
+        WHERE tfw.film_work_id = fw.id
+            AND tfw.{table_name}_id = ANY($1::uuid[])
+    )
+    ORDER BY fw.modified, fw.id;
 """
 
 
+# Версия документа - момент начала запроса на часах PostgreSQL
+# в микросекундах. Запрос, начатый позже, видит все изменения, видимые
+# запросу, начатому раньше, поэтому документ с большей версией не старее.
 FILMWORK_BY_IDS_SQL = """
     SELECT
         fw.id as fw_id,
         fw.title,
         fw.description,
         fw.rating,
+        (extract(epoch FROM statement_timestamp()) * 1000000)::bigint
+            AS version,
         pfw.role,
         p.full_name,
         p.id,
@@ -30,5 +39,167 @@ FILMWORK_BY_IDS_SQL = """
     LEFT JOIN content.person p ON p.id = pfw.person_id
     LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
     LEFT JOIN content.genre g ON g.id = gfw.genre_id
-    WHERE fw.id IN {filmworks_ids};
+    WHERE fw.id = ANY($1::uuid[])
+    ORDER BY fw.id;
+"""
+
+
+FILMWORK_DOCUMENTS_BY_IDS_SQL = """
+    SELECT
+        fw.id as fw_id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        (extract(epoch FROM statement_timestamp()) * 1000000)::bigint
+            AS version,
+        COALESCE(
+            (
+                SELECT json_agg(
+                    json_build_object(
+                        'id', p.id,
+                        'full_name', p.full_name,
+                        'role', pfw.role
+                    )
+                )
+                FROM content.person_film_work pfw
+                JOIN content.person p ON p.id = pfw.person_id
+                WHERE pfw.film_work_id = fw.id
+            ),
+            '[]'
+        ) AS persons,
+        COALESCE(
+            (
+                SELECT array_agg(DISTINCT g.name::text COLLATE "C")
+                FROM content.genre_film_work gfw
+                JOIN content.genre g ON g.id = gfw.genre_id
+                WHERE gfw.film_work_id = fw.id
+            ),
+            ARRAY[]::text[]
+        ) AS genres
+    FROM content.film_work fw
+    WHERE fw.id = ANY($1::uuid[])
+    ORDER BY fw.id;
+"""
+
+
+FILMWORK_IDS_PAGE_SQL = """
+    SELECT id
+    FROM content.film_work
+    WHERE id > $1::uuid
+    ORDER BY id
+    LIMIT $2::integer;
+"""
+
+HIGH_WATER_MARK_SQL = """
+    SELECT modified, id
+    FROM content.{table_name}
+    WHERE modified IS NOT NULL
+    ORDER BY modified DESC, id DESC
+    LIMIT 1;
+"""
+
+BACKLOG_SQL = """
+    SELECT count(*) AS backlog
+    FROM (
+        SELECT 1
+        FROM content.{table_name}
+        WHERE (modified, id) > ($1::timestamptz, $2::uuid)
+        LIMIT $3::integer
+    ) AS pending;
+"""
+
+MODIFIED_FILMWORKS_IN_SHARD_SQL = """
+    SELECT id, modified
+    FROM content.film_work
+    WHERE (modified, id) > ($1::timestamptz, $2::uuid)
+        AND get_byte(uuid_send(id), 0) * 256 + get_byte(uuid_send(id), 1)
+            BETWEEN $4::integer AND $5::integer
+    ORDER BY modified, id
+    LIMIT $3::integer;
+"""
+
+FILMWORK_IDS_BY_RELATED_MODIFIED_IN_SHARD_SQL = """
+    SELECT fw.id
+    FROM content.film_work fw
+    WHERE EXISTS (
+        SELECT 1
+        FROM content.{table_name}_film_work tfw
+        WHERE tfw.film_work_id = fw.id
+            AND tfw.{table_name}_id = ANY($1::uuid[])
+    )
+        AND get_byte(uuid_send(fw.id), 0) * 256
+            + get_byte(uuid_send(fw.id), 1)
+            BETWEEN $2::integer AND $3::integer
+    ORDER BY fw.modified, fw.id;
+"""
+
+PERSON_ROLES_BY_PERSON_IDS_SQL = """
+    SELECT
+        pfw.film_work_id AS fw_id,
+        p.id,
+        p.full_name,
+        pfw.role,
+        CASE WHEN pfw.role = 'director' THEN ARRAY(
+            SELECT dp.full_name::text
+            FROM content.person_film_work dpfw
+            JOIN content.person dp ON dp.id = dpfw.person_id
+            WHERE dpfw.film_work_id = pfw.film_work_id
+                AND dpfw.role = 'director'
+        ) ELSE ARRAY[]::text[] END AS directors
+    FROM content.person_film_work pfw
+    JOIN content.person p ON p.id = pfw.person_id
+    WHERE pfw.person_id = ANY($1::uuid[])
+    ORDER BY pfw.film_work_id;
+"""
+
+FILMWORK_GENRES_BY_GENRE_IDS_SQL = """
+    SELECT
+        gfw.film_work_id AS fw_id,
+        array_agg(DISTINCT g.name::text COLLATE "C") AS genres
+    FROM content.genre_film_work gfw
+    JOIN content.genre g ON g.id = gfw.genre_id
+    WHERE gfw.film_work_id IN (
+        SELECT film_work_id
+        FROM content.genre_film_work
+        WHERE genre_id = ANY($1::uuid[])
+    )
+    GROUP BY gfw.film_work_id
+    ORDER BY gfw.film_work_id;
+"""
+
+FILMWORK_LINKS_BY_IDS_SQL = """
+    SELECT
+        fw.id as fw_id,
+        fw.title,
+        fw.description,
+        fw.rating,
+        (extract(epoch FROM statement_timestamp()) * 1000000)::bigint
+            AS version,
+        COALESCE(
+            (
+                SELECT json_agg(
+                    json_build_object('id', pfw.person_id, 'role', pfw.role)
+                )
+                FROM content.person_film_work pfw
+                WHERE pfw.film_work_id = fw.id
+            ),
+            '[]'
+        ) AS persons,
+        COALESCE(
+            (
+                SELECT array_agg(DISTINCT gfw.genre_id::text)
+                FROM content.genre_film_work gfw
+                WHERE gfw.film_work_id = fw.id
+            ),
+            ARRAY[]::text[]
+        ) AS genre_ids
+    FROM content.film_work fw
+    WHERE fw.id = ANY($1::uuid[])
+    ORDER BY fw.id;
+"""
+
+DIMENSION_NAMES_BY_IDS_SQL = """
+    SELECT id::text AS id, {name_column} AS name
+    FROM content.{table_name}
+    WHERE id = ANY($1::uuid[]);
 """
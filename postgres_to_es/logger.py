@@ -1,16 +1,38 @@
+import atexit
+import copy
 import logging
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from queue import SimpleQueue
 
-logging.basicConfig(
-        level=logging.INFO,
-        format=(
-            "%(asctime)s, %(levelname)s, %(message)s, "
-            "%(lineno)s"
-        ),
-        stream=sys.stdout,
-    )
-logger = logging.getLogger(__name__)
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Кладёт записи в очередь без применения форматтеров.
+
+    Стандартный QueueHandler форматирует запись целиком в потоке,
+    который её записал. Здесь очередь читает поток того же процесса,
+    поэтому в записавшем потоке только подставляются аргументы
+    сообщения - пока они не изменились, - а форматтеры и запись
+    в stdout и в файл выполняются в потоке QueueListener, и ETL
+    не ждёт записи. Записи отключённых уровней до обработчика
+    не доходят и не форматируются вовсе.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s, %(levelname)s, %(message)s, %(lineno)s",
+    ),
+)
 
 file_handler = logging.FileHandler(
     Path(__file__).resolve().parent / "postgres_to_es.log",
@@ -19,6 +41,17 @@ formatter = logging.Formatter(
     "%(asctime)s - %(levelname)s - %(message)s",
 )
 file_handler.setFormatter(formatter)
+file_handler.addFilter(logging.Filter(__name__))
+
+log_queue: SimpleQueue = SimpleQueue()
+listener = QueueListener(
+    log_queue, stream_handler, file_handler, respect_handler_level=True,
+)
+listener.start()
+atexit.register(listener.stop)
 
+logging.basicConfig(
+    level=logging.INFO, handlers=[LazyQueueHandler(log_queue)],
+)
+logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-logger.addHandler(file_handler)
@@ -1,34 +1,409 @@
+import argparse
+import asyncio
+from contextlib import ExitStack
+from typing import Any
+
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
+from redis import Redis
 
+from changefeed import ChangeFeedETL
+from coalesce import CoalescingETL
+from digest.base import DigestFilter
+from digest.storage import FileDigestStorage, RedisDigestStorage
 from etl import ETL
+from extract.dimensions import DimensionCache
 from logger import logger
+from metrics.instruments import registry
+from metrics.server import serve_metrics
+from pipeline import PipelineETL
+from reindex import Reindexer
+from scheduler import ParallelETL
 from settings import settings
-from utils.managers import open_postgres_db
+from sharding import ShardedETL
+from source.base import BaseChangeSource
+from source.notify import NotifySource
+from source.replication import Wal2JsonSource
+from spooling import SpoolingETL
+from state.base import State
+from state.storage import create_storage
+from upload.spool import Spool
+from utils.batching import BatchLimits
+from utils.managers import (
+    PostgresPool,
+    open_postgres_db,
+    open_postgres_pool,
+)
 
-if __name__ == "__main__":
 
-    logger.info("Script running")
+def create_digest_filter() -> DigestFilter | None:
+    """
+    Создаёт фильтр неизменённых документов по настройкам.
+
+    :return: фильтр дайджестов или None, если хранилище не задано
+    """
+    if settings.digest_storage == "file":
+        storage = FileDigestStorage(settings.digest_path)
+    elif settings.digest_storage == "redis":
+        storage = RedisDigestStorage(
+            Redis(
+                host=settings.redis_host,
+                password=settings.redis_password,
+                decode_responses=True,
+            ),
+        )
+    else:
+        return None
+    return DigestFilter(storage, settings.bulk_chunk_size)
+
+
+def create_state(stack: ExitStack) -> State:
+    """
+    Создаёт стейт в хранилище, выбранном в настройках. Хранилище
+    закрывается при выходе из стека, записывая отложенные изменения.
+
+    :param stack: стек контекстов для открываемых соединений
+    :return: стейт ETL
+    """
+    storage = create_storage()
+    stack.callback(storage.close)
+    return State(storage)
+
+
+def create_batch_limits() -> BatchLimits | None:
+    """
+    Создаёт цели и границы адаптивного размера батча по настройкам.
+
+    :return: границы или None, если размер батча не подбирается
+    """
+    if not settings.adaptive_batch:
+        return None
+    return BatchLimits(
+        target_latency=settings.adaptive_target_latency,
+        target_bytes=settings.adaptive_target_bytes,
+        min_batch_size=settings.adaptive_min_batch_size,
+        max_batch_size=settings.adaptive_max_batch_size,
+        min_chunk_size=settings.adaptive_min_chunk_size,
+        max_chunk_size=settings.adaptive_max_chunk_size,
+    )
+
+
+def create_dimension_cache() -> DimensionCache | None:
+    """
+    Создаёт кеш имён персон и жанров, общий для воркеров процесса.
+
+    :return: кеш или None, если движок извлечения его не использует
+    """
+    if settings.extract_engine != "cached":
+        return None
+    return DimensionCache(settings.dimension_cache_max_bytes)
+
+
+def get_etl_options(stack: ExitStack) -> dict[str, Any]:
+    """
+    Собирает необязательные параметры ETL из настроек.
 
-    DSN = {
-        "dbname": settings.postgres_db,
-        "user": settings.postgres_user,
-        "password": settings.postgres_password,
-        "host": settings.postgres_host,
-        "port": settings.postgres_port,
+    :param stack: стек контекстов для открываемых соединений
+    :return: именованные параметры ETL
+    """
+    return {
+        "state": create_state(stack),
+        "stream": settings.extract_stream,
+        "itersize": settings.extract_itersize,
+        "bulk_chunk_size": settings.bulk_chunk_size,
+        "engine": settings.extract_engine,
+        "upload_mode": settings.upload_mode,
+        "max_chunk_bytes": settings.bulk_max_chunk_bytes,
+        "upload_threads": settings.upload_threads,
+        "refresh": settings.elastic_refresh,
+        "max_retries": settings.bulk_max_retries,
+        "digest_filter": create_digest_filter(),
+        "backlog_limit": (
+            settings.metrics_backlog_limit if settings.metrics_port else 0
+        ),
+        "batch_limits": create_batch_limits(),
+        "merge_batch_size": settings.merge_batch_size,
+        "partial_updates": settings.partial_updates,
+        "dimension_cache": create_dimension_cache(),
     }
-    es_host = f"http://{settings.elastic_host}:{settings.elastic_port}"
 
-    with (
-        open_postgres_db(DSN) as pg_connection,
-        Elasticsearch(es_host) as es_connection,
-    ):
+
+def open_pool(stack: ExitStack) -> PostgresPool:
+    """
+    Открывает пул соединений с PostgreSQL, общий для воркеров.
+
+    :param stack: стек контекстов для открываемых соединений
+    :return: пул соединений
+    """
+    workers = len(settings.table_names)
+    if settings.run_mode == "sharded":
+        workers *= settings.shard_count
+    return stack.enter_context(
+        open_postgres_pool(
+            settings.postgres_dsn,
+            max(settings.postgres_pool_size, workers),
+            settings.postgres_health_check_interval,
+        ),
+    )
+
+
+def create_change_source(stack: ExitStack) -> BaseChangeSource:
+    """
+    Создаёт источник изменений, выбранный в настройках, на отдельном
+    соединении с PostgreSQL.
+
+    :param stack: стек контекстов для открываемых соединений
+    :return: источник изменений
+    """
+    if settings.change_source == "wal2json":
+        source = Wal2JsonSource(
+            settings.postgres_dsn, settings.replication_slot,
+        )
+        stack.callback(source.close)
+        return source
+    return NotifySource(
+        stack.enter_context(open_postgres_db(settings.postgres_dsn)),
+    )
+
+
+def run(stack: ExitStack, es_connection: Elasticsearch) -> None:
+    """
+    Запускает инкрементальную загрузку изменений в выбранном режиме.
+
+    :param stack: стек контекстов для открываемых соединений
+    :param es_connection: соединение с ElasticSearch
+    """
+    if settings.run_mode == "async":
+        asyncio.run(run_async(stack))
+        return
+
+    etl_options = get_etl_options(stack)
+    etl_args = (
+        settings.table_names,
+        settings.batch_size,
+        settings.elastic_index,
+    )
+    pg_pool = open_pool(stack)
+    if settings.run_mode == "parallel":
+        pg_connections = [
+            pg_pool.connection() for _ in settings.table_names
+        ]
+        logger.info(
+            "PostgreSQL and ElasticSearch connect success",
+        )
+        etl = ParallelETL(
+            pg_connections,
+            es_connection,
+            *etl_args,
+            min_sleep_time=settings.min_sleep_time,
+            **etl_options,
+        )
+    elif settings.run_mode == "sharded":
+        logger.info(
+            "PostgreSQL and ElasticSearch connect success",
+        )
+        etl = ShardedETL(
+            pg_pool,
+            es_connection,
+            *etl_args,
+            shard_count=settings.shard_count,
+            lease_ttl=settings.shard_lease_ttl,
+            worker_id=settings.shard_worker_id,
+            min_sleep_time=settings.min_sleep_time,
+            **etl_options,
+        )
+    else:
+        pg_connection = pg_pool.connection()
         logger.info(
             "PostgreSQL and ElasticSearch connect success",
         )
-        ETL(
-            pg_connection,
+        if settings.run_mode == "pipeline":
+            etl = PipelineETL(
+                pg_connection,
+                es_connection,
+                *etl_args,
+                queue_size=settings.pipeline_queue_size,
+                transform_workers=settings.pipeline_transform_workers,
+                upload_workers=settings.pipeline_upload_workers,
+                **etl_options,
+            )
+        elif settings.run_mode == "changefeed":
+            etl = ChangeFeedETL(
+                pg_connection,
+                es_connection,
+                *etl_args,
+                source=create_change_source(stack),
+                **etl_options,
+            )
+        elif settings.run_mode == "spool":
+            etl = SpoolingETL(
+                pg_connection,
+                es_connection,
+                *etl_args,
+                spool=Spool(
+                    settings.spool_path,
+                    settings.spool_segment_bytes,
+                    settings.spool_max_bytes,
+                    settings.spool_fsync,
+                    settings.spool_segment_seconds,
+                ),
+                **etl_options,
+            )
+        elif settings.run_mode == "coalesce":
+            etl = CoalescingETL(
+                pg_connection,
+                es_connection,
+                *etl_args,
+                window_time=settings.coalesce_window_time,
+                window_size=settings.coalesce_window_size,
+                **etl_options,
+            )
+        else:
+            etl = ETL(
+                pg_connection, es_connection, *etl_args, **etl_options,
+            )
+
+    etl(settings.loop_sleep_time)
+
+
+async def run_async(stack: ExitStack) -> None:
+    """
+    Запускает инкрементальную загрузку изменений асинхронным ETL
+    на пуле соединений PostgreSQL и AsyncElasticsearch.
+
+    asyncpg и aiohttp (для AsyncElasticsearch) устанавливаются
+    с необязательной группой зависимостей async и импортируются
+    только в этом режиме.
+
+    :param stack: стек контекстов для открываемых соединений
+    """
+    import asyncpg
+    from elasticsearch import AsyncElasticsearch
+
+    from async_etl import AsyncETL
+    from extract.async_extractor import init_connection
+
+    etl_options = get_etl_options(stack)
+    dsn = dict(settings.postgres_dsn)
+    dsn["database"] = dsn.pop("dbname")
+    async with (
+        asyncpg.create_pool(
+            **dsn,
+            min_size=1,
+            max_size=settings.async_concurrency + len(settings.table_names),
+            init=init_connection,
+        ) as pg_pool,
+        AsyncElasticsearch(
+            settings.elastic_url, **settings.elastic_options,
+        ) as es_connection,
+    ):
+        logger.info("PostgreSQL pool and ElasticSearch connect success")
+        etl = AsyncETL(
+            pg_pool,
             es_connection,
             settings.table_names,
             settings.batch_size,
             settings.elastic_index,
-        )(settings.loop_sleep_time)
+            etl_options["state"],
+            engine=settings.extract_engine,
+            refresh=settings.elastic_refresh,
+            digest_filter=etl_options["digest_filter"],
+            concurrency=settings.async_concurrency,
+            filmworks_batch_size=settings.async_filmworks_batch_size,
+            backlog_limit=etl_options["backlog_limit"],
+        )
+        await etl(settings.loop_sleep_time)
+
+
+def reindex(stack: ExitStack, es_connection: Elasticsearch) -> None:
+    """
+    Полностью переиндексирует фильмы в новый индекс и переключает
+    на него алиас.
+
+    Инкрементальная загрузка (команда run) на время переиндексации
+    должна быть остановлена: она пишет в старый индекс со своим стейтом,
+    и её изменения пропадут после переключения алиаса или будут
+    загружены повторно со стейта, перезаписанного переиндексацией.
+
+    :param stack: стек контекстов для открываемых соединений
+    :param es_connection: соединение с ElasticSearch
+    """
+    pg_connection = open_pool(stack).connection()
+    etl_options = get_etl_options(stack)
+    Reindexer(
+        pg_connection,
+        es_connection,
+        settings.table_names,
+        settings.reindex_batch_size,
+        settings.elastic_index,
+        settings.elastic_schema_path,
+        **etl_options,
+    )()
+
+
+def seed_digests(stack: ExitStack, es_connection: Elasticsearch) -> None:
+    """
+    Заполняет хранилище дайджестов документами, уже находящимися в индексе.
+
+    :param stack: стек контекстов для открываемых соединений
+    :param es_connection: соединение с ElasticSearch
+    """
+    digest_filter = create_digest_filter()
+    if digest_filter is None:
+        raise SystemExit("DIGEST_STORAGE is not configured.")
+
+    total = digest_filter.seed(
+        hit["_source"]
+        for hit in scan(es_connection, index=settings.elastic_index)
+    )
+    logger.info("%s document digests seeded from index", total)
+
+
+COMMANDS = {
+    "run": run,
+    "reindex": reindex,
+    "seed-digests": seed_digests,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Перенос фильмов из PostgreSQL в ElasticSearch",
+        epilog=(
+            "Перед reindex остановите все процессы run: переиндексация "
+            "не согласуется с инкрементальной загрузкой и по завершении "
+            "перезаписывает её стейт."
+        ),
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="run",
+        choices=COMMANDS,
+        help=(
+            "run - инкрементальная загрузка; reindex - полная "
+            "переиндексация (только при остановленном run); "
+            "seed-digests - заполнение дайджестов из индекса"
+        ),
+    )
+    args = parser.parse_args()
+
+    logger.info("Script running")
+
+    with (
+        ExitStack() as stack,
+        Elasticsearch(
+            settings.elastic_url, **settings.elastic_options,
+        ) as es_connection,
+    ):
+        if settings.metrics_port:
+            stack.enter_context(
+                serve_metrics(
+                    settings.metrics_host, settings.metrics_port, registry,
+                ),
+            )
+            logger.info(
+                "Metrics served on http://%s:%s/metrics",
+                settings.metrics_host,
+                settings.metrics_port,
+            )
+        COMMANDS[args.command](stack, es_connection)
@@ -0,0 +1,225 @@
+import math
+import time
+from collections.abc import Iterator
+from threading import Lock
+
+Labels = tuple[str, ...]
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def format_value(value: float) -> str:
+    """
+    Форматирует значение сэмпла в текстовом формате Prometheus.
+
+    :param value: значение
+    :return: строковое представление значения
+    """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def format_labels(names: Labels, values: Labels) -> str:
+    """
+    Форматирует метки сэмпла в текстовом формате Prometheus.
+
+    :param names: имена меток
+    :param values: значения меток
+    :return: метки в фигурных скобках или пустая строка
+    """
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values, strict=True)
+    )
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    """
+    Базовый класс метрики с метками.
+
+    Значения хранятся по кортежу значений меток и изменяются под
+    блокировкой, поэтому метрику можно обновлять из нескольких потоков.
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Labels = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = Lock()
+        self.values: dict[Labels, float] = {}
+
+    def _key(self, labels: dict[str, str]) -> Labels:
+        """
+        Возвращает кортеж значений меток в порядке их объявления.
+
+        :param labels: значения меток по именам
+        :return: ключ значения метрики
+        """
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[tuple[str, Labels, Labels, float]]:
+        """
+        Возвращает сэмплы метрики.
+
+        :yield: имя сэмпла, имена меток, значения меток и значение
+        """
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield self.name, self.labelnames, key, value
+
+    def render(self) -> str:
+        """
+        Форматирует метрику в текстовом формате Prometheus.
+
+        :return: описание, тип и сэмплы метрики
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(
+            f"{name}{format_labels(names, values)} {format_value(value)}"
+            for name, names, values, value in self.samples()
+        )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Увеличивает счётчик.
+
+        :param amount: величина увеличения
+        :kwargs **labels: значения меток
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Значение, которое может как расти, так и уменьшаться."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        Устанавливает значение.
+
+        :param value: новое значение
+        :kwargs **labels: значения меток
+        """
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class AgeGauge(Gauge):
+    """
+    Gauge, хранящий момент времени и отдающий его возраст в секундах
+    на момент сбора метрик, поэтому возраст растёт и между обновлениями.
+    """
+
+    def samples(self) -> Iterator[tuple[str, Labels, Labels, float]]:
+        now = time.time()
+        for name, names, values, value in super().samples():
+            yield name, names, values, now - value
+
+
+class Histogram(Metric):
+    """Распределение наблюдаемых значений по корзинам."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*buckets, math.inf)
+        self.counts: dict[Labels, list[int]] = {}
+        self.sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Добавляет наблюдение в распределение.
+
+        :param value: наблюдаемое значение
+        :kwargs **labels: значения меток
+        """
+        key = self._key(labels)
+        with self.lock:
+            counts = self.counts.setdefault(key, [0] * len(self.buckets))
+            for number, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[number] += 1
+                    break
+            self.sums[key] = self.sums.get(key, 0) + value
+
+    def samples(self) -> Iterator[tuple[str, Labels, Labels, float]]:
+        with self.lock:
+            values = [
+                (key, list(counts), self.sums[key])
+                for key, counts in self.counts.items()
+            ]
+        names = (*self.labelnames, "le")
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts, strict=True):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    names,
+                    (*key, format_value(bound)),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", self.labelnames, key, total
+            yield f"{self.name}_count", self.labelnames, key, cumulative
+
+
+class Registry:
+    """Набор метрик, отдаваемых одним эндпоинтом."""
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Добавляет метрику в набор.
+
+        :param metric: метрика
+        :return: та же метрика
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Форматирует все метрики в текстовом формате Prometheus.
+
+        :return: текст для ответа эндпоинта
+        """
+        return "".join(metric.render() for metric in self.metrics)
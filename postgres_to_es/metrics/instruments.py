@@ -0,0 +1,175 @@
+"""
+Метрики ETL.
+
+Скорость извлечения записей и загрузки документов считается
+в Prometheus по счётчикам, например rate(etl_rows_total[1m]).
+"""
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+
+from metrics.base import AgeGauge, Counter, Gauge, Histogram, Registry
+
+registry = Registry()
+
+STAGE_DURATION = registry.register(
+    Histogram(
+        "etl_stage_duration_seconds",
+        "Duration of ETL stages.",
+        ("stage",),
+    ),
+)
+ROWS = registry.register(
+    Counter(
+        "etl_rows_total",
+        "Modified records read from tables.",
+        ("table",),
+    ),
+)
+DOCUMENTS = registry.register(
+    Counter(
+        "etl_documents_total",
+        "Documents uploaded to Elasticsearch.",
+    ),
+)
+REPLICATION_LAG = registry.register(
+    AgeGauge(
+        "etl_replication_lag_seconds",
+        "Time since the modified timestamp of the last loaded record.",
+        ("table",),
+    ),
+)
+BACKLOG = registry.register(
+    Gauge(
+        "etl_backlog_rows",
+        "Modified records not read yet, capped by the backlog limit.",
+        ("table",),
+    ),
+)
+BATCH_SIZE = registry.register(
+    Gauge(
+        "etl_batch_size",
+        "Current batch size of table changes.",
+        ("table",),
+    ),
+)
+RETRIES = registry.register(
+    Counter(
+        "etl_retries_total",
+        "Retries made by the backoff decorators.",
+        ("function", "exception"),
+    ),
+)
+DIMENSION_CACHE_LOOKUPS = registry.register(
+    Counter(
+        "etl_dimension_cache_lookups_total",
+        "Person and genre name lookups in the dimension cache.",
+        ("dimension", "result"),
+    ),
+)
+DIMENSION_CACHE_HIT_RATIO = registry.register(
+    Gauge(
+        "etl_dimension_cache_hit_ratio",
+        "Share of dimension cache lookups found in the cache.",
+    ),
+)
+DIMENSION_CACHE_BYTES = registry.register(
+    Gauge(
+        "etl_dimension_cache_bytes",
+        "Estimated memory used by the dimension cache.",
+    ),
+)
+DIMENSION_CACHE_ENTRIES = registry.register(
+    Gauge(
+        "etl_dimension_cache_entries",
+        "Names held in the dimension cache.",
+    ),
+)
+COALESCE_FILMWORKS = registry.register(
+    Counter(
+        "etl_coalesce_filmworks_total",
+        "Films affected by coalescing windows: indexed or coalesced "
+        "into another change of the same window.",
+        ("result",),
+    ),
+)
+DIGEST_DOCUMENTS = registry.register(
+    Counter(
+        "etl_digest_documents_total",
+        "Documents checked by the digest filter: changed or skipped.",
+        ("result",),
+    ),
+)
+DIGEST_SKIP_RATIO = registry.register(
+    Gauge(
+        "etl_digest_skip_ratio",
+        "Share of unchanged documents skipped by the digest filter.",
+    ),
+)
+SPOOL_BYTES = registry.register(
+    Gauge(
+        "etl_spool_bytes",
+        "Bytes of transformed batches spooled on disk and not uploaded yet.",
+    ),
+)
+SPOOL_SEGMENTS = registry.register(
+    Gauge(
+        "etl_spool_segments",
+        "Sealed spool segments waiting for upload.",
+    ),
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Измеряет длительность блока как стадии ETL.
+
+    :param stage: название стадии
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - started, stage=stage)
+
+
+def timed_iter(stage: str, iterable: Iterable) -> Iterator:
+    """
+    Измеряет время получения элементов потока как стадию ETL, не считая
+    времени, которое элементы обрабатывает потребитель потока.
+
+    :param stage: название стадии
+    :param iterable: поток
+    :yield: элементы потока
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        STAGE_DURATION.observe(elapsed, stage=stage)
+
+
+def observe_checkpoint(table_name: str, modified: str | datetime) -> None:
+    """
+    Запоминает modified последней загруженной записи таблицы для
+    расчёта задержки репликации.
+
+    :param table_name: название таблицы
+    :param modified: modified записи, datetime или строка в ISO-формате
+    """
+    if isinstance(modified, str):
+        modified = datetime.fromisoformat(modified)
+    if modified.tzinfo is None:
+        modified = modified.replace(tzinfo=UTC)
+    REPLICATION_LAG.set(modified.timestamp(), table=table_name)
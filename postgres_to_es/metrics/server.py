@@ -0,0 +1,62 @@
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics.base import Registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    server: "MetricsServer"
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        body = self.server.registry.render().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        """Не пишет каждый сбор метрик в stderr."""
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """HTTP-сервер, отдающий метрики на /metrics."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, registry: Registry) -> None:
+        super().__init__((host, port), MetricsHandler)
+        self.registry = registry
+
+
+@contextmanager
+def serve_metrics(
+    host: str, port: int, registry: Registry,
+) -> Iterator[MetricsServer]:
+    """
+    Запускает эндпоинт метрик в фоновом потоке.
+
+    :param host: адрес, на котором принимаются запросы
+    :param port: порт эндпоинта
+    :param registry: отдаваемые метрики
+    :yield: запущенный сервер
+    """
+    server = MetricsServer(host, port, registry)
+    thread = threading.Thread(
+        target=server.serve_forever, name="metrics", daemon=True,
+    )
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -3,8 +3,10 @@ from dataclasses import dataclass, field
 from typing import Literal
 
 
-@dataclass
+@dataclass(slots=True)
 class FilmWork:
+    """Строка фильма, соединённая с одной персоной и одним жанром."""
+
     fw_id: uuid
     title: str
     description: str
@@ -13,3 +15,39 @@ class FilmWork:
     name: str
     role: Literal["actor", "director", "writer"]
     rating: float = field(default=0.0)
+    version: int = field(default=0)
+
+
+@dataclass(slots=True)
+class FilmWorkDocument:
+    """Фильм с уже агрегированными в PostgreSQL персонами и жанрами."""
+
+    fw_id: uuid
+    title: str
+    description: str
+    persons: list[dict[str, str]]
+    genres: list[str]
+    rating: float = field(default=0.0)
+    version: int = field(default=0)
+
+
+@dataclass(slots=True)
+class PersonRole:
+    """
+    Участие персоны в фильме, затронутом изменением персоны.
+    Для режиссёра directors - текущие имена всех режиссёров фильма.
+    """
+
+    fw_id: uuid
+    id: uuid
+    full_name: str
+    role: Literal["actor", "director", "writer"]
+    directors: list[str]
+
+
+@dataclass(slots=True)
+class FilmWorkGenres:
+    """Названия всех жанров фильма, затронутого изменением жанра."""
+
+    fw_id: uuid
+    genres: list[str]
@@ -0,0 +1,238 @@
+import time
+from dataclasses import dataclass, field
+from itertools import count, cycle
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any
+
+from etl import ETL
+from extract.extractor import Checkpoint
+from logger import logger
+from models import FilmWork, FilmWorkDocument
+from transform.transformer import DataTransfromer
+
+
+@dataclass
+class Batch:
+    """
+    Часть фильмов, затронутых батчем изменений таблицы, проходящая
+    через стадии конвейера. Позицию таблицы несёт только последняя часть
+    батча изменений.
+    """
+
+    seq: int
+    table_name: str
+    checkpoint: Checkpoint | None
+    data: list[FilmWork | FilmWorkDocument] | list[dict] = field(repr=False)
+
+
+class PipelineETL(ETL):
+    """
+    ETL, в котором извлечение, трансформация и загрузка выполняются
+    одновременно в отдельных потоках, связанных ограниченными очередями.
+
+    Извлечение выполняется одним потоком, так как батчи таблицы читаются
+    последовательно от позиции предыдущего батча. Трансформация и загрузка
+    могут выполняться несколькими потоками. Фильмы, затронутые батчем
+    изменений, идут по конвейеру частями не больше merge_batch_size.
+    Стейт таблиц обновляется строго в порядке извлечения частей и только
+    после подтверждения загрузки в ES всех частей батча, поэтому после
+    перезапуска загрузка продолжается с последнего полностью
+    загруженного батча. Части могут загружаться в ES не в порядке
+    извлечения, но более старый снимок фильма не перезаписывает более
+    свежий: документы индексируются с внешней версией снимка (см.
+    DataTransfromer._format_data).
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        queue_size: int = 4,
+        transform_workers: int = 1,
+        upload_workers: int = 2,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.transform_queue: Queue[Batch] = Queue(maxsize=queue_size)
+        self.upload_queue: Queue[Batch] = Queue(maxsize=queue_size)
+        self.ack_queue: Queue[Batch] = Queue()
+        self.transform_workers = transform_workers
+        self.upload_workers = upload_workers
+        self.stop_event = Event()
+        self.errors: list[BaseException] = []
+
+    def __call__(self, sleep_time: int):
+        threads = [
+            Thread(
+                target=self._run_stage,
+                args=(self._extract_stage, sleep_time),
+                name="extract",
+                daemon=True,
+            ),
+            *(
+                Thread(
+                    target=self._run_stage,
+                    args=(
+                        self._transform_stage,
+                        DataTransfromer(self.data_transformer.encode),
+                    ),
+                    name=f"transform-{number}",
+                    daemon=True,
+                )
+                for number in range(self.transform_workers)
+            ),
+            *(
+                Thread(
+                    target=self._run_stage,
+                    args=(self._upload_stage,),
+                    name=f"upload-{number}",
+                    daemon=True,
+                )
+                for number in range(self.upload_workers)
+            ),
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(
+            "Pipeline started: %s transform and %s upload workers.",
+            self.transform_workers,
+            self.upload_workers,
+        )
+
+        try:
+            self._commit_stage()
+        finally:
+            self.stop_event.set()
+
+    def _run_stage(self, stage: Any, *args: Any) -> None:
+        """
+        Выполняет стадию конвейера и останавливает весь конвейер,
+        если стадия завершилась с ошибкой.
+
+        :param stage: функция стадии
+        """
+        try:
+            stage(*args)
+        except Exception as error:  # noqa: BLE001
+            logger.exception("Pipeline stage failed.")
+            self.errors.append(error)
+            self.stop_event.set()
+
+    def _put(self, queue: Queue, batch: Batch) -> None:
+        """
+        Кладёт батч в ограниченную очередь, ожидая освобождения места,
+        пока конвейер не остановлен.
+
+        :param queue: очередь следующей стадии
+        :param batch: батч
+        """
+        while not self.stop_event.is_set():
+            try:
+                queue.put(batch, timeout=1)
+                return
+            except Full:
+                continue
+
+    def _get(self, queue: Queue) -> Batch | None:
+        """
+        Забирает батч из очереди, пока конвейер не остановлен.
+
+        :param queue: очередь стадии
+        :return: батч или None, если конвейер остановлен
+        """
+        while not self.stop_event.is_set():
+            try:
+                return queue.get(timeout=1)
+            except Empty:
+                continue
+        return None
+
+    def _extract_stage(self, sleep_time: int) -> None:
+        """
+        Извлекает батчи из таблиц по очереди и передаёт их на трансформацию.
+
+        Если ни в одной таблице не нашлось изменений, засыпает
+        на sleep_time секунд.
+
+        :param sleep_time: время ожидания новых изменений
+        """
+        seq = count()
+        empty_tables = 0
+        for table_name in cycle(self.table_names):
+            if self.stop_event.is_set():
+                return
+            try:
+                filmworks_ids = self.pg_extractor.extract_filmworks_ids(
+                    table_name,
+                )
+            except EOFError:
+                empty_tables += 1
+                if empty_tables >= len(self.table_names):
+                    empty_tables = 0
+                    time.sleep(sleep_time)
+                continue
+
+            empty_tables = 0
+            checkpoint = self.pg_extractor.advance(table_name)
+            parts = [
+                filmworks_ids[start:start + self.merge_batch_size]
+                for start in range(
+                    0, len(filmworks_ids), self.merge_batch_size,
+                )
+            ] or [[]]
+            for number, part in enumerate(parts, start=1):
+                batch = Batch(
+                    next(seq),
+                    table_name,
+                    checkpoint if number == len(parts) else None,
+                    list(self.pg_extractor.extract_filmworks(part))
+                    if part
+                    else [],
+                )
+                logger.info(
+                    "Batch %s extracted from %s.", batch.seq, table_name,
+                )
+                self._put(self.transform_queue, batch)
+
+    def _transform_stage(self, transformer: DataTransfromer) -> None:
+        """
+        Трансформирует извлечённые батчи и передаёт их на загрузку.
+
+        :param transformer: собственный трансформер потока
+        """
+        while batch := self._get(self.transform_queue):
+            batch.data = self._transform(transformer, batch.data)
+            self._put(self.upload_queue, batch)
+
+    def _upload_stage(self) -> None:
+        """Загружает батчи в ES и подтверждает их загрузку."""
+        while batch := self._get(self.upload_queue):
+            self.es_uploader.insert_data(batch.data, self.index)
+            batch.data = []
+            self.ack_queue.put(batch)
+
+    def _commit_stage(self) -> None:
+        """
+        Обновляет стейт таблиц по подтверждённым батчам строго в порядке
+        их извлечения.
+        """
+        pending: dict[int, Batch] = {}
+        next_seq = 0
+        while batch := self._get(self.ack_queue):
+            pending[batch.seq] = batch
+            while next_seq in pending:
+                batch = pending.pop(next_seq)
+                next_seq += 1
+                if batch.checkpoint is None:
+                    continue
+                self.pg_extractor.update_state(
+                    batch.table_name, batch.checkpoint,
+                )
+                logger.info(
+                    "State for table %s updated by batch %s",
+                    batch.table_name,
+                    batch.seq,
+                )
+
+        if self.errors:
+            raise self.errors[0]
@@ -0,0 +1,153 @@
+import json
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from elasticsearch import Elasticsearch
+from psycopg2.extensions import connection as _connection
+
+from etl import ETL
+from extract.base import BaseExtractor
+from extract.extractor import MIN_UUID
+from extract.sql_queries import FILMWORK_IDS_PAGE_SQL
+from logger import logger
+
+
+class Reindexer(ETL):
+    """
+    Полная переиндексация фильмов в новый индекс с переключением алиаса.
+
+    Новый индекс создаётся по схеме с отключённым refresh и без реплик,
+    фильмы загружаются в него постранично по id (keyset-пагинация),
+    после чего настройки индекса восстанавливаются, сегменты сливаются,
+    а алиас атомарно переключается на новый индекс. Стейт таблиц
+    выставляется в позиции (modified, id), снятые до начала переиндексации,
+    и инкрементальная загрузка продолжается с них. Новый индекс пуст,
+    поэтому документы загружаются без отсева по дайджестам, а дайджесты
+    только обновляются.
+
+    Переиндексация не согласуется с инкрементальной загрузкой, поэтому
+    процессы run на её время должны быть остановлены: иначе изменения,
+    загруженные ими в старый индекс, теряются при переключении алиаса,
+    а их стейт перезаписывается позициями, снятыми до переиндексации.
+    """
+
+    def __init__(
+        self,
+        pg_connection: _connection,
+        es_connection: Elasticsearch,
+        table_names: list[str],
+        batch_size: int,
+        index: str,
+        schema_path: Path,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            pg_connection,
+            es_connection,
+            table_names,
+            batch_size,
+            index,
+            **kwargs,
+        )
+        self.es_connection = es_connection
+        self.es_uploader.skip_unchanged = False
+        self.alias = index
+        self.batch_size = batch_size
+        self.schema = json.loads(schema_path.read_text())
+        self.pager = BaseExtractor(
+            pg_connection,
+            FILMWORK_IDS_PAGE_SQL,
+            "filmwork_ids_page",
+            ("uuid", "integer"),
+        )
+
+    def __call__(self):
+        high_water_marks = {
+            table_name: self.pg_extractor.high_water_mark(table_name)
+            for table_name in self.table_names
+        }
+        self.index = f"{self.alias}_{datetime.now(UTC):%Y%m%d%H%M%S}"
+        self._create_index()
+
+        last_id = MIN_UUID
+        total = 0
+        while page := self.pager.extract(last_id, self.batch_size):
+            filmworks_ids = [row["id"] for row in page]
+            self._load_filmworks(filmworks_ids)
+            last_id = filmworks_ids[-1]
+            total += len(filmworks_ids)
+            logger.info("%s films loaded to index %s", total, self.index)
+
+        self._finalize_index()
+        self._swap_alias()
+
+        for table_name, checkpoint in high_water_marks.items():
+            self.pg_extractor.update_state(table_name, checkpoint)
+        logger.info(
+            "Reindex to %s completed, state set to %s",
+            self.index,
+            high_water_marks,
+        )
+
+    def _create_index(self) -> None:
+        """
+        Создаёт новый индекс по схеме с настройками для массовой загрузки.
+        """
+        index_settings = {
+            **self.schema["settings"],
+            "refresh_interval": "-1",
+            "number_of_replicas": 0,
+        }
+        self.es_connection.indices.create(
+            index=self.index,
+            settings=index_settings,
+            mappings=self.schema["mappings"],
+        )
+        logger.info("Index %s created", self.index)
+
+    def _finalize_index(self) -> None:
+        """
+        Восстанавливает настройки индекса из схемы и сливает сегменты.
+        """
+        self.es_connection.indices.put_settings(
+            index=self.index,
+            settings={
+                "refresh_interval": self.schema["settings"].get(
+                    "refresh_interval", "1s",
+                ),
+                "number_of_replicas": self.schema["settings"].get(
+                    "number_of_replicas", 1,
+                ),
+            },
+        )
+        self.es_connection.indices.refresh(index=self.index)
+        self.es_connection.indices.forcemerge(
+            index=self.index, max_num_segments=1,
+        )
+        logger.info("Index %s settings restored and merged", self.index)
+
+    def _swap_alias(self) -> None:
+        """
+        Атомарно переключает алиас на новый индекс и удаляет индексы,
+        на которые он указывал раньше.
+
+        Если вместо алиаса существует одноимённый индекс (созданный
+        до перехода на алиасы), он удаляется в том же запросе.
+        """
+        actions: list[dict] = [
+            {"add": {"index": self.index, "alias": self.alias}},
+        ]
+        if self.es_connection.indices.exists_alias(name=self.alias):
+            old_indices = self.es_connection.indices.get_alias(
+                name=self.alias,
+            )
+            actions.extend(
+                {"remove_index": {"index": old_index}}
+                for old_index in old_indices
+            )
+        elif self.es_connection.indices.exists(index=self.alias):
+            actions.append({"remove_index": {"index": self.alias}})
+
+        self.es_connection.indices.update_aliases(actions=actions)
+        logger.info("Alias %s switched to %s", self.alias, self.index)
@@ -0,0 +1,118 @@
+from threading import Event, Thread
+from typing import Any
+
+from elasticsearch import Elasticsearch
+from psycopg2.extensions import connection as _connection
+
+from etl import ETL
+from logger import logger
+
+
+class TableWorker(ETL):
+    """
+    ETL одной таблицы, работающий в собственном потоке
+    со своим соединением с PostgreSQL.
+
+    Пока в таблице есть необработанные изменения, следующий батч
+    извлекается сразу. Если изменений нет, воркер засыпает, увеличивая
+    время ожидания вдвое после каждой пустой проверки - от min_sleep_time
+    до sleep_time.
+    """
+
+    def __call__(
+        self, sleep_time: float, min_sleep_time: float, stop_event: Event,
+    ):
+        table_name = self.table_names[0]
+        idle_sleep_time = min_sleep_time
+        while not stop_event.is_set():
+            try:
+                self._load(table_name)
+            except EOFError:
+                stop_event.wait(idle_sleep_time)
+                idle_sleep_time = min(idle_sleep_time * 2, sleep_time)
+                continue
+
+            self.pg_extractor.update_state(
+                table_name, self.pg_extractor.advance(table_name),
+            )
+            logger.info("State for table %s updated", table_name)
+            idle_sleep_time = min_sleep_time
+
+
+class ParallelETL:
+    """
+    Запускает независимый воркер для каждой таблицы, чтобы поток изменений
+    одной таблицы не задерживал загрузку изменений других.
+
+    Воркеры используют общий стейт (переданный или созданный первым
+    воркером), а стейт каждой таблицы обновляется только её воркером.
+    """
+
+    def __init__(
+        self,
+        pg_connections: list[_connection],
+        es_connection: Elasticsearch,
+        table_names: list[str],
+        *args: Any,
+        min_sleep_time: float = 0.1,
+        **kwargs: Any,
+    ) -> None:
+        self.workers = []
+        state = kwargs.pop("state", None)
+        for pg_connection, table_name in zip(
+            pg_connections, table_names, strict=True,
+        ):
+            worker = TableWorker(
+                pg_connection,
+                es_connection,
+                [table_name],
+                *args,
+                state=state,
+                **kwargs,
+            )
+            state = worker.pg_extractor.state
+            self.workers.append(worker)
+
+        self.min_sleep_time = min_sleep_time
+        self.stop_event = Event()
+        self.errors: list[Exception] = []
+
+    def __call__(self, sleep_time: int):
+        threads = [
+            Thread(
+                target=self._run_worker,
+                args=(worker, sleep_time),
+                name=f"worker-{worker.table_names[0]}",
+                daemon=True,
+            )
+            for worker in self.workers
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info("Started %s table workers.", len(threads))
+
+        try:
+            for thread in threads:
+                thread.join()
+        finally:
+            self.stop_event.set()
+
+        if self.errors:
+            raise self.errors[0]
+
+    def _run_worker(self, worker: TableWorker, sleep_time: int) -> None:
+        """
+        Выполняет воркер таблицы и останавливает остальные воркеры,
+        если он завершился с ошибкой.
+
+        :param worker: воркер таблицы
+        :param sleep_time: максимальное время ожидания новых изменений
+        """
+        try:
+            worker(sleep_time, self.min_sleep_time, self.stop_event)
+        except Exception as error:  # noqa: BLE001
+            logger.exception(
+                "Worker for table %s failed.", worker.table_names[0],
+            )
+            self.errors.append(error)
+            self.stop_event.set()
@@ -1,3 +1,8 @@
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Literal
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -7,18 +12,149 @@ class Settings(BaseSettings):
     postgres_db: str 
     postgres_host: str
     postgres_port: str
+    postgres_pool_size: int = 4
+    postgres_health_check_interval: float = 30.0
 
-    redis_port: str
-    redis_host: str
-    redis_password: str
+    redis_port: str = "6379"
+    redis_host: str = "localhost"
+    redis_password: str = ""
 
     elastic_host: str
     elastic_port: str
     elastic_index: str
+    elastic_connections_per_node: int = 10
+    elastic_request_timeout: float = 30.0
+    elastic_max_retries: int = 3
+    elastic_http_compress: bool = False
+    elastic_schema_path: Path = (
+        Path(__file__).resolve().parent.parent / "etc" / "es" / "es_schema.json"
+    )
 
     table_names: list
     batch_size: int
     loop_sleep_time: int
+    reindex_batch_size: int = 1000
+    merge_batch_size: int = 500
+    partial_updates: bool = False
+    min_sleep_time: float = 0.1
+    adaptive_batch: bool = False
+    adaptive_target_latency: float = 1.0
+    adaptive_target_bytes: int = 5 * 1024 * 1024
+    adaptive_min_batch_size: int = 10
+    adaptive_max_batch_size: int = 5000
+    adaptive_min_chunk_size: int = 50
+    adaptive_max_chunk_size: int = 5000
+
+    run_mode: Literal[
+        "sequential", "pipeline", "parallel", "coalesce", "changefeed",
+        "async", "sharded", "spool",
+    ] = "sequential"
+    pipeline_queue_size: int = 4
+    pipeline_transform_workers: int = 1
+    pipeline_upload_workers: int = 2
+    coalesce_window_time: float = 1.0
+    coalesce_window_size: int = 1000
+    change_source: Literal["notify", "wal2json"] = "notify"
+    async_concurrency: int = 8
+    async_filmworks_batch_size: int = 100
+    replication_slot: str = "etl_slot"
+    shard_count: int = 4
+    shard_lease_ttl: float = 30.0
+    shard_worker_id: str = ""
+    spool_path: Path = Path(__file__).resolve().parent / "spool"
+    spool_segment_bytes: int = 64 * 1024 * 1024
+    spool_max_bytes: int = 1024 * 1024 * 1024
+    spool_fsync: bool = True
+    spool_segment_seconds: float = 60.0
+
+    extract_engine: Literal["join", "aggregate", "cached"] = "join"
+    extract_stream: bool = False
+    extract_itersize: int = 1000
+    dimension_cache_max_bytes: int = 16 * 1024 * 1024
+
+    upload_mode: Literal["bulk", "streaming", "parallel"] = "bulk"
+    bulk_chunk_size: int = 500
+    bulk_max_chunk_bytes: int = 100 * 1024 * 1024
+    bulk_max_retries: int = 3
+    upload_threads: int = 4
+    elastic_refresh: Literal["true", "false", "wait_for"] = "false"
+
+    state_storage: Literal["redis", "redis_hash", "file", "sqlite"] = (
+        "redis_hash"
+    )
+    state_file_path: Path = Path(__file__).resolve().parent / "state.json"
+    state_sqlite_path: Path = (
+        Path(__file__).resolve().parent / "state.sqlite3"
+    )
+    state_commit_interval: float = 1.0
+
+    digest_storage: Literal["none", "file", "redis"] = "none"
+    digest_path: Path = Path(__file__).resolve().parent / "digests.log"
+
+    metrics_port: int = 0
+    metrics_host: str = "127.0.0.1"
+    metrics_backlog_limit: int = 100_000
+
+    @model_validator(mode="after")
+    def check_run_mode(self) -> "Settings":
+        # Частичное обновление не проверяет версию документа, поэтому
+        # безопасно только при последовательной загрузке таблиц.
+        if self.partial_updates and self.run_mode != "sequential":
+            raise ValueError(
+                "PARTIAL_UPDATES is only supported with RUN_MODE=sequential",
+            )
+        if self.run_mode == "async" and not all(
+            find_spec(name) for name in ("asyncpg", "aiohttp")
+        ):
+            raise ValueError(
+                "RUN_MODE=async requires the async extra: "
+                "poetry install --extras async",
+            )
+        # Аренды единиц работы поддерживает только хранилище redis_hash.
+        if self.run_mode == "sharded" and self.state_storage != "redis_hash":
+            raise ValueError(
+                "RUN_MODE=sharded requires STATE_STORAGE=redis_hash",
+            )
+        # Кеш имён живёт в процессе и вытесняется только изменениями,
+        # извлечёнными этим же процессом; асинхронный ETL его не использует.
+        if self.extract_engine == "cached" and self.run_mode in (
+            "async", "sharded",
+        ):
+            raise ValueError(
+                f"EXTRACT_ENGINE=cached is not supported with "
+                f"RUN_MODE={self.run_mode}",
+            )
+        # Иначе место в журнале может закончиться раньше, чем закроется
+        # первый сегмент.
+        if self.spool_segment_bytes >= self.spool_max_bytes:
+            raise ValueError(
+                "SPOOL_SEGMENT_BYTES must be less than SPOOL_MAX_BYTES",
+            )
+        return self
+
+    @property
+    def postgres_dsn(self) -> dict:
+        return {
+            "dbname": self.postgres_db,
+            "user": self.postgres_user,
+            "password": self.postgres_password,
+            "host": self.postgres_host,
+            "port": self.postgres_port,
+        }
+
+    @property
+    def elastic_url(self) -> str:
+        return f"http://{self.elastic_host}:{self.elastic_port}"
+
+    @property
+    def elastic_options(self) -> dict:
+        return {
+            "connections_per_node": self.elastic_connections_per_node,
+            "request_timeout": self.elastic_request_timeout,
+            "max_retries": self.elastic_max_retries,
+            "retry_on_timeout": True,
+            "http_compress": self.elastic_http_compress,
+        }
 
     class Config:
         env_file = ".env"
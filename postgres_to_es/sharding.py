@@ -0,0 +1,266 @@
+import math
+import os
+import socket
+import time
+import zlib
+from dataclasses import dataclass
+from threading import Event, Thread
+from typing import Any
+
+from elasticsearch import Elasticsearch
+
+from extract.shard import Shard
+from logger import logger
+from scheduler import TableWorker
+from state.base import NamespacedState, State
+from state.storage import LeaseStorage
+from utils.managers import PooledConnection, PostgresPool
+
+
+@dataclass
+class Unit:
+    """Таблица в шарде, загружаемая воркером этого процесса."""
+
+    table_name: str
+    shard: Shard
+    worker: TableWorker
+    connection: PooledConnection
+    stop_event: Event
+    thread: Thread
+
+
+class ShardedETL:
+    """
+    ETL, который делит загрузку между несколькими процессами, возможно,
+    на разных узлах.
+
+    Фильмы делятся на shard_count шардов по диапазонам хешей id (см.
+    Shard). Единица работы - таблица в шарде: её загружает TableWorker,
+    который извлекает только фильмы шарда и хранит стейт под префиксом
+    шарда. Процессы договариваются о единицах работы через аренды
+    в хранилище стейта (см. LeaseStorage): каждый процесс продлевает
+    аренду своих единиц и собственную аренду-пульс каждые lease_ttl / 3
+    секунд и держит не больше своей доли единиц - ceil(единиц / живых
+    процессов).
+
+    Когда процесс умирает, его аренды истекают через lease_ttl,
+    и единицы забирают остальные процессы. Когда процесс добавляется,
+    остальные отдают единицы сверх новой доли: воркер единицы
+    доделывает текущий батч, сохраняет стейт и только после этого
+    аренда освобождается.
+
+    При изменении shard_count шарды получают новые префиксы стейта,
+    и их фильмы загружаются заново с начала таблиц.
+    """
+
+    def __init__(
+        self,
+        pg_pool: PostgresPool,
+        es_connection: Elasticsearch,
+        table_names: list[str],
+        batch_size: int,
+        index: str,
+        state: State,
+        shard_count: int = 4,
+        lease_ttl: float = 30.0,
+        worker_id: str = "",
+        min_sleep_time: float = 0.1,
+        **kwargs: Any,
+    ) -> None:
+        if not isinstance(state.storage, LeaseStorage):
+            raise TypeError(
+                f"Sharded ETL requires a state storage with leases, "
+                f"got {type(state.storage).__name__}",
+            )
+        self.pg_pool = pg_pool
+        self.es_connection = es_connection
+        self.batch_size = batch_size
+        self.index = index
+        self.state = state
+        self.lease_ttl = lease_ttl
+        self.min_sleep_time = min_sleep_time
+        self.kwargs = kwargs
+        self.owner = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+        units = [
+            (table_name, Shard(number, shard_count))
+            for number in range(shard_count)
+            for table_name in table_names
+        ]
+        offset = zlib.crc32(self.owner.encode()) % len(units)
+        self.units = units[offset:] + units[:offset]
+        self.running: dict[str, Unit] = {}
+        self.errors: list[Exception] = []
+
+    def __call__(self, sleep_time: int):
+        logger.info("Sharded ETL worker %s started.", self.owner)
+        try:
+            while not self.errors:
+                self._rebalance(sleep_time)
+                time.sleep(self.lease_ttl / 3)
+        finally:
+            self._stop()
+
+        raise self.errors[0]
+
+    def _rebalance(self, sleep_time: int) -> None:
+        """
+        Продлевает аренды, отдаёт единицы сверх доли процесса и берёт
+        свободные, если доля не набрана.
+
+        :param sleep_time: максимальное время ожидания новых изменений
+        """
+        storage = self.state.storage
+        storage.acquire_lease(
+            f"worker:{self.owner}", self.owner, self.lease_ttl,
+        )
+        workers = len(storage.retrieve_leases("worker:")) or 1
+        fair_share = math.ceil(len(self.units) / workers)
+
+        active = self._renew()
+        self._hand_over(active[fair_share:])
+        self._acquire(active[:fair_share], fair_share, sleep_time)
+
+    def _renew(self) -> list[Unit]:
+        """
+        Освобождает остановленные единицы, продлевает аренды остальных
+        и останавливает воркеры единиц, аренда которых потеряна.
+
+        :return: единицы, воркеры которых продолжают работу
+        """
+        active = []
+        for name, unit in list(self.running.items()):
+            if unit.stop_event.is_set() and not unit.thread.is_alive():
+                self._release(name, unit)
+            elif not self.state.storage.acquire_lease(
+                name, self.owner, self.lease_ttl,
+            ):
+                if not unit.stop_event.is_set():
+                    logger.warning("Lease %s lost, stopping its worker.", name)
+                    unit.stop_event.set()
+            elif not unit.stop_event.is_set():
+                active.append(unit)
+        return active
+
+    @staticmethod
+    def _hand_over(units: list[Unit]) -> None:
+        """
+        Останавливает воркеры единиц сверх доли процесса. Аренды
+        освобождаются после того, как воркеры доделают текущий батч.
+
+        :param units: единицы сверх доли процесса
+        """
+        for unit in units:
+            logger.info(
+                "Handing over %s of %s to rebalance.",
+                unit.table_name,
+                unit.shard.name,
+            )
+            unit.stop_event.set()
+
+    def _acquire(
+        self, active: list[Unit], fair_share: int, sleep_time: int,
+    ) -> None:
+        """
+        Берёт свободные единицы, пока доля процесса не набрана.
+
+        :param active: работающие единицы процесса в пределах доли
+        :param fair_share: доля процесса
+        :param sleep_time: максимальное время ожидания новых изменений
+        """
+        taken = len(active)
+        if taken >= fair_share:
+            return
+
+        storage = self.state.storage
+        leases = storage.retrieve_leases("unit:")
+        for table_name, shard in self.units:
+            name = self._lease_name(table_name, shard)
+            if name in leases or name in self.running:
+                continue
+            if storage.acquire_lease(name, self.owner, self.lease_ttl):
+                self._start(name, table_name, shard, sleep_time)
+                taken += 1
+                if taken >= fair_share:
+                    return
+
+    def _start(
+        self, name: str, table_name: str, shard: Shard, sleep_time: int,
+    ) -> None:
+        """
+        Запускает воркер таблицы в шарде в отдельном потоке.
+
+        :param name: имя аренды единицы работы
+        :param table_name: название таблицы
+        :param shard: шард
+        :param sleep_time: максимальное время ожидания новых изменений
+        """
+        connection = self.pg_pool.connection()
+        worker = TableWorker(
+            connection,
+            self.es_connection,
+            [table_name],
+            self.batch_size,
+            self.index,
+            state=NamespacedState(self.state, f"{shard.name}:"),
+            shard=shard,
+            **self.kwargs,
+        )
+        stop_event = Event()
+        thread = Thread(
+            target=self._run_worker,
+            args=(name, worker, sleep_time, stop_event),
+            name=f"worker-{shard.name}-{table_name}",
+            daemon=True,
+        )
+        self.running[name] = Unit(
+            table_name, shard, worker, connection, stop_event, thread,
+        )
+        thread.start()
+        logger.info("Took %s of %s.", table_name, shard.name)
+
+    def _run_worker(
+        self,
+        name: str,
+        worker: TableWorker,
+        sleep_time: int,
+        stop_event: Event,
+    ) -> None:
+        """
+        Выполняет воркер единицы работы и останавливает процесс, если он
+        завершился с ошибкой.
+
+        :param name: имя аренды единицы работы
+        :param worker: воркер таблицы в шарде
+        :param sleep_time: максимальное время ожидания новых изменений
+        :param stop_event: событие остановки воркера
+        """
+        try:
+            worker(sleep_time, self.min_sleep_time, stop_event)
+        except Exception as error:  # noqa: BLE001
+            logger.exception("Worker for %s failed.", name)
+            self.errors.append(error)
+
+    def _release(self, name: str, unit: Unit) -> None:
+        """
+        Освобождает аренду остановленного воркера и его соединение.
+
+        :param name: имя аренды единицы работы
+        :param unit: единица работы
+        """
+        self.pg_pool.release(unit.connection)
+        self.state.storage.release_lease(name, self.owner)
+        del self.running[name]
+
+    def _stop(self) -> None:
+        """Останавливает все воркеры процесса и освобождает аренды."""
+        for unit in self.running.values():
+            unit.stop_event.set()
+        for name, unit in list(self.running.items()):
+            unit.thread.join()
+            self._release(name, unit)
+        self.state.storage.release_lease(f"worker:{self.owner}", self.owner)
+
+    @staticmethod
+    def _lease_name(table_name: str, shard: Shard) -> str:
+        return f"unit:{shard.name}:{table_name}"
@@ -0,0 +1,28 @@
+import abc
+
+Changes = dict[str, set[str]]
+
+LINK_TABLES = ("person_film_work", "genre_film_work")
+
+
+class BaseChangeSource(abc.ABC):
+    """Абстрактный источник изменений таблиц PostgreSQL.
+
+    Возвращает id изменённых записей по таблицам film_work, person
+    и genre. Изменения таблиц связей приходят как изменения фильмов,
+    с которыми связана запись.
+    """
+
+    @abc.abstractmethod
+    def poll(self, timeout: float) -> Changes:
+        """Дождаться изменений и вернуть все накопившиеся.
+
+        Если за timeout секунд изменений не было, возвращается
+        пустой словарь.
+        """
+
+    def ack(self) -> None:  # noqa: B027
+        """Подтвердить, что возвращённые изменения загружены в ES."""
+
+    def close(self) -> None:  # noqa: B027
+        """Освободить ресурсы источника."""
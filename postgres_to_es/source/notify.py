@@ -0,0 +1,45 @@
+import json
+import select
+from collections import defaultdict
+
+from psycopg2.extensions import connection as _connection
+
+from source.base import BaseChangeSource, Changes
+
+NOTIFY_CHANNEL = "content_changes"
+
+
+class NotifySource(BaseChangeSource):
+    """Источник изменений, получающий уведомления LISTEN/NOTIFY.
+
+    Уведомления отправляют триггеры из etc/db/notify.sql: в каждом
+    уведомлении JSON с таблицей и id изменённой записи, для таблиц
+    связей - с id фильма. Уведомления доставляются только подключённым
+    слушателям, поэтому изменения, сделанные пока ETL не работал,
+    должны забираться отдельным сканированием (см. ChangeFeedETL).
+
+    :param connection: отдельное соединение, которое переводится
+    в режим autocommit и используется только для прослушивания
+    """
+
+    def __init__(
+        self, connection: _connection, channel: str = NOTIFY_CHANNEL,
+    ) -> None:
+        self.connection = connection
+        self.connection.autocommit = True
+        with self.connection.cursor() as curs:
+            curs.execute(f"LISTEN {channel};")
+
+    def poll(self, timeout: float) -> Changes:
+        """Дождаться уведомлений и вернуть все накопившиеся."""
+        self.connection.poll()
+        if not self.connection.notifies:
+            select.select([self.connection], [], [], timeout)
+            self.connection.poll()
+
+        changes: Changes = defaultdict(set)
+        while self.connection.notifies:
+            notify = self.connection.notifies.pop(0)
+            payload = json.loads(notify.payload)
+            changes[payload["table"]].add(payload["id"])
+        return changes
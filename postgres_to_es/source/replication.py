@@ -0,0 +1,92 @@
+import json
+import select
+from collections import defaultdict
+
+import psycopg2
+from psycopg2.errors import DuplicateObject
+from psycopg2.extras import LogicalReplicationConnection
+
+from logger import logger
+from source.base import LINK_TABLES, BaseChangeSource, Changes
+
+TABLES = ("film_work", "person", "genre", *LINK_TABLES)
+
+
+class Wal2JsonSource(BaseChangeSource):
+    """Источник изменений, читающий логическую репликацию через wal2json.
+
+    Изменения читаются из слота репликации, поэтому не теряются, пока
+    ETL не работает: позиция слота сдвигается только подтверждением
+    (см. ack) после загрузки изменений в ES.
+
+    Требует wal_level=logical, установленного плагина wal2json и
+    REPLICA IDENTITY FULL для таблиц связей (etc/db/replication.sql),
+    чтобы при удалении связи был известен id фильма.
+
+    :param dsn: данные для подключения к PostgreSQL
+    :param slot_name: название слота репликации, создаётся при отсутствии
+    """
+
+    def __init__(self, dsn: dict, slot_name: str = "etl_slot") -> None:
+        self.connection = psycopg2.connect(
+            **dsn, connection_factory=LogicalReplicationConnection,
+        )
+        self.cursor = self.connection.cursor()
+        try:
+            self.cursor.create_replication_slot(
+                slot_name, output_plugin="wal2json",
+            )
+            logger.info("Replication slot %s created", slot_name)
+        except DuplicateObject:
+            pass
+        self.cursor.start_replication(
+            slot_name=slot_name,
+            decode=True,
+            options={
+                "format-version": "2",
+                "add-tables": ",".join(f"content.{table}" for table in TABLES),
+            },
+        )
+        self.lsn = None
+
+    def poll(self, timeout: float) -> Changes:
+        """Дождаться изменений и вернуть все прочитанные из слота."""
+        message = self.cursor.read_message()
+        if message is None:
+            select.select([self.cursor], [], [], timeout)
+            message = self.cursor.read_message()
+
+        changes: Changes = defaultdict(set)
+        while message is not None:
+            self._collect(json.loads(message.payload), changes)
+            self.lsn = message.data_start
+            message = self.cursor.read_message()
+        return changes
+
+    def ack(self) -> None:
+        """Сдвинуть позицию слота на последнее прочитанное изменение."""
+        if self.lsn is not None:
+            self.cursor.send_feedback(flush_lsn=self.lsn)
+
+    def close(self) -> None:
+        """Закрыть соединение репликации."""
+        self.connection.close()
+
+    @staticmethod
+    def _collect(change: dict, changes: Changes) -> None:
+        """
+        Добавляет id из изменения wal2json к изменениям таблиц.
+
+        :param change: изменение в формате wal2json версии 2
+        :param changes: накопленные изменения таблиц
+        """
+        if change["action"] not in ("I", "U", "D"):
+            return
+        for columns in (change.get("columns"), change.get("identity")):
+            if not columns:
+                continue
+            row = {column["name"]: column["value"] for column in columns}
+            if change["table"] in LINK_TABLES:
+                changes["film_work"].add(row["film_work_id"])
+            else:
+                changes[change["table"]].add(row["id"])
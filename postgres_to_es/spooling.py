@@ -0,0 +1,161 @@
+import json
+import time
+from itertools import cycle
+from pathlib import Path
+from threading import Event, Thread
+from typing import Any
+
+from etl import ETL
+from logger import logger
+from transform.serializer import dumps
+from transform.transformer import DataTransfromer
+from upload.spool import Spool, SpoolRecord
+
+
+class SpoolingETL(ETL):
+    """
+    ETL, который пишет трансформированные батчи в локальный журнал
+    (см. Spool), а загружает их в ES отдельным потоком.
+
+    Пока ES недоступен или медленно отвечает, извлечение продолжается,
+    и батчи копятся на диске до spool max_bytes. Поток выгрузки
+    загружает закрытые сегменты журнала по порядку, как только ES
+    снова отвечает, и только после загрузки всего сегмента обновляет
+    стейт таблиц позициями из его записей и удаляет сегмент.
+
+    После перезапуска сначала выгружаются оставшиеся сегменты,
+    а извлечение продолжается с последних позиций, записанных в журнал,
+    а не со стейта, чтобы не извлекать те же изменения повторно.
+    """
+
+    def __init__(self, *args: Any, spool: Spool, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.spool = spool
+        self.spool_transformer = DataTransfromer(encode=True)
+        self.stop_event = Event()
+        self.errors: list[BaseException] = []
+
+    def __call__(self, sleep_time: int):
+        positions = self.spool.checkpoints()
+        self.pg_extractor.positions.update(positions)
+        if positions:
+            logger.info("Extraction resumed from spooled %s.", positions)
+
+        thread = Thread(target=self._drain_stage, name="drain", daemon=True)
+        thread.start()
+        try:
+            self._spool_stage(sleep_time)
+        finally:
+            self.stop_event.set()
+            self.spool.close()
+
+        raise self.errors[0]
+
+    def _spool_stage(self, sleep_time: int) -> None:
+        """
+        Извлекает и трансформирует батчи таблиц по очереди и дописывает
+        их в журнал частями не больше merge_batch_size фильмов.
+
+        Если ни в одной таблице не нашлось изменений, закрывает текущий
+        сегмент журнала, чтобы он был выгружен, и засыпает
+        на sleep_time секунд.
+
+        :param sleep_time: время ожидания новых изменений
+        """
+        empty_tables = 0
+        for table_name in cycle(self.table_names):
+            if self.errors:
+                return
+            try:
+                filmworks_ids = self.pg_extractor.extract_filmworks_ids(
+                    table_name,
+                )
+            except EOFError:
+                empty_tables += 1
+                if empty_tables >= len(self.table_names):
+                    empty_tables = 0
+                    self.spool.seal()
+                    time.sleep(sleep_time)
+                continue
+
+            empty_tables = 0
+            checkpoint = self.pg_extractor.advance(table_name)
+            parts = [
+                filmworks_ids[start:start + self.merge_batch_size]
+                for start in range(
+                    0, len(filmworks_ids), self.merge_batch_size,
+                )
+            ] or [[]]
+            for number, part in enumerate(parts, start=1):
+                lines = []
+                if part:
+                    lines = self._transform(
+                        self.spool_transformer,
+                        self.pg_extractor.extract_filmworks(part),
+                    )
+                record = SpoolRecord(
+                    table_name,
+                    checkpoint if number == len(parts) else None,
+                    [
+                        line if isinstance(line, bytes) else dumps(line)
+                        for line in lines
+                    ],
+                )
+                if not self.spool.append(record, self.stop_event):
+                    return
+            logger.info("Batch of %s spooled.", table_name)
+
+    def _drain_stage(self) -> None:
+        """
+        Загружает закрытые сегменты журнала в ES и обновляет стейт таблиц
+        после загрузки каждого сегмента.
+
+        Ошибка выгрузки останавливает ETL.
+        """
+        try:
+            while not self.stop_event.is_set():
+                segment = self.spool.next_segment(timeout=1)
+                if segment is not None:
+                    self._drain_segment(segment)
+        except Exception as error:  # noqa: BLE001
+            logger.exception("Spool upload failed.")
+            self.errors.append(error)
+            self.stop_event.set()
+
+    def _drain_segment(self, segment: Path) -> None:
+        """
+        Загружает записи сегмента в ES, обновляет стейт таблиц
+        их последними позициями и удаляет сегмент.
+
+        :param segment: путь к закрытому сегменту
+        """
+        checkpoints = {}
+        for record in self.spool.read(segment):
+            if record.lines:
+                self.es_uploader.insert_data(
+                    self._decode(record.lines), self.index,
+                )
+            if record.checkpoint is not None:
+                checkpoints[record.table_name] = record.checkpoint
+
+        for table_name, checkpoint in checkpoints.items():
+            self.pg_extractor.update_state(table_name, checkpoint)
+        self.spool.acknowledge(segment)
+        logger.info(
+            "Spool segment %s uploaded, state updated for %s.",
+            segment.name,
+            list(checkpoints),
+        )
+
+    def _decode(self, lines: list[bytes]) -> list[dict | bytes]:
+        """
+        Подготавливает строки журнала к загрузке: строки NDJSON
+        отправляются как есть, если загрузчик их принимает (см.
+        DataTransfromer.encode), иначе декодируются в словари.
+
+        :param lines: строки NDJSON-тела bulk-запроса
+        :return: данные для загрузки в ES
+        """
+        if self.data_transformer.encode:
+            return lines
+        return [json.loads(line) for line in lines]
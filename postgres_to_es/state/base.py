@@ -1,21 +1,86 @@
+import json
+from threading import Lock
 from typing import Any
 
-from state.storage import BaseStorage
+from state.storage import BaseStorage, DateTimeEncoder
 
 
 class State:
-    """Класс для работы с состояниями."""
+    """Класс для работы с состояниями.
+
+    Запись защищена блокировкой от потоков одного процесса, так как
+    хранилище может перезаписывать состояние целиком.
+
+    Записанные этим процессом значения кешируются (write-through),
+    поэтому повторное чтение своих ключей не обращается к хранилищу.
+    Значения в кеше хранятся в том виде, в котором их вернёт хранилище
+    (например, datetime - строкой в ISO-формате).
+    """
 
     def __init__(self, storage: BaseStorage) -> None:
         self.storage = storage
+        self.lock = Lock()
+        self.cache: dict[str, Any] = {}
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа."""
-        state = self.storage.retrieve_state()
-        state.update({key:value})
-        self.storage.save_state(state)
+        self.set_states({key: value})
+
+    def set_states(self, values: dict[str, Any]) -> None:
+        """Установить состояния нескольких ключей одной записью."""
+        with self.lock:
+            self.storage.save_keys(values)
+            self.cache.update(
+                json.loads(json.dumps(values, cls=DateTimeEncoder)),
+            )
+
+    def set_defaults(self, values: dict[str, Any]) -> None:
+        """Установить состояния ключей, для которых оно ещё не задано."""
+        states = self.get_states(list(values))
+        missing = {
+            key: value for key, value in values.items() if not states[key]
+        }
+        if missing:
+            self.set_states(missing)
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу."""
-        state = self.storage.retrieve_state()
-        return state.get(key)
+        return self.get_states([key])[key]
+
+    def get_states(self, keys: list[str]) -> dict[str, Any]:
+        """Получить состояния нескольких ключей одним чтением."""
+        with self.lock:
+            values = {
+                key: self.cache[key] for key in keys if key in self.cache
+            }
+        missing = [key for key in keys if key not in values]
+        if missing:
+            values.update(self.storage.retrieve_keys(missing))
+        return {key: values[key] for key in keys}
+
+
+class NamespacedState(State):
+    """Стейт, ключи которого хранятся под префиксом в хранилище
+    родительского стейта.
+
+    Блокировка общая с родительским стейтом, а кеш собственный, поэтому
+    новый экземпляр читает ключи из хранилища, даже если их менял
+    другой процесс.
+    """
+
+    def __init__(self, parent: State, prefix: str) -> None:
+        self.storage = parent.storage
+        self.lock = parent.lock
+        self.cache: dict[str, Any] = {}
+        self.prefix = prefix
+
+    def set_states(self, values: dict[str, Any]) -> None:
+        """Установить состояния нескольких ключей одной записью."""
+        super().set_states(
+            {self.prefix + key: value for key, value in values.items()},
+        )
+
+    def get_states(self, keys: list[str]) -> dict[str, Any]:
+        """Получить состояния нескольких ключей одним чтением."""
+        values = super().get_states([self.prefix + key for key in keys])
+        return {key: values[self.prefix + key] for key in keys}
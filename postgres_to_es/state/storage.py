@@ -1,9 +1,17 @@
 import abc
 import json
+import os
+import sqlite3
+import time
 from datetime import datetime
-from typing import Any, Dict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List
 
 from redis import Redis
+from redis.client import Pipeline
+
+from settings import settings
 
 
 class BaseStorage(abc.ABC):
@@ -23,6 +31,49 @@ class BaseStorage(abc.ABC):
     def retrieve_state(self) -> Dict[str, Any]:
         """Получить состояние из хранилища."""
 
+    def save_keys(self, values: Dict[str, Any]) -> None:
+        """Сохранить значения нескольких ключей одной записью.
+
+        По умолчанию состояние читается и перезаписывается целиком,
+        хранилища с доступом к отдельным ключам переопределяют метод.
+        """
+        state = self.retrieve_state()
+        state.update(values)
+        self.save_state(state)
+
+    def retrieve_keys(self, keys: List[str]) -> Dict[str, Any]:
+        """Получить значения нескольких ключей из хранилища."""
+        state = self.retrieve_state()
+        return {key: state.get(key) for key in keys}
+
+    def close(self) -> None:  # noqa: B027
+        """Записать отложенные изменения и освободить ресурсы."""
+
+
+class LeaseStorage(abc.ABC):
+    """Хранилище, поддерживающее аренды.
+
+    Аренды нужны для согласованной работы нескольких процессов,
+    поэтому их поддерживают только общие хранилища.
+    """
+
+    @abc.abstractmethod
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Взять аренду или продлить свою на ttl секунд.
+
+        Аренду, взятую другим владельцем, можно получить только после
+        истечения её срока.
+        """
+
+    @abc.abstractmethod
+    def release_lease(self, name: str, owner: str) -> None:
+        """Освободить аренду, если она принадлежит владельцу."""
+
+    @abc.abstractmethod
+    def retrieve_leases(self, prefix: str) -> Dict[str, str]:
+        """Получить действующие аренды с именем, начинающимся
+        с префикса, и их владельцев."""
+
 
 class DateTimeEncoder(json.JSONEncoder):
 
@@ -53,3 +104,298 @@ class RedisStorage(BaseStorage):
         if isinstance(obj, datetime):
             return obj.isoformat()
         return obj
+
+
+class RedisHashStorage(BaseStorage, LeaseStorage):
+    """Реализация хранилища, хранящего каждый ключ состояния
+    в отдельном поле хеша Redis.
+
+    Ключи читаются и записываются по отдельности (HMGET/HSET), без
+    чтения и перезаписи всего состояния, поэтому воркеры, обновляющие
+    разные ключи, не затирают изменения друг друга. Значения нескольких
+    ключей записываются одной командой HSET, то есть атомарно.
+
+    Аренды хранятся отдельными ключами со сроком жизни и берутся
+    оптимистичной транзакцией (WATCH/MULTI), поэтому одну аренду
+    не могут одновременно получить два процесса.
+    """
+
+    def __init__(
+        self,
+        redis_adapter: Redis,
+        key: str = "etl_state",
+        legacy_key: str = "etl_data",
+    ):
+        self.redis_adapter = redis_adapter
+        self.key = key
+        self._migrate(legacy_key)
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        pipeline = self.redis_adapter.pipeline(transaction=True)
+        pipeline.delete(self.key)
+        if state:
+            pipeline.hset(self.key, mapping=self._dump(state))
+        pipeline.execute()
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        return {
+            key: json.loads(value)
+            for key, value in self.redis_adapter.hgetall(self.key).items()
+        }
+
+    def save_keys(self, values: Dict[str, Any]) -> None:
+        """Сохранить значения нескольких ключей одной командой HSET."""
+        if values:
+            self.redis_adapter.hset(self.key, mapping=self._dump(values))
+
+    def retrieve_keys(self, keys: List[str]) -> Dict[str, Any]:
+        """Получить значения нескольких ключей одной командой HMGET."""
+        if not keys:
+            return {}
+        values = self.redis_adapter.hmget(self.key, keys)
+        return {
+            key: json.loads(value) if value is not None else None
+            for key, value in zip(keys, values, strict=True)
+        }
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Взять аренду или продлить свою на ttl секунд."""
+        key = self._lease_key(name)
+
+        def acquire(pipeline: Pipeline) -> bool:
+            if pipeline.get(key) not in (None, owner):
+                return False
+            pipeline.multi()
+            pipeline.set(key, owner, px=int(ttl * 1000))
+            return True
+
+        return self.redis_adapter.transaction(
+            acquire, key, value_from_callable=True,
+        )
+
+    def release_lease(self, name: str, owner: str) -> None:
+        """Освободить аренду, если она принадлежит владельцу."""
+        key = self._lease_key(name)
+
+        def release(pipeline: Pipeline) -> None:
+            if pipeline.get(key) == owner:
+                pipeline.multi()
+                pipeline.delete(key)
+
+        self.redis_adapter.transaction(release, key)
+
+    def retrieve_leases(self, prefix: str) -> Dict[str, str]:
+        """Получить действующие аренды с именем, начинающимся
+        с префикса, и их владельцев."""
+        keys = list(
+            self.redis_adapter.scan_iter(match=f"{self._lease_key(prefix)}*"),
+        )
+        if not keys:
+            return {}
+        owners = self.redis_adapter.mget(keys)
+        start = len(self._lease_key(""))
+        return {
+            key[start:]: owner
+            for key, owner in zip(keys, owners, strict=True)
+            if owner is not None
+        }
+
+    def _lease_key(self, name: str) -> str:
+        return f"{self.key}:lease:{name}"
+
+    def _migrate(self, legacy_key: str) -> None:
+        """Переносит состояние, сохранённое RedisStorage одной
+        JSON-строкой, в хеш, если хеш ещё не создан."""
+        if self.redis_adapter.exists(self.key):
+            return
+        json_string = self.redis_adapter.get(legacy_key)
+        if json_string:
+            self.save_state(json.loads(json_string))
+
+    @staticmethod
+    def _dump(values: Dict[str, Any]) -> Dict[str, str]:
+        return {
+            key: json.dumps(value, cls=DateTimeEncoder)
+            for key, value in values.items()
+        }
+
+
+class JsonFileStorage(BaseStorage):
+    """Реализация хранилища, использующего локальный JSON-файл.
+
+    Состояние хранится в памяти, а файл перезаписывается атомарно:
+    через временный файл, fsync и переименование. Записи группируются -
+    файл записывается не чаще раза в commit_interval секунд и при
+    закрытии хранилища. При аварийном завершении теряются только
+    последние позиции, и батчи после них будут загружены повторно.
+    """
+
+    def __init__(self, path: Path, commit_interval: float = 1.0):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.lock = Lock()
+        self.state = (
+            json.loads(path.read_text()) if path.exists() else {}
+        )
+        self.dirty = False
+        self.committed = time.monotonic()
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        with self.lock:
+            self.state = self._normalize(state)
+            self._write()
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        with self.lock:
+            return dict(self.state)
+
+    def save_keys(self, values: Dict[str, Any]) -> None:
+        """Сохранить значения ключей, записав файл, если истёк
+        интервал группировки записей."""
+        with self.lock:
+            self.state.update(self._normalize(values))
+            self.dirty = True
+            if time.monotonic() - self.committed >= self.commit_interval:
+                self._write()
+
+    def retrieve_keys(self, keys: List[str]) -> Dict[str, Any]:
+        """Получить значения нескольких ключей из хранилища."""
+        with self.lock:
+            return {key: self.state.get(key) for key in keys}
+
+    def close(self) -> None:
+        """Записать отложенные изменения в файл."""
+        with self.lock:
+            if self.dirty:
+                self._write()
+
+    def _write(self) -> None:
+        temp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with temp_path.open("w") as file:
+            json.dump(self.state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        temp_path.replace(self.path)
+        directory = os.open(self.path.parent, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.dirty = False
+        self.committed = time.monotonic()
+
+    @staticmethod
+    def _normalize(values: Dict[str, Any]) -> Dict[str, Any]:
+        return json.loads(json.dumps(values, cls=DateTimeEncoder))
+
+
+class SQLiteStorage(BaseStorage):
+    """Реализация хранилища, использующего SQLite в режиме WAL.
+
+    Каждый ключ состояния хранится отдельной строкой. Записи
+    группируются в одну транзакцию, которая фиксируется не чаще раза
+    в commit_interval секунд и при закрытии хранилища. Незафиксированные
+    значения видны этому же процессу, так как он читает через то же
+    соединение.
+    """
+
+    def __init__(self, path: Path, commit_interval: float = 1.0):
+        self.commit_interval = commit_interval
+        self.lock = Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS state "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+        )
+        self.committed = time.monotonic()
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        with self.lock:
+            self._begin()
+            self.connection.execute("DELETE FROM state")
+            self._upsert(state)
+            self._commit()
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        with self.lock:
+            rows = self.connection.execute("SELECT key, value FROM state")
+            return {key: json.loads(value) for key, value in rows}
+
+    def save_keys(self, values: Dict[str, Any]) -> None:
+        """Сохранить значения ключей, зафиксировав транзакцию, если
+        истёк интервал группировки записей."""
+        with self.lock:
+            self._begin()
+            self._upsert(values)
+            if time.monotonic() - self.committed >= self.commit_interval:
+                self._commit()
+
+    def retrieve_keys(self, keys: List[str]) -> Dict[str, Any]:
+        """Получить значения нескольких ключей одним запросом."""
+        if not keys:
+            return {}
+        placeholders = ", ".join("?" * len(keys))
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, value FROM state "  # noqa: S608
+                f"WHERE key IN ({placeholders})",
+                keys,
+            ).fetchall()
+        values = {key: json.loads(value) for key, value in rows}
+        return {key: values.get(key) for key in keys}
+
+    def close(self) -> None:
+        """Зафиксировать отложенные изменения и закрыть соединение."""
+        with self.lock:
+            if self.connection.in_transaction:
+                self._commit()
+            self.connection.close()
+
+    def _begin(self) -> None:
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN")
+
+    def _commit(self) -> None:
+        self.connection.execute("COMMIT")
+        self.committed = time.monotonic()
+
+    def _upsert(self, values: Dict[str, Any]) -> None:
+        self.connection.executemany(
+            "INSERT INTO state (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            [
+                (key, json.dumps(value, cls=DateTimeEncoder))
+                for key, value in values.items()
+            ],
+        )
+
+
+def create_storage() -> BaseStorage:
+    """Создать хранилище состояния, выбранное в настройках."""
+    if settings.state_storage == "file":
+        return JsonFileStorage(
+            settings.state_file_path, settings.state_commit_interval,
+        )
+    if settings.state_storage == "sqlite":
+        return SQLiteStorage(
+            settings.state_sqlite_path, settings.state_commit_interval,
+        )
+
+    redis = Redis(
+        host=settings.redis_host,
+        password=settings.redis_password,
+        decode_responses=True,
+    )
+    if settings.state_storage == "redis_hash":
+        return RedisHashStorage(redis)
+    return RedisStorage(redis)
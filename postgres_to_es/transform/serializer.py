@@ -0,0 +1,25 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Сериализует значение в JSON-строку NDJSON-тела bulk-запроса.
+
+    Если установлен orjson, сериализация выполняется им (UUID, datetime
+    и float он кодирует сам), иначе - стандартным json с приведением
+    неизвестных типов к строке.
+
+    :param value: действие или документ bulk API
+    :return: JSON в байтах без завершающего перевода строки
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(
+        value, default=str, ensure_ascii=False, separators=(",", ":"),
+    ).encode()
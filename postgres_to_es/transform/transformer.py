@@ -1,138 +1,292 @@
-from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from itertools import groupby
+from operator import attrgetter
 
-from models import FilmWork
+from models import FilmWork, FilmWorkDocument, FilmWorkGenres, PersonRole
+from transform.serializer import dumps
+
+PersonInfo = tuple[str, str, str]
+
+RENAME_PERSONS_SCRIPT = """
+boolean changed = false;
+for (String field : ['actors', 'writers']) {
+    List names = new ArrayList();
+    for (Map person : ctx._source[field]) {
+        String name = params.names.get(person.id);
+        if (name != null && name != person.name) {
+            person.name = name;
+            changed = true;
+        }
+        names.add(person.name);
+    }
+    ctx._source[field + '_names'] = names;
+}
+if (
+    params.director != null
+    && !params.directors.contains(ctx._source.director)
+) {
+    ctx._source.director = params.director;
+    changed = true;
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+"""
+
+
+@dataclass(slots=True)
+class FilmWorkAggregate:
+    """
+    Фильм, собранный из строк батча: персоны и жанры без дублей
+    в порядке их появления.
+    """
+
+    fw_id: str
+    title: str
+    description: str
+    rating: float
+    persons: dict[PersonInfo, None] = field(default_factory=dict)
+    genres: dict[str, None] = field(default_factory=dict)
+    version: int = 0
 
 
 class DataTransfromer:
     """
     Класс для трансформации данных в формат,
     необходимый для загрузки в Elasticsearch.
+
+    Трансформер не хранит состояние между вызовами: фильмы собираются
+    в словаре, созданном для одного батча (или одного фильма в потоковом
+    режиме), поэтому уже загруженные фильмы не попадают в следующие
+    батчи, а память не растёт со временем работы процесса.
+
+    Если включено кодирование, вместо словарей выдаются уже
+    сериализованные строки NDJSON-тела bulk-запроса, которые
+    отправляются в ES без повторной сериализации.
     """
 
-    def __init__(self) -> None:
-        self.collector = defaultdict(
-            lambda: {
-                "uuid": None,
-                "title": None,
-                "description": None,
-                "imdb_rate": None,
-                "p_info": set(),
-                "genre_name": set(),
-            },
-        )
+    def __init__(self, encode: bool = False) -> None:
+        self.encode = encode
 
-    def transform(self, filmworks: list[FilmWork]):
+    def transform(
+        self, filmworks: Iterable[FilmWork],
+    ) -> list[dict | bytes]:
         """
         Запускает процесс трансформации данных.
 
         :param filmworks: необходимые для трансформирования данные о фильмах
         :return: подготовленные для загрузки в ES данные о фильмах
         """
-        self._collect_data(filmworks)
-        merged_filmworks = self._merge_data()
-        return self._format_data(merged_filmworks)
+        return list(self._format_data(self._collect_data(filmworks).values()))
 
-    def _collect_data(
-        self,
-        filmworks: list[FilmWork],
-    ):
+    def transform_stream(
+        self, filmworks: Iterable[FilmWork],
+    ) -> Iterator[dict | bytes]:
         """
-        Собирает данные в коллектор класса.
+        Трансформирует поток строк фильмов, не накапливая весь батч.
 
-        :param filmworks: данные о фильмах
+        Строки одного фильма должны идти подряд (запрос упорядочен по id
+        фильма), поэтому одновременно собирается только один фильм.
+
+        :param filmworks: необходимые для трансформирования данные о фильмах
+        :yield: подготовленные для загрузки в ES данные о фильмах
         """
+        for _, filmwork_rows in groupby(filmworks, key=attrgetter("fw_id")):
+            yield from self._format_data(
+                self._collect_data(filmwork_rows).values(),
+            )
 
-        for filmwork in filmworks:
-            uuid = filmwork.fw_id
-            self.collector[uuid]["uuid"] = uuid
-            self.collector[uuid]["title"] = filmwork.title
-            self.collector[uuid]["description"] = filmwork.description
-            self.collector[uuid]["imdb_rate"] = filmwork.rating
-            self.collector[uuid]["p_info"].add(
-                (
-                    filmwork.role,
-                    filmwork.full_name,
-                    filmwork.id,
+    def transform_documents(
+        self, documents: Iterable[FilmWorkDocument],
+    ) -> Iterator[dict | bytes]:
+        """
+        Трансформирует фильмы, уже агрегированные в PostgreSQL.
+
+        Каждый фильм приходит одной строкой без дублей, поэтому
+        сборка строк не нужна.
+
+        :param documents: фильмы с агрегированными персонами и жанрами
+        :yield: подготовленные для загрузки в ES данные о фильмах
+        """
+        yield from self._format_data(
+            FilmWorkAggregate(
+                document.fw_id,
+                document.title,
+                document.description,
+                document.rating,
+                dict.fromkeys(
+                    (person["role"], person["full_name"], person["id"])
+                    for person in document.persons
                 ),
+                dict.fromkeys(document.genres),
+                document.version,
             )
-            self.collector[uuid]["genre_name"].add(filmwork.name)
+            for document in documents
+        )
 
-    def _merge_data(self) -> list[dict[str, None]]:
+    def transform_person_updates(
+        self, roles: Iterable[PersonRole],
+    ) -> Iterator[dict | bytes]:
         """
-        Преобразует собранные в коллектор данные в список.
+        Трансформирует участие изменённых персон в фильмах в частичные
+        обновления документов.
 
-        :param filmworks: данные о фильмах
-        :return: смёрженный список с данными о фильмах
-        """
-        return [
-            {
-                "uuid": filmwork.get("uuid"),
-                "title": filmwork.get("title"),
-                "description": filmwork.get("description"),
-                "imdb_rate": filmwork.get("imdb_rate"),
-                "p_info": tuple(filmwork.get("p_info")),
-                "genre_name": tuple(filmwork.get("genre_name")),
-            }
-            for filmwork in self.collector.values()
-        ]
+        Для каждого фильма выдаётся действие update со скриптом
+        RENAME_PERSONS_SCRIPT, который переписывает имена персон в actors
+        и writers по id и пересобирает actors_names и writers_names.
+        Режиссёр хранится в документе только именем, а при полной
+        трансформации в director попадает первый режиссёр фильма. Поэтому
+        director заменяется именем переименованного режиссёра, только если
+        в документе имя, которого уже нет среди текущих имён режиссёров
+        фильма, то есть старое имя одного из переименованных.
 
-    def _format_data(
-        self, merged_filmworks: list[dict[str, None]],
-    ) -> list[dict[str, None]]:
+        :param roles: участие изменённых персон в фильмах, строки одного
+        фильма идут подряд
+        :yield: пары действие/тело частичного обновления, словарями
+        или строками NDJSON
+        """
+        for fw_id, filmwork_roles in groupby(roles, key=attrgetter("fw_id")):
+            names = {}
+            director = None
+            directors: list[str] = []
+            for role in filmwork_roles:
+                names[str(role.id)] = role.full_name
+                if role.role == "director":
+                    director = role.full_name
+                    directors = role.directors
+            yield from self._format_update(
+                fw_id,
+                {
+                    "script": {
+                        "source": RENAME_PERSONS_SCRIPT,
+                        "lang": "painless",
+                        "params": {
+                            "names": names,
+                            "director": director,
+                            "directors": directors,
+                        },
+                    },
+                },
+            )
+
+    def transform_genre_updates(
+        self, filmworks: Iterable[FilmWorkGenres],
+    ) -> Iterator[dict | bytes]:
         """
-        Трансформирует смёрженные данные в формат,
-        необходимый для загрузки в индекс
+        Трансформирует жанры фильмов в частичные обновления документов,
+        заменяющие только поле genre.
 
-        :param merged_filmworks: смёрженный список с данными о фильмах
-        :return: подготовленные для загрузки в ES данные о фильмах
+        :param filmworks: полные списки жанров затронутых фильмов
+        :yield: пары действие/тело частичного обновления, словарями
+        или строками NDJSON
         """
+        for filmwork in filmworks:
+            yield from self._format_update(
+                filmwork.fw_id, {"doc": {"genre": filmwork.genres}},
+            )
 
-        transformed_data = []
-        for filmwork in merged_filmworks:
-            es_index = {
-                "index": {
-                    "_index": "movies",
-                    "_id": filmwork["uuid"],
-                },
-            }
+    def _format_update(
+        self, fw_id: str, body: dict,
+    ) -> Iterator[dict | bytes]:
+        """
+        Оборачивает тело частичного обновления фильма в пару для bulk API.
 
-            persons_info = {
-                "actor": None,
-                "writer": None,
-            }
-            for role in persons_info:
-                names = [
-                    p_info[1]
-                    for p_info in filmwork.get("p_info")
-                    if p_info[0] == role
-                ]
-                objects = [
-                    {"id": p_info[2], "name": p_info[1]}
-                    for p_info in filmwork["p_info"]
-                    if p_info[0] == role
-                ]
-                persons_info[role] = [names, objects]
-
-            director= next(
-                    (
-                        p_info[1]
-                        for p_info in filmwork["p_info"]
-                        if p_info[0] == "director"
-                    ),
-                    "",
+        :param fw_id: id фильма
+        :param body: тело действия update
+        :yield: действие и тело, словарями или строками NDJSON
+        """
+        action = {"update": {"_id": fw_id}}
+        if self.encode:
+            yield dumps(action)
+            yield dumps(body)
+        else:
+            yield action
+            yield body
+
+    @staticmethod
+    def _collect_data(
+        filmworks: Iterable[FilmWork],
+    ) -> dict[str, FilmWorkAggregate]:
+        """
+        Собирает строки фильмов в фильмы без дублей персон и жанров.
+
+        Строки фильма без персон или жанров (LEFT JOIN) не добавляют
+        пустых персон и жанров.
+
+        :param filmworks: данные о фильмах
+        :return: собранные фильмы по id
+        """
+        collector: dict[str, FilmWorkAggregate] = {}
+        for filmwork in filmworks:
+            aggregate = collector.get(filmwork.fw_id)
+            if aggregate is None:
+                aggregate = collector[filmwork.fw_id] = FilmWorkAggregate(
+                    filmwork.fw_id,
+                    filmwork.title,
+                    filmwork.description,
+                    filmwork.rating,
+                    version=filmwork.version,
                 )
+            if filmwork.role is not None:
+                aggregate.persons[
+                    (filmwork.role, filmwork.full_name, filmwork.id)
+                ] = None
+            if filmwork.name is not None:
+                aggregate.genres[filmwork.name] = None
+        return collector
+
+    def _format_data(
+        self, filmworks: Iterable[FilmWorkAggregate],
+    ) -> Iterator[dict | bytes]:
+        """
+        Трансформирует собранные фильмы в формат,
+        необходимый для загрузки в индекс.
+
+        Персоны фильма раскладываются по ролям за один проход.
+
+        Документ индексируется с внешней версией (version_type
+        external_gte), равной версии снимка фильма из PostgreSQL, поэтому
+        снимок, загруженный в ES позже более свежего (параллельными
+        потоками или процессами), отклоняется с кодом 409, а не
+        перезаписывает документ.
+
+        :param filmworks: собранные фильмы
+        :yield: пары действие/документ для загрузки в ES, словарями
+        или строками NDJSON
+        """
+        for filmwork in filmworks:
+            director = ""
+            actors: list[dict] = []
+            writers: list[dict] = []
+            buckets = {"actor": actors, "writer": writers}
+            for role, full_name, person_id in filmwork.persons:
+                bucket = buckets.get(role)
+                if bucket is not None:
+                    bucket.append({"id": person_id, "name": full_name})
+                elif role == "director" and not director:
+                    director = full_name
 
-            transformed_filmwork = {
-                "id": filmwork["uuid"],
-                "imdb_rating": filmwork["imdb_rate"],
-                "genre": list(filmwork["genre_name"]),
-                "title": filmwork["title"],
-                "description": filmwork["description"],
+            meta = {"_id": filmwork.fw_id}
+            if filmwork.version:
+                meta["version"] = filmwork.version
+                meta["version_type"] = "external_gte"
+            action = {"index": meta}
+            document = {
+                "id": filmwork.fw_id,
+                "imdb_rating": filmwork.rating,
+                "genre": list(filmwork.genres),
+                "title": filmwork.title,
+                "description": filmwork.description,
                 "director": director,
-                "actors_names": persons_info["actor"][0],
-                "writers_names": persons_info["writer"][0],
-                "actors": persons_info["actor"][1],
-                "writers": persons_info["writer"][1],
+                "actors_names": [actor["name"] for actor in actors],
+                "writers_names": [writer["name"] for writer in writers],
+                "actors": actors,
+                "writers": writers,
             }
-            transformed_data.extend([es_index, transformed_filmwork])
-        return transformed_data
+            if self.encode:
+                yield dumps(action)
+                yield dumps(document)
+            else:
+                yield action
+                yield document
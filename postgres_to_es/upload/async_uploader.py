@@ -0,0 +1,77 @@
+import asyncio
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.exceptions import ConnectionError as ESConnectionError
+
+from digest.base import DigestFilter
+from logger import logger
+from metrics.instruments import DOCUMENTS, timed
+from transform.serializer import dumps
+from utils.decorators import async_backoff
+
+CONFLICT = 409
+
+
+class AsyncESUploader:
+    """
+    Асинхронный вариант ESUploader на AsyncElasticsearch.
+
+    Каждый батч отправляется одним bulk-запросом, поэтому медленный
+    запрос задерживает только свой батч. Фильтр дайджестов, если он
+    задан, работает с синхронным хранилищем в отдельном потоке.
+    """
+
+    def __init__(
+        self,
+        connection: AsyncElasticsearch,
+        refresh: str = "false",
+        digest_filter: DigestFilter | None = None,
+    ):
+        self.es_connection = connection
+        self.refresh = refresh
+        self.digest_filter = digest_filter
+
+    @async_backoff((ESConnectionError,))
+    async def insert_data(self, data: list[dict | bytes], index: str) -> None:
+        """
+        Загружает данные в индекс одним bulk-запросом.
+
+        :param data: Пары действие/документ для загрузки в индекс
+        :param index: Название индекса
+        """
+        pending: dict[str, str] = {}
+        if self.digest_filter is not None:
+            data = await asyncio.to_thread(
+                lambda: list(self.digest_filter.filter(data, pending)),
+            )
+        if not data:
+            return
+
+        with timed("bulk"):
+            response = await self.es_connection.bulk(
+                index=index,
+                body=[
+                    line if isinstance(line, bytes) else dumps(line)
+                    for line in data
+                ],
+                refresh=self.refresh,
+            )
+        uploaded = len(response["items"])
+        if response.get("errors"):
+            for item in response["items"]:
+                (result,) = item.values()
+                if "error" not in result:
+                    continue
+                if result["status"] == CONFLICT:
+                    logger.debug(
+                        "Document %s has a newer version in ES, skipped.",
+                        result.get("_id"),
+                    )
+                else:
+                    logger.error("Document was not uploaded to ES: %s", result)
+                pending.pop(str(result.get("_id")), None)
+                uploaded -= 1
+        DOCUMENTS.inc(uploaded)
+
+        if self.digest_filter is not None:
+            await asyncio.to_thread(self.digest_filter.commit, pending)
@@ -0,0 +1,247 @@
+import json
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Condition, Event
+
+from extract.extractor import Checkpoint
+from logger import logger
+from metrics.instruments import SPOOL_BYTES, SPOOL_SEGMENTS
+
+# Длина полезной нагрузки записи и её CRC32.
+HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+
+
+@dataclass
+class SpoolRecord:
+    """
+    Часть трансформированного батча: строки NDJSON-тела bulk-запроса
+    и позиция таблицы, которую несёт последняя часть батча изменений.
+    """
+
+    table_name: str
+    checkpoint: Checkpoint | None
+    lines: list[bytes] = field(repr=False)
+
+    def encode(self) -> bytes:
+        """
+        Кодирует запись: заголовок с длиной и CRC32, строка метаданных
+        в JSON и строки NDJSON через перевод строки.
+
+        :return: запись в байтах
+        """
+        meta = json.dumps(
+            {"table_name": self.table_name, "checkpoint": self.checkpoint},
+        ).encode()
+        payload = b"\n".join([meta, *self.lines])
+        return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @classmethod
+    def decode(cls, payload: bytes) -> "SpoolRecord":
+        """
+        Декодирует полезную нагрузку записи.
+
+        :param payload: полезная нагрузка без заголовка
+        :return: запись
+        """
+        meta, *lines = payload.split(b"\n")
+        meta = json.loads(meta)
+        checkpoint = meta["checkpoint"]
+        return cls(
+            meta["table_name"],
+            tuple(checkpoint) if checkpoint is not None else None,
+            lines,
+        )
+
+
+class Spool:
+    """
+    Локальный журнал трансформированных батчей между трансформацией
+    и загрузкой в ES.
+
+    Записи дописываются в конец текущего сегмента - файла в каталоге
+    path. Когда сегмент превышает segment_bytes, открыт дольше
+    segment_seconds или извлечение простаивает (см. seal), сегмент
+    закрывается и становится доступен для выгрузки. Выгруженный в ES
+    сегмент удаляется (см. acknowledge). Если сегменты занимают больше
+    max_bytes, append закрывает текущий сегмент и ждёт, пока сегменты
+    не будут выгружены.
+
+    При запуске все сегменты в каталоге считаются закрытыми. Запись,
+    оборванная падением процесса, отбрасывается при чтении по длине
+    и CRC32.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+        fsync: bool = True,
+        segment_seconds: float = 60.0,
+    ) -> None:
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.segment_seconds = segment_seconds
+        self.fsync = fsync
+        self.condition = Condition()
+        path.mkdir(parents=True, exist_ok=True)
+
+        self.sealed: deque[Path] = deque(
+            sorted(path.glob(f"*{SEGMENT_SUFFIX}")),
+        )
+        self.size = sum(segment.stat().st_size for segment in self.sealed)
+        self.number = int(self.sealed[-1].stem) if self.sealed else 0
+        self.active = None
+        self.active_size = 0
+        self.active_opened = 0.0
+        self._observe()
+
+    def append(self, record: SpoolRecord, stop_event: Event) -> bool:
+        """
+        Дописывает запись в текущий сегмент. Если сегменты занимают
+        больше max_bytes, закрывает текущий сегмент, чтобы его можно было
+        выгрузить, и ждёт освобождения места.
+
+        :param record: запись
+        :param stop_event: событие остановки, прерывающее ожидание
+        :return: False, если ожидание прервано остановкой
+        """
+        data = record.encode()
+        with self.condition:
+            if self.size >= self.max_bytes:
+                logger.warning(
+                    "Spool is full (%s bytes), waiting for upload.",
+                    self.size,
+                )
+                self._seal()
+            while self.size >= self.max_bytes:
+                if stop_event.is_set():
+                    return False
+                self.condition.wait(timeout=1)
+
+            if self.active is None:
+                self.number += 1
+                self.active = self._segment_path(self.number).open("ab")
+                self.active_size = 0
+                self.active_opened = time.monotonic()
+            self.active.write(data)
+            self.active_size += len(data)
+            self.size += len(data)
+            if self.active_size >= self.segment_bytes or self._expired():
+                self._seal()
+            self._observe()
+        return True
+
+    def seal(self) -> None:
+        """Закрывает текущий сегмент, если в нём есть записи."""
+        with self.condition:
+            self._seal()
+
+    def next_segment(self, timeout: float) -> Path | None:
+        """
+        Ожидает закрытый сегмент. Текущий сегмент, открытый дольше
+        segment_seconds, закрывается, даже если в него давно не писали.
+
+        :param timeout: максимальное время ожидания в секундах
+        :return: самый старый закрытый сегмент или None
+        """
+        with self.condition:
+            if not self.sealed and self._expired():
+                self._seal()
+            if not self.sealed:
+                self.condition.wait(timeout=timeout)
+            return self.sealed[0] if self.sealed else None
+
+    def read(self, segment: Path) -> Iterator[SpoolRecord]:
+        """
+        Читает записи сегмента по порядку.
+
+        :param segment: закрытый сегмент
+        :yield: записи до конца сегмента или до первой повреждённой
+        """
+        with segment.open("rb") as file:
+            while header := file.read(HEADER.size):
+                length = crc = None
+                payload = b""
+                if len(header) == HEADER.size:
+                    length, crc = HEADER.unpack(header)
+                    payload = file.read(length)
+                if len(payload) != length or zlib.crc32(payload) != crc:
+                    logger.warning(
+                        "Spool segment %s is truncated, tail skipped.",
+                        segment.name,
+                    )
+                    return
+                yield SpoolRecord.decode(payload)
+
+    def acknowledge(self, segment: Path) -> None:
+        """
+        Удаляет выгруженный в ES сегмент.
+
+        :param segment: самый старый закрытый сегмент
+        """
+        with self.condition:
+            self.size -= segment.stat().st_size
+            segment.unlink()
+            self.sealed.remove(segment)
+            self._observe()
+            self.condition.notify_all()
+
+    def checkpoints(self) -> dict[str, Checkpoint]:
+        """
+        Находит последние позиции таблиц среди записей закрытых
+        сегментов, ещё не выгруженных в ES.
+
+        :return: позиции по названиям таблиц
+        """
+        checkpoints: dict[str, Checkpoint] = {}
+        for segment in list(self.sealed):
+            for record in self.read(segment):
+                if record.checkpoint is not None:
+                    checkpoints[record.table_name] = record.checkpoint
+        return checkpoints
+
+    def close(self) -> None:
+        """Закрывает текущий сегмент."""
+        self.seal()
+
+    def _seal(self) -> None:
+        """Закрывает текущий сегмент. Вызывается под self.condition."""
+        if self.active is None:
+            return
+        self.active.flush()
+        if self.fsync:
+            os.fsync(self.active.fileno())
+        self.active.close()
+        self.active = None
+        self.sealed.append(self._segment_path(self.number))
+        self._observe()
+        self.condition.notify_all()
+
+    def _expired(self) -> bool:
+        """
+        Проверяет, открыт ли текущий сегмент дольше segment_seconds.
+        Вызывается под self.condition.
+
+        :return: True, если сегмент пора закрыть
+        """
+        return (
+            self.active is not None
+            and time.monotonic() - self.active_opened >= self.segment_seconds
+        )
+
+    def _segment_path(self, number: int) -> Path:
+        return self.path / f"{number:012d}{SEGMENT_SUFFIX}"
+
+    def _observe(self) -> None:
+        """Обновляет метрики размера журнала."""
+        SPOOL_BYTES.set(self.size)
+        SPOOL_SEGMENTS.set(len(self.sealed))
@@ -1,23 +1,403 @@
+import json
+import time
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
 from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import ConnectionError
+from elasticsearch.helpers import parallel_bulk, streaming_bulk
 
+from digest.base import DigestFilter
+from logger import logger
+from metrics.instruments import DOCUMENTS, timed
+from transform.serializer import dumps
 from utils.decorators import backoff
 
+NOT_FOUND = 404
+CONFLICT = 409
+TOO_MANY_REQUESTS = 429
+
 
 class ESUploader:
-    """Класс для загрузки данных в индекс Elasticsearch"""
+    """
+    Класс для загрузки данных в индекс Elasticsearch
+
+    В режиме "bulk" батч отправляется bulk-запросами по chunk_size
+    документов.
+    В режимах "streaming" и "parallel" данные отправляются частями
+    через helpers.streaming_bulk/parallel_bulk с ограничением количества
+    документов и размера запроса, а отклонённые с кодом 429 документы
+    отправляются повторно по одному, без повторной отправки всего батча.
+
+    Если задан фильтр дайджестов, документы, не изменившиеся с последней
+    загрузки, в ES не отправляются.
+
+    В режиме "bulk" без фильтра дайджестов данные могут быть заранее
+    сериализованными строками NDJSON (см. DataTransfromer).
 
-    def __init__(self, connection: Elasticsearch):
+    Размер отправленных тел запросов накапливается в sent_bytes. В режимах
+    "streaming" и "parallel" он оценивается по сериализованным действиям
+    до их передачи в helpers.
+
+    Частичные обновления документов (см. update_data) всегда
+    отправляются bulk-запросами по chunk_size действий.
+
+    Документы, отклонённые с кодом 409 из-за внешней версии (в индексе
+    уже более свежий снимок фильма), не считаются ошибкой загрузки.
+    """
+
+    def __init__(
+        self,
+        connection: Elasticsearch,
+        mode: str = "bulk",
+        chunk_size: int = 500,
+        max_chunk_bytes: int = 100 * 1024 * 1024,
+        thread_count: int = 4,
+        refresh: str = "false",
+        max_retries: int = 3,
+        digest_filter: DigestFilter | None = None,
+    ):
         self.es_connection = connection
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.thread_count = thread_count
+        self.refresh = refresh
+        self.max_retries = max_retries
+        self.digest_filter = digest_filter
+        self.skip_unchanged = True
+        self.sent_bytes = 0
 
-    @backoff((ConnectionError,))
-    def insert_data(self, data: list[dict], index:str) -> None:
+    def insert_data(self, data: list[dict | bytes], index:str) -> None:
         """
         Загружает данные в индекс movies
+
+        Ошибка соединения с ES повторяет только неотправленный
+        bulk-запрос (см. _bulk), а в режимах helpers - загрузку
+        оставшихся данных батча (см. _resend_helper_bulk).
+
         :param data: Данные для загрузки в индекс
         """
-        self.es_connection.bulk(
-            index=index,
-            body=data,
-            refresh=True,
+        pending: dict[str, str] = {}
+        data = list(self._filter(data, pending))
+        if not data:
+            return
+
+        if self.mode == "bulk":
+            for start in range(0, len(data), self.chunk_size * 2):
+                self._bulk(
+                    data[start:start + self.chunk_size * 2], index, pending,
+                )
+        else:
+            self._resend_helper_bulk(data, index, pending)
+        self._commit(pending)
+
+    def update_data(self, data: Iterable[dict | bytes], index: str) -> None:
+        """
+        Отправляет частичные обновления документов bulk-запросами
+        по chunk_size действий.
+
+        Обновления документов, которых ещё нет в индексе, пропускаются:
+        такие фильмы будут загружены целиком вместе с изменениями
+        film_work. Дайджесты обновлённых документов сбрасываются, так как
+        они больше не совпадают с документами в индексе.
+
+        :param data: Пары действие update/тело обновления
+        :param index: Название индекса
+        """
+        data = iter(data)
+        while chunk := list(islice(data, self.chunk_size * 2)):
+            self._bulk(chunk, index, {})
+            if self.digest_filter is not None:
+                self.digest_filter.invalidate(
+                    [self._document_id(action) for action in chunk[::2]],
+                )
+
+    def insert_stream(
+        self, data: Iterable[dict | bytes], index: str,
+    ) -> None:
+        """
+        Загружает поток данных в индекс частями.
+
+        В режиме "bulk" поток делится на части по chunk_size фильмов,
+        в остальных режимах делением на части занимаются helpers
+        Elasticsearch. Ошибка соединения с ES в потоковых режимах
+        пробрасывается наверх, так как уже прочитанную часть потока
+        нельзя отправить повторно.
+
+        :param data: Поток пар действие/документ для загрузки в индекс
+        :param index: Название индекса
+        """
+        pending: dict[str, str] = {}
+        data = self._filter(data, pending)
+        if self.mode != "bulk":
+            self._helper_bulk(data, index, pending)
+        else:
+            data = iter(data)
+            while chunk := list(islice(data, self.chunk_size * 2)):
+                self._bulk(chunk, index, pending)
+        self._commit(pending)
+
+    def _filter(
+        self, data: Iterable[dict], pending: dict[str, str],
+    ) -> Iterable[dict]:
+        """
+        Отсеивает неизменённые документы, если задан фильтр дайджестов.
+
+        :param data: Поток пар действие/документ
+        :param pending: Дайджесты документов, ожидающих загрузки
+        :return: Поток пар действие/документ для загрузки
+        """
+        if self.digest_filter is None:
+            return data
+        return self.digest_filter.filter(data, pending, self.skip_unchanged)
+
+    def _commit(self, pending: dict[str, str]) -> None:
+        """
+        Сохраняет дайджесты загруженных документов.
+
+        :param pending: Дайджесты загруженных документов
+        """
+        if self.digest_filter is None:
+            return
+        self.digest_filter.commit(pending)
+        logger.info(
+            "Unchanged documents skipped: %s, skip ratio %.2f%%",
+            self.digest_filter.stats,
+            self.digest_filter.skip_ratio * 100,
+        )
+
+    def _reject(self, result: dict, pending: dict[str, str]) -> None:
+        """
+        Логирует документ, который не удалось загрузить, и исключает
+        его дайджест из сохраняемых.
+
+        :param result: Результат действия из ответа bulk API
+        :param pending: Дайджесты документов, ожидающих загрузки
+        """
+        logger.error("Document was not uploaded to ES: %s", result)
+        pending.pop(str(result.get("_id")), None)
+
+    def _fail(self, result: dict, pending: dict[str, str]) -> None:
+        """
+        Обрабатывает незагруженный документ: документ, отклонённый
+        из-за того, что в индексе уже более свежая версия, пропускается,
+        остальные логируются как ошибка. Дайджест документа исключается
+        из сохраняемых.
+
+        :param result: Результат действия из ответа bulk API
+        :param pending: Дайджесты документов, ожидающих загрузки
+        """
+        if result.get("status") != CONFLICT:
+            self._reject(result, pending)
+            return
+        logger.debug(
+            "Document %s has a newer version in ES, skipped.",
+            result.get("_id"),
         )
+        pending.pop(str(result.get("_id")), None)
+
+    @backoff((ConnectionError,))
+    def _bulk(
+        self, data: list[dict | bytes], index: str, pending: dict[str, str],
+    ) -> None:
+        """
+        Загружает данные одним bulk-запросом.
+
+        Строки, уже сериализованные трансформером, отправляются как есть,
+        а словари сериализуются здесь же, поэтому клиент ES повторно
+        тело запроса не кодирует.
+
+        :param data: Пары действие/документ для загрузки в индекс
+        :param index: Название индекса
+        :param pending: Дайджесты документов, ожидающих загрузки
+        """
+        body = [
+            line if isinstance(line, bytes) else dumps(line) for line in data
+        ]
+        with timed("bulk"):
+            response = self.es_connection.bulk(
+                index=index, body=body, refresh=self.refresh,
+            )
+        self.sent_bytes += sum(len(line) + 1 for line in body)
+        uploaded = len(response["items"])
+        if response.get("errors"):
+            for item in response["items"]:
+                ((op_type, result),) = item.items()
+                if "error" not in result:
+                    continue
+                uploaded -= 1
+                if op_type == "update" and result["status"] == NOT_FOUND:
+                    logger.debug(
+                        "Document %s is not indexed yet, update skipped.",
+                        result.get("_id"),
+                    )
+                else:
+                    self._fail(result, pending)
+        DOCUMENTS.inc(uploaded)
+
+    @backoff((ConnectionError,))
+    def _resend_helper_bulk(
+        self, data: list[dict], index: str, pending: dict[str, str],
+    ) -> None:
+        """
+        Загружает список данных через helpers, повторяя загрузку при
+        ошибке соединения. Список, в отличие от потока, можно отправить
+        заново; уже загруженные документы перезаписываются той же
+        версией.
+
+        :param data: Пары действие/документ для загрузки в индекс
+        :param index: Название индекса
+        :param pending: Дайджесты документов, ожидающих загрузки
+        """
+        self._helper_bulk(data, index, pending)
+
+    def _helper_bulk(
+        self, data: Iterable[dict], index: str, pending: dict[str, str],
+    ) -> None:
+        """
+        Загружает данные через helpers.streaming_bulk или parallel_bulk.
+
+        :param data: Поток пар действие/документ для загрузки в индекс
+        :param index: Название индекса
+        :param pending: Дайджесты документов, ожидающих загрузки
+        """
+        actions = self._measure(self._actions(data, index))
+        with timed("bulk"):
+            if self.mode == "parallel":
+                self._parallel_bulk(actions, pending)
+                return
+
+            for ok, item in streaming_bulk(
+                self.es_connection,
+                actions,
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=self.max_chunk_bytes,
+                max_retries=self.max_retries,
+                raise_on_error=False,
+                refresh=self.refresh,
+            ):
+                if ok:
+                    DOCUMENTS.inc()
+                else:
+                    (result,) = item.values()
+                    self._fail(result, pending)
+
+    def _parallel_bulk(
+        self, actions: Iterable[dict], pending: dict[str, str],
+    ) -> None:
+        """
+        Загружает действия через helpers.parallel_bulk и повторно
+        отправляет документы, отклонённые с кодом 429.
+
+        parallel_bulk сам не повторяет отклонённые документы, поэтому
+        их действия запоминаются до подтверждения загрузки.
+
+        :param actions: Поток действий bulk API
+        :param pending: Дайджесты документов, ожидающих загрузки
+        """
+        sent: dict[str, dict] = {}
+
+        def remember(actions: Iterable[dict]) -> Iterator[dict]:
+            for action in actions:
+                sent[str(action["_id"])] = action
+                yield action
+
+        queue = remember(actions)
+        for attempt in range(self.max_retries + 1):
+            rejected = []
+            for ok, item in parallel_bulk(
+                self.es_connection,
+                queue,
+                thread_count=self.thread_count,
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=self.max_chunk_bytes,
+                raise_on_error=False,
+                refresh=self.refresh,
+            ):
+                (result,) = item.values()
+                action = sent.pop(result["_id"], None)
+                if ok:
+                    DOCUMENTS.inc()
+                elif result.get("status") == TOO_MANY_REQUESTS:
+                    rejected.append(action)
+                else:
+                    self._fail(result, pending)
+
+            if not rejected:
+                return
+            if attempt == self.max_retries:
+                for action in rejected:
+                    pending.pop(str(action["_id"]), None)
+                break
+            logger.warning(
+                "%s documents rejected by ES with 429, retry %s of %s.",
+                len(rejected),
+                attempt + 1,
+                self.max_retries,
+            )
+            time.sleep(min(2 ** attempt, 60))
+            queue = remember(rejected)
+
+        logger.error(
+            "%s documents were not uploaded to ES after all retries.",
+            len(rejected),
+        )
+
+    def _measure(self, actions: Iterable[dict]) -> Iterator[dict]:
+        """
+        Добавляет к sent_bytes размер тела bulk-запроса для каждого
+        действия так же, как его сериализует клиент ES.
+
+        :param actions: Поток действий bulk API
+        :yield: те же действия
+        """
+        for action in actions:
+            meta = {
+                key[1:]: value
+                for key, value in action.items()
+                if key not in ("_op_type", "_source")
+            }
+            self.sent_bytes += (
+                len(dumps({action["_op_type"]: meta}))
+                + len(dumps(action["_source"]))
+                + 2
+            )
+            yield action
+
+    @staticmethod
+    def _document_id(action: dict | bytes) -> str:
+        """
+        Возвращает id документа из действия bulk API.
+
+        :param action: действие словарём или строкой NDJSON
+        :return: id документа
+        """
+        if isinstance(action, bytes):
+            action = json.loads(action)
+        ((_, meta),) = action.items()
+        return str(meta["_id"])
+
+    @staticmethod
+    def _actions(data: Iterable[dict], index: str) -> Iterator[dict]:
+        """
+        Преобразует пары действие/документ в действия для helpers.
+
+        :param data: Поток пар действие/документ
+        :param index: Название индекса
+        :yield: действие bulk API с документом в _source
+        """
+        data = iter(data)
+        for action, document in zip(data, data, strict=True):
+            ((op_type, meta),) = action.items()
+            yield {
+                "_op_type": op_type,
+                "_index": index,
+                "_id": meta["_id"],
+                **{
+                    f"_{key}": meta[key]
+                    for key in ("version", "version_type")
+                    if key in meta
+                },
+                "_source": document,
+            }
@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+
+SMOOTHING = 0.3
+
+
+@dataclass(slots=True)
+class BatchLimits:
+    """Цели и границы адаптивного размера батча."""
+
+    target_latency: float = 1.0
+    target_bytes: int = 5 * 1024 * 1024
+    min_batch_size: int = 10
+    max_batch_size: int = 5000
+    min_chunk_size: int = 50
+    max_chunk_size: int = 5000
+
+
+def clamp(value: float, lower: float, upper: float) -> int:
+    """
+    Ограничивает значение границами и округляет его до целого.
+
+    :param value: значение
+    :param lower: нижняя граница
+    :param upper: верхняя граница
+    :return: целое значение в границах
+    """
+    return int(max(lower, min(value, upper)))
+
+
+class AdaptiveBatchSize:
+    """
+    Размер батча изменений одной таблицы, подстраиваемый под измеренную
+    длительность загрузки батча и размер bulk-запроса.
+
+    Одна изменённая персона может затронуть сотни фильмов, а изменённый
+    фильм - только себя, поэтому стоимость батча считается на фильм,
+    а размер батча в записях таблицы получается делением целевого
+    количества фильмов на наблюдаемый коэффициент размножения (фильмов
+    на запись). Целевое количество фильмов - наименьшее из укладывающихся
+    в target_latency и в target_bytes. Оценки сглаживаются
+    экспоненциальным средним, а размер батча меняется не больше чем
+    вдвое за раз, чтобы единичный медленный батч не обрушил размер.
+
+    Размер части bulk-запроса (в фильмах) подбирается так, чтобы запрос
+    был не больше target_bytes.
+    """
+
+    def __init__(
+        self, batch_size: int, chunk_size: int, limits: BatchLimits,
+    ) -> None:
+        self.limits = limits
+        self.batch_size = clamp(
+            batch_size, limits.min_batch_size, limits.max_batch_size,
+        )
+        self.chunk_size = clamp(
+            chunk_size, limits.min_chunk_size, limits.max_chunk_size,
+        )
+        self.fanout: float | None = None
+        self.seconds_per_filmwork: float | None = None
+        self.bytes_per_filmwork: float | None = None
+
+    def update(
+        self, rows: int, filmworks: int, seconds: float, payload_bytes: int,
+    ) -> None:
+        """
+        Учитывает загруженный батч и пересчитывает размеры.
+
+        :param rows: количество изменённых записей таблицы в батче
+        :param filmworks: количество затронутых ими фильмов
+        :param seconds: длительность извлечения, трансформации и загрузки
+        :param payload_bytes: размер отправленных в ES данных, 0 - если
+        неизвестен
+        """
+        if not rows:
+            return
+        self.fanout = self._smooth(self.fanout, filmworks / rows)
+        if filmworks:
+            self.seconds_per_filmwork = self._smooth(
+                self.seconds_per_filmwork, seconds / filmworks,
+            )
+            if payload_bytes:
+                self.bytes_per_filmwork = self._smooth(
+                    self.bytes_per_filmwork, payload_bytes / filmworks,
+                )
+
+        limits = self.limits
+        target_filmworks = float(limits.max_batch_size) * max(
+            self.fanout, 1,
+        )
+        if self.seconds_per_filmwork:
+            target_filmworks = min(
+                target_filmworks,
+                limits.target_latency / self.seconds_per_filmwork,
+            )
+        if self.bytes_per_filmwork:
+            target_filmworks = min(
+                target_filmworks,
+                limits.target_bytes / self.bytes_per_filmwork,
+            )
+            self.chunk_size = clamp(
+                limits.target_bytes / self.bytes_per_filmwork,
+                limits.min_chunk_size,
+                limits.max_chunk_size,
+            )
+
+        target_rows = (
+            target_filmworks / self.fanout
+            if self.fanout
+            else limits.max_batch_size
+        )
+        self.batch_size = clamp(
+            clamp(target_rows, self.batch_size / 2, self.batch_size * 2),
+            limits.min_batch_size,
+            limits.max_batch_size,
+        )
+
+    @staticmethod
+    def _smooth(previous: float | None, value: float) -> float:
+        """
+        Сглаживает оценку экспоненциальным средним.
+
+        :param previous: предыдущая оценка или None
+        :param value: новое наблюдение
+        :return: новая оценка
+        """
+        if previous is None:
+            return value
+        return previous + SMOOTHING * (value - previous)
@@ -1,8 +1,10 @@
+import asyncio
 import time
 from functools import wraps
 from typing import Any, Callable
 
 from logger import logger
+from metrics.instruments import RETRIES
 
 
 def backoff(
@@ -16,6 +18,9 @@ def backoff(
     Использует наивный экспоненциальный рост времени повтора (factor)
     до граничного времени ожидания (border_sleep_time)
 
+    Каждый повтор учитывается в метрике etl_retries_total с именем
+    функции и типом исключения.
+
     Формула:
         t = start_sleep_time * (factor ** n), если t < border_sleep_time
         t = border_sleep_time, иначе
@@ -31,8 +36,12 @@ def backoff(
             while True:
                 try:
                     return func(*args, **kwargs)
-                except exceptions:
+                except exceptions as error:
                     logger.exception("Execution problem found.")
+                    RETRIES.inc(
+                        function=func.__qualname__,
+                        exception=type(error).__name__,
+                    )
                 sleep_time = start_sleep_time * (factor ** tries)
                 time.sleep(
                     sleep_time
@@ -43,3 +52,43 @@ def backoff(
 
         return inner
     return func_wrapper
+
+
+def async_backoff(
+    exceptions: tuple[Any],
+    start_sleep_time: float=0.1,
+    factor: int=2,
+    border_sleep_time: int=10,
+):
+    """
+    Асинхронный вариант backoff для корутин: ожидание перед повтором
+    не блокирует цикл событий.
+
+    :param start_sleep_time: начальное время ожидания
+    :param factor: во сколько раз нужно увеличивать время ожидания на каждой итерации
+    :param border_sleep_time: максимальное время ожидания
+    :return: результат выполнения корутины
+    """  # noqa: E501
+    def func_wrapper(func: Callable):
+        @wraps(func)
+        async def inner(*args: Any, **kwargs: Any):
+            tries = 0
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except exceptions as error:
+                    logger.exception("Execution problem found.")
+                    RETRIES.inc(
+                        function=func.__qualname__,
+                        exception=type(error).__name__,
+                    )
+                sleep_time = start_sleep_time * (factor ** tries)
+                await asyncio.sleep(
+                    sleep_time
+                    if sleep_time < border_sleep_time
+                    else border_sleep_time,
+                )
+                tries += 1
+
+        return inner
+    return func_wrapper
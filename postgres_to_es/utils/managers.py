@@ -1,7 +1,17 @@
+import time
 from contextlib import contextmanager
+from typing import Any
 
 import psycopg2
+from psycopg2.extensions import (
+    TRANSACTION_STATUS_IDLE,
+    TRANSACTION_STATUS_INERROR,
+    TRANSACTION_STATUS_INTRANS,
+)
+from psycopg2.extensions import connection as _connection
+from psycopg2.extensions import cursor as _cursor
 from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
 from logger import logger
 
@@ -21,3 +31,146 @@ def open_postgres_db(dsn: dict):
         logger.info("PostgreSQL closing connection")
         conn.commit()
         conn.close()
+
+
+class PooledConnection:
+    """Соединение с PostgreSQL, взятое из пула и заменяемое при поломке.
+
+    Соединение закрепляется за владельцем (воркером) до его закрытия,
+    чтобы подготовленные запросы и серверные курсоры жили в одном
+    соединении. Перед выдачей курсора соединение проверяется:
+    - разорванное соединение (psycopg2 помечает его closed после ошибки)
+      возвращается в пул на закрытие и заменяется новым;
+    - прерванная ошибкой транзакция откатывается;
+    - соединение, простаивавшее дольше health_check_interval,
+      проверяется запросом SELECT 1, в том числе внутри транзакции,
+      которую ETL оставляет открытой после чтения.
+    Поэтому повтор операции через backoff выполняется уже на рабочем
+    соединении.
+
+    Остальные атрибуты делегируются текущему соединению.
+    """
+
+    def __init__(
+        self, pool: ThreadedConnectionPool, health_check_interval: float,
+    ):
+        self.pool = pool
+        self.health_check_interval = health_check_interval
+        self.connection = None
+        self.used = 0.0
+
+    def cursor(self, *args: Any, **kwargs: Any) -> _cursor:
+        """Проверяет соединение и возвращает его курсор."""
+        return self.acquire().cursor(*args, **kwargs)
+
+    def acquire(self) -> _connection:
+        """
+        Возвращает рабочее соединение, при необходимости заменяя его.
+
+        :return: соединение psycopg2
+        """
+        if self.connection is not None and not self._is_healthy():
+            logger.warning("PostgreSQL connection is broken, reconnecting")
+            self.pool.putconn(self.connection, close=True)
+            self.connection = None
+        if self.connection is None:
+            self.connection = self.pool.getconn()
+        self.used = time.monotonic()
+        return self.connection
+
+    def close(self) -> None:
+        """Фиксирует транзакцию и возвращает соединение в пул."""
+        if self.connection is None:
+            return
+        try:
+            self.connection.commit()
+        except psycopg2.Error:
+            self.pool.putconn(self.connection, close=True)
+        else:
+            self.pool.putconn(self.connection)
+        self.connection = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.acquire(), name)
+
+    def _is_healthy(self) -> bool:
+        if self.connection.closed:
+            return False
+        status = self.connection.info.transaction_status
+        if status == TRANSACTION_STATUS_INERROR:
+            self.connection.rollback()
+        if (
+            status in (TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS)
+            and time.monotonic() - self.used > self.health_check_interval
+        ):
+            try:
+                with self.connection.cursor() as curs:
+                    curs.execute("SELECT 1")
+            except psycopg2.Error:
+                return False
+        return True
+
+
+class PostgresPool:
+    """Пул соединений с PostgreSQL, общий для воркеров процесса.
+
+    :param dsn: Данные, необходимые для подключения.
+    :param maxconn: максимальное количество соединений
+    :param health_check_interval: время простоя соединения в секундах,
+    после которого оно проверяется перед использованием
+    """
+
+    def __init__(
+        self, dsn: dict, maxconn: int, health_check_interval: float = 30.0,
+    ):
+        self.pool = ThreadedConnectionPool(
+            0, maxconn, **dsn, cursor_factory=DictCursor,
+        )
+        self.health_check_interval = health_check_interval
+        self.connections: list[PooledConnection] = []
+
+    def connection(self) -> PooledConnection:
+        """
+        Возвращает новое закрепляемое за владельцем соединение.
+
+        :return: соединение из пула
+        """
+        connection = PooledConnection(self.pool, self.health_check_interval)
+        self.connections.append(connection)
+        return connection
+
+    def release(self, connection: PooledConnection) -> None:
+        """
+        Возвращает соединение владельца, закончившего работу, в пул.
+
+        :param connection: соединение, выданное методом connection
+        """
+        connection.close()
+        self.connections.remove(connection)
+
+    def close(self) -> None:
+        """Возвращает соединения в пул и закрывает их."""
+        for connection in self.connections:
+            connection.close()
+        self.pool.closeall()
+
+
+@contextmanager
+def open_postgres_pool(
+    dsn: dict, maxconn: int, health_check_interval: float = 30.0,
+):
+    """Контекст-менеджер для пула соединений с базой данных PostgreSQL.
+
+    :param dsn: Данные, необходимые для подключения.
+    :param maxconn: максимальное количество соединений
+    :param health_check_interval: время простоя соединения в секундах,
+    после которого оно проверяется перед использованием
+    :yield: пул соединений
+    """
+    pool = PostgresPool(dsn, maxconn, health_check_interval)
+    try:
+        logger.info("PostgreSQL creating connection pool")
+        yield pool
+    finally:
+        logger.info("PostgreSQL closing connection pool")
+        pool.close()